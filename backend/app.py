@@ -1,22 +1,46 @@
 # app.py (cleaned, deduped) - Appointments start as PENDING
 import os
+import time
 import datetime
 import json
+import hmac
 import base64
+import queue
+import sqlite3
 import traceback
-from functools import wraps
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps, partial
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, has_request_context, g, stream_with_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
-from sqlalchemy import text
+from sqlalchemy import text, event, Insert, Update, Delete
+from sqlalchemy.orm import object_session
+from sqlalchemy.exc import IntegrityError
+from flask_sqlalchemy.session import Session as FlaskSQLAlchemySession
 
 from dotenv import load_dotenv
 load_dotenv()
 
+from events import EventBroker, format_sse
+from json_provider import FastJSONProvider
+from notifications import NotificationDispatcher, channel_from_config
+from doctor_import import DoctorImporter, iter_records
+from geo import DoctorLocator, load_pincodes
+import specialties
+from search import index_upload, search as search_uploads
+from slot_index import FreeSlotIndex
+from archive import Archiver
+from compression import Compressor
+from medical_context import MedicalContextCache
+from recommend_cache import RecommendationCache, RecommendationLog, normalise_city
+import llm
+from idempotency import IdempotencyStore, Conflict as IdempotencyConflict, request_fingerprint
+
 # Optional Gemini import (only used if GEMINI_API_KEY present)
 try:
     import google.generativeai as genai
@@ -30,21 +54,108 @@ UPLOAD_FOLDER = os.path.join(BASE_DIR, "uploads")
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 SECRET_KEY = os.environ.get("MEDITRUST_SECRET", "change_this_in_production")
+# shared secret for /api/admin/* (sent as X-Admin-Token); admin routes are disabled when unset
+ADMIN_TOKEN = os.environ.get("MEDITRUST_ADMIN_TOKEN")
 DATABASE_URL = os.environ.get(
     "DATABASE_URL",
     "sqlite:///" + os.path.join(BASE_DIR, "meditrust.db")
 )
 
+# SQLite production profile (ignored for MySQL / in-memory databases)
+SQLITE_TUNING = os.environ.get("SQLITE_TUNING", "true").lower() == "true"
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")  # safe with WAL
+SQLITE_CACHE_SIZE_KB = int(os.environ.get("SQLITE_CACHE_SIZE_KB", "16384"))
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", str(128 * 1024 * 1024)))
+SQLITE_READ_POOL_SIZE = int(os.environ.get("SQLITE_READ_POOL_SIZE", "8"))
+
+JSON_BACKEND = os.environ.get("JSON_BACKEND", "orjson")  # "orjson" (if installed) or "stdlib"
+# notification outbox dispatcher; enable on exactly one process
+NOTIFY_DISPATCHER = os.environ.get("NOTIFY_DISPATCHER", "false").lower() == "true"
+NOTIFY_CHANNEL = os.environ.get("NOTIFY_CHANNEL", "log")  # "log" or "file:/path/outbox.jsonl"
+NOTIFY_BATCH_SIZE = int(os.environ.get("NOTIFY_BATCH_SIZE", "100"))
+NOTIFY_INTERVAL_SECONDS = float(os.environ.get("NOTIFY_INTERVAL_SECONDS", "2"))
+NOTIFY_MAX_ATTEMPTS = int(os.environ.get("NOTIFY_MAX_ATTEMPTS", "5"))
+
+SSE_HEARTBEAT_SECONDS = int(os.environ.get("SSE_HEARTBEAT_SECONDS", "15"))
+
+# response compression (gzip, or br when the brotli package is installed)
+COMPRESSION = os.environ.get("COMPRESSION", "true").lower() == "true"
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get("COMPRESSION_BROTLI_QUALITY", "4"))
+
+# archival of past slots/appointments (see archive.py)
+ARCHIVE_JOB = os.environ.get("ARCHIVE_JOB", "false").lower() == "true"
+ARCHIVE_HORIZON_DAYS = int(os.environ.get("ARCHIVE_HORIZON_DAYS", "30"))
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", "500"))
+ARCHIVE_INTERVAL_SECONDS = int(os.environ.get("ARCHIVE_INTERVAL_SECONDS", "3600"))
+
+# pincode -> lat/long table for ?mode=nearest recommendations
+PINCODE_DATA = os.environ.get("PINCODE_DATA", os.path.join(BASE_DIR, "data", "pincodes.csv"))
+NEAREST_DEFAULT_K = int(os.environ.get("NEAREST_DEFAULT_K", "10"))
+NEAREST_INDEX_MAX_AGE = int(os.environ.get("NEAREST_INDEX_MAX_AGE", "300"))  # seconds
+SLOT_INDEX_MAX_AGE = int(os.environ.get("SLOT_INDEX_MAX_AGE", "60"))  # seconds; bounds cross-worker staleness
+MEDICAL_CONTEXT_CACHE_SIZE = int(os.environ.get("MEDICAL_CONTEXT_CACHE_SIZE", "2048"))  # patients per process
+RECOMMEND_CACHE_SIZE = int(os.environ.get("RECOMMEND_CACHE_SIZE", "512"))  # (city, specialist) lists per process
+RECOMMEND_CACHE_MAX_AGE = int(os.environ.get("RECOMMEND_CACHE_MAX_AGE", "300"))  # seconds; bounds cross-worker staleness
+RECOMMEND_PATIENT_CACHE_SIZE = int(os.environ.get("RECOMMEND_PATIENT_CACHE_SIZE", "4096"))  # latest specialist per patient
+RECOMMEND_LOG_INTERVAL_SECONDS = float(os.environ.get("RECOMMEND_LOG_INTERVAL_SECONDS", "2"))
+
+# Password hashing. Unset PASSWORD_HASH_METHOD means werkzeug's default (scrypt).
+# Stored hashes weaker than the configured method are upgraded on the user's
+# next successful login; stronger ones are left alone. Verification runs on a small worker pool
+# (0 = inline) so a login burst can't occupy every request thread.
+PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD") or None  # e.g. "scrypt:65536:8:1"
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_QUEUE = int(os.environ.get("PASSWORD_HASH_QUEUE", "32"))
+PASSWORD_HASH_WAIT_SECONDS = float(os.environ.get("PASSWORD_HASH_WAIT_SECONDS", "5"))
+
 JWT_EXP_SECONDS = 60 * 60 * 24 * 7  # 7 days
 GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.5-flash")
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
 
+# inference backend: live | record (live + write fixtures) | replay (fixtures only; see llm.py)
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "live")
+LLM_FIXTURES_DIR = os.environ.get("LLM_FIXTURES_DIR", os.path.join(BASE_DIR, "fixtures", "llm"))
+LLM_REPLAY_LATENCY = os.environ.get("LLM_REPLAY_LATENCY", "recorded")
+LLM_REPLAY_SEED = os.environ.get("LLM_REPLAY_SEED")
+# per-call telemetry in llm_calls; prices (USD per 1M tokens) only feed /api/admin/llm-usage estimates
+LLM_TELEMETRY = os.environ.get("LLM_TELEMETRY", "true").lower() == "true"
+LLM_PRICE_INPUT_PER_MTOK = float(os.environ.get("LLM_PRICE_INPUT_PER_MTOK", "0.30"))
+LLM_PRICE_OUTPUT_PER_MTOK = float(os.environ.get("LLM_PRICE_OUTPUT_PER_MTOK", "2.50"))
+# per-route deadline / hedging policy for model calls (keys: url rule or "default"; see llm.HedgedBackend).
+# LLM_POLICIES (JSON) overrides individual routes, e.g. {"/api/symptoms/analyze": {"hedge": false}}
+LLM_POLICIES = {
+    "default": {"timeout_ms": 60000},
+    "/api/symptoms/analyze": {"deadline_ms": 8000, "hedge": True, "hedge_after_ms": 2500},
+    "/api/prescription/<int:upload_id>/validate": {"deadline_ms": 15000},
+}
+for _route, _policy in json.loads(os.environ.get("LLM_POLICIES", "{}")).items():
+    LLM_POLICIES[_route] = {**LLM_POLICIES.get(_route, {}), **_policy}
+LLM_POOL_SIZE = int(os.environ.get("LLM_POOL_SIZE", "32"))
+
+# Idempotency-Key handling for /upload, /upload-multiple and POST /appointments (see idempotency.py)
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get("IDEMPOTENCY_WAIT_SECONDS", "30"))  # retry waits for in-flight original
+IDEMPOTENCY_LOCK_SECONDS = int(os.environ.get("IDEMPOTENCY_LOCK_SECONDS", "600"))  # then a crashed claim is taken over
+
 # configure gemini if available and key present
 if GEMINI_AVAILABLE and GEMINI_API_KEY:
     genai.configure(api_key=GEMINI_API_KEY)
 
+llm_backend = llm.create_backend(
+    LLM_BACKEND,
+    genai if GEMINI_AVAILABLE and GEMINI_API_KEY else None,
+    GEMINI_MODEL,
+    LLM_FIXTURES_DIR,
+    replay_latency=LLM_REPLAY_LATENCY,
+    seed=LLM_REPLAY_SEED
+)
+
 # ---------- APP & DB ----------
 app = Flask(__name__, static_folder=None)
+app.json = FastJSONProvider(app, backend=JSON_BACKEND)
 ALLOWED_ORIGINS = [
     o.strip() for o in
     os.environ.get(
@@ -61,13 +172,79 @@ CORS(app,
      allow_headers="*",
      methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"])
 
+compressor = Compressor(
+    app,
+    min_size=COMPRESSION_MIN_BYTES,
+    gzip_level=COMPRESSION_GZIP_LEVEL,
+    brotli_quality=COMPRESSION_BROTLI_QUALITY,
+    exclude_endpoints=["api.serve_upload"]  # stored files are served as-is
+) if COMPRESSION else None
+
 
 app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URL
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 app.config["SECRET_KEY"] = SECRET_KEY
 
-db = SQLAlchemy(app)
+# File-backed SQLite gets WAL + tuned pragmas, and GET requests read through a
+# separate pool of read-only connections so they never queue behind writers.
+SQLITE_FILE = DATABASE_URL.split("///", 1)[1] if DATABASE_URL.startswith("sqlite:///") else None
+SQLITE_PROFILE = SQLITE_TUNING and bool(SQLITE_FILE) and SQLITE_FILE != ":memory:"
+
+if SQLITE_PROFILE:
+    app.config["SQLALCHEMY_BINDS"] = {
+        "reader": {
+            "url": f"sqlite:///file:{SQLITE_FILE}?mode=ro&uri=true",
+            "pool_size": SQLITE_READ_POOL_SIZE,
+        }
+    }
+
+
+def apply_sqlite_pragmas(dbapi_conn, connection_record, readonly=False):
+    if not isinstance(dbapi_conn, sqlite3.Connection):
+        return
+    cursor = dbapi_conn.cursor()
+    if not readonly:
+        # journal mode is persistent in the db file; readers inherit it
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.close()
+
+
+def apply_sqlite_reader_pragmas(dbapi_conn, connection_record):
+    apply_sqlite_pragmas(dbapi_conn, connection_record, readonly=True)
+
+
+class RoutingSession(FlaskSQLAlchemySession):
+    """
+    Sends reads issued while handling a GET request to the read-only pool.
+    Flushes and INSERT/UPDATE/DELETE statements always go to the writer.
+    """
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and not self._flushing
+            and "reader" in self._db.engines
+            and request
+            and request.method == "GET"
+            and not isinstance(clause, (Insert, Update, Delete))
+        ):
+            return self._db.engines["reader"]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(app, session_options={"class_": RoutingSession})
+
+if SQLITE_PROFILE:
+    with app.app_context():
+        event.listen(db.engine, "connect", apply_sqlite_pragmas)
+        event.listen(db.engines["reader"], "connect", apply_sqlite_reader_pragmas)
+
+# upload processing events (OCR / analysis finished) for the SSE stream
+upload_events = EventBroker()
 
 # ---------- MODELS (Match your MySQL DDL exactly) ----------
 class User(db.Model):
@@ -79,9 +256,11 @@ class User(db.Model):
     phone = db.Column(db.String(20))
     password_hash = db.Column(db.String(255), nullable=False)
     role = db.Column(db.String(10), nullable=False, default='patient')
-    city = db.Column(db.String(100))
+    city = db.Column(db.String(100), index=True)
     pincode = db.Column(db.String(10))
     location_source = db.Column(db.String(20), default='user_input')
+    # bumped by every write to allergies / conditions / user_medical_profile
+    medical_version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
 
@@ -107,9 +286,18 @@ class Doctor(db.Model):
     languages = db.Column(db.Text)  # JSON string, e.g. '["Marathi","English"]'
     consultation_fee = db.Column(db.Numeric(10,2))
     verified = db.Column(db.Boolean, default=False)
+    specialty_id = db.Column(db.String(40), index=True)  # canonical id from specialties.py
+
+    @db.validates("specialization")
+    def _set_specialty_id(self, key, value):
+        self.specialty_id = specialties.specialty_id(value)
+        return value
 
 class Upload(db.Model):
     __tablename__ = "uploads"
+    __table_args__ = (
+        db.Index("ix_uploads_user_created", "user_id", "created_at"),
+    )
     upload_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.user_id"), nullable=False)
     file_path = db.Column(db.Text, nullable=False)
@@ -122,7 +310,7 @@ class Upload(db.Model):
 class MedicalEntity(db.Model):
     __tablename__ = "medical_entities"
     entity_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    upload_id = db.Column(db.Integer, db.ForeignKey("uploads.upload_id"), nullable=False)
+    upload_id = db.Column(db.Integer, db.ForeignKey("uploads.upload_id"), nullable=False, index=True)
     type = db.Column(db.String(20), nullable=False)
     text = db.Column(db.String(255), nullable=False)
     normalized_value = db.Column(db.String(255))
@@ -132,13 +320,150 @@ class MedicalEntity(db.Model):
 
 class Summary(db.Model):
     __tablename__ = "summaries"
+    __table_args__ = (
+        db.Index("ix_summaries_upload_created", "upload_id", "created_at"),
+    )
     summary_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     upload_id = db.Column(db.Integer, db.ForeignKey("uploads.upload_id"), nullable=False, unique=True)
-    summary_text = db.Column(db.Text, nullable=False)  # JSON string
+    summary_text = db.Column(db.Text, nullable=False)  # pre-serialized JSON response, served as-is
+    condition_text = db.Column(db.String(255))  # "condition" is reserved in MySQL
+    explanation = db.Column(db.Text)
     llm_model_used = db.Column(db.String(100))
     recommended_specialist = db.Column(db.String(100))
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
 
+    medicines = db.relationship(
+        "SummaryMedicine",
+        order_by="SummaryMedicine.position",
+        cascade="all, delete-orphan"
+    )
+
+    def apply_analysis(self, analysis: dict, model_used=None):
+        """
+        Store an analysis dict (placeholder or Gemini output) in the structured
+        columns and serialize the response payload once, at write time.
+        """
+        def clip(value, size=255):
+            return str(value)[:size] if value else None
+
+        self.summary_text = json.dumps(analysis)
+        self.condition_text = clip(analysis.get("condition"))
+        self.explanation = analysis.get("explanation")
+        self.recommended_specialist = clip(analysis.get("recommended_specialist"), 100)
+        self.llm_model_used = model_used
+        self.medicines = [
+            SummaryMedicine(
+                position=i,
+                name=clip(m.get("name")) or "",
+                dosage=clip(m.get("dosage")),
+                frequency=clip(m.get("frequency")),
+                instructions=m.get("instructions")
+            )
+            for i, m in enumerate(analysis.get("medicines") or [])
+            if isinstance(m, dict)
+        ]
+
+class SummaryMedicine(db.Model):
+    __tablename__ = "summary_medicines"
+    medicine_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    summary_id = db.Column(db.Integer, db.ForeignKey("summaries.summary_id", ondelete="CASCADE"), nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False, default=0)
+    name = db.Column(db.String(255), nullable=False)
+    dosage = db.Column(db.String(255))
+    frequency = db.Column(db.String(255))
+    instructions = db.Column(db.Text)
+
+class MedicationTimeline(db.Model):
+    """One row per (patient, drug): when it was first/last prescribed and how the dosage changed."""
+    __tablename__ = "medication_timeline"
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "drug_key", name="uq_medication_timeline_user_drug"),
+    )
+    timeline_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.user_id", ondelete="CASCADE"), nullable=False)
+    drug_key = db.Column(db.String(255), nullable=False)  # lower-cased, whitespace-collapsed name
+    drug_name = db.Column(db.String(255), nullable=False)
+    first_seen = db.Column(db.DateTime, nullable=False)
+    last_seen = db.Column(db.DateTime, nullable=False)
+    dosage = db.Column(db.String(255))
+    frequency = db.Column(db.String(255))
+    dosage_history = db.Column(db.Text, nullable=False, default="[]")  # JSON [{dosage, frequency, upload_id, seen_at}]
+    upload_ids = db.Column(db.Text, nullable=False, default="[]")  # JSON list of source uploads
+
+    HISTORY_LIMIT = 50
+
+    @staticmethod
+    def drug_key_for(name):
+        return " ".join((name or "").lower().split())[:255]
+
+    @classmethod
+    def record(cls, session, user_id, upload_id, seen_at, medicines):
+        """Fold one upload's medicines ({name, dosage, frequency} dicts) into the user's timeline."""
+        meds = {}
+        for m in medicines:
+            key = cls.drug_key_for(m.get("name"))
+            if key:
+                meds.setdefault(key, (str(m["name"]).strip()[:255], m.get("dosage"), m.get("frequency")))
+        if not meds:
+            return
+
+        existing = {
+            row.drug_key: row
+            for row in session.query(cls).filter(cls.user_id == user_id, cls.drug_key.in_(meds))
+        }
+        seen_iso = seen_at.isoformat()
+        for key, (name, dosage, frequency) in meds.items():
+            dosage = str(dosage)[:255] if dosage else None
+            frequency = str(frequency)[:255] if frequency else None
+            row = existing.get(key)
+            if row is None:
+                row = cls._insert_or_lock(session, user_id, key, name, seen_at)
+
+            uploads = json.loads(row.upload_ids)
+            if upload_id in uploads:
+                continue
+            uploads.append(upload_id)
+            row.upload_ids = json.dumps(uploads)
+
+            history = json.loads(row.dosage_history)
+            if not history or (history[-1]["dosage"], history[-1]["frequency"]) != (dosage, frequency):
+                history.append({"dosage": dosage, "frequency": frequency,
+                                "upload_id": upload_id, "seen_at": seen_iso})
+                row.dosage_history = json.dumps(history[-cls.HISTORY_LIMIT:])
+
+            row.first_seen = min(row.first_seen, seen_at)
+            if seen_at >= row.last_seen:
+                row.last_seen = seen_at
+                row.drug_name, row.dosage, row.frequency = name, dosage, frequency
+
+    @classmethod
+    def _insert_or_lock(cls, session, user_id, key, name, seen_at):
+        """
+        New timeline row, or, when a concurrent upload for the same patient
+        committed it first, that row locked for update. The insert runs in a
+        savepoint so losing the race only undoes the insert, not the upload.
+        """
+        row = cls(user_id=user_id, drug_key=key, drug_name=name,
+                  first_seen=seen_at, last_seen=seen_at, dosage_history="[]", upload_ids="[]")
+        try:
+            with session.begin_nested():
+                session.add(row)
+        except IntegrityError:
+            row = session.query(cls).filter(cls.user_id == user_id, cls.drug_key == key) \
+                .with_for_update().one()
+        return row
+
+    def to_dict(self):
+        return {
+            "drug": self.drug_name,
+            "dosage": self.dosage,
+            "frequency": self.frequency,
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+            "dosage_history": json.loads(self.dosage_history),
+            "upload_ids": json.loads(self.upload_ids)
+        }
+
 class DoctorRecommendation(db.Model):
     __tablename__ = "doctor_recommendations"
     rec_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -150,6 +475,10 @@ class DoctorRecommendation(db.Model):
 
 class DoctorSlot(db.Model):
     __tablename__ = "doctor_slots"
+    __table_args__ = (
+        db.Index("ix_doctor_slots_doctor_start", "doctor_id", "slot_start"),
+        db.Index("ix_doctor_slots_end", "slot_end"),  # archival batches
+    )
     slot_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     doctor_id = db.Column(db.Integer, db.ForeignKey("doctors.doctor_id"), nullable=False)
     slot_start = db.Column(db.DateTime, nullable=False)
@@ -158,23 +487,267 @@ class DoctorSlot(db.Model):
 
 class Appointment(db.Model):
     __tablename__ = "appointments"
+    __table_args__ = (
+        db.Index("ix_appointments_patient_created", "patient_id", "created_at"),
+        db.Index("ix_appointments_doctor_created", "doctor_id", "created_at"),
+    )
     appointment_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     patient_id = db.Column(db.Integer, db.ForeignKey("users.user_id"), nullable=False)
     doctor_id = db.Column(db.Integer, db.ForeignKey("doctors.doctor_id"), nullable=False)
-    slot_id = db.Column(db.Integer, db.ForeignKey("doctor_slots.slot_id"), nullable=False)
+    slot_id = db.Column(db.Integer, db.ForeignKey("doctor_slots.slot_id"), nullable=False, index=True)
     status = db.Column(db.String(20), default='pending')
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
 
+class DoctorSlotArchive(db.Model):
+    """Past slots moved out of doctor_slots by archive.py (ids are preserved)."""
+    __tablename__ = "doctor_slots_archive"
+    __table_args__ = (
+        db.Index("ix_doctor_slots_archive_doctor_start", "doctor_id", "slot_start"),
+    )
+    slot_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    doctor_id = db.Column(db.Integer, nullable=False)
+    slot_start = db.Column(db.DateTime, nullable=False)
+    slot_end = db.Column(db.DateTime, nullable=False)
+    is_booked = db.Column(db.Boolean, default=False)
+    archived_at = db.Column(db.DateTime, nullable=False)
+
+class AppointmentArchive(db.Model):
+    """Appointments on archived slots, with the slot times copied in."""
+    __tablename__ = "appointments_archive"
+    __table_args__ = (
+        db.Index("ix_appointments_archive_patient_start", "patient_id", "slot_start"),
+        db.Index("ix_appointments_archive_doctor_start", "doctor_id", "slot_start"),
+    )
+    appointment_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    patient_id = db.Column(db.Integer, nullable=False)
+    doctor_id = db.Column(db.Integer, nullable=False)
+    slot_id = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20))
+    slot_start = db.Column(db.DateTime, nullable=False)
+    slot_end = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, nullable=False)
+
+class IdempotencyKey(db.Model):
+    """Claimed Idempotency-Key and, once finished, the response to replay for it."""
+    __tablename__ = "idempotency_keys"
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    idempotency_key = db.Column(db.String(255), primary_key=True)
+    endpoint = db.Column(db.String(100), nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    state = db.Column(db.String(20), nullable=False)
+    response_status = db.Column(db.Integer)
+    response_body = db.Column(db.LargeBinary)
+    response_mimetype = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class LLMCall(db.Model):
+    """One model call (see llm.MeteredBackend); written in batches, read by /admin/llm-usage."""
+    __tablename__ = "llm_calls"
+    call_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    created_at = db.Column(db.DateTime, nullable=False, index=True)
+    route = db.Column(db.String(100), nullable=False, default="")
+    kind = db.Column(db.String(20), nullable=False)
+    model = db.Column(db.String(60), nullable=False)
+    backend = db.Column(db.String(10), nullable=False)
+    outcome = db.Column(db.String(20), nullable=False)
+    latency_ms = db.Column(db.Integer, nullable=False)
+    prompt_bytes = db.Column(db.Integer, nullable=False, default=0)
+    image_bytes = db.Column(db.Integer, nullable=False, default=0)
+    response_bytes = db.Column(db.Integer, nullable=False, default=0)
+    prompt_tokens = db.Column(db.Integer)
+    response_tokens = db.Column(db.Integer)
+
+class DoctorStats(db.Model):
+    """Per-doctor dashboard counters, adjusted incrementally by the write routes."""
+    __tablename__ = "doctor_stats"
+    doctor_id = db.Column(db.Integer, db.ForeignKey("doctors.doctor_id", ondelete="CASCADE"), primary_key=True)
+    pending = db.Column(db.Integer, nullable=False, default=0)
+    confirmed = db.Column(db.Integer, nullable=False, default=0)
+    cancelled = db.Column(db.Integer, nullable=False, default=0)
+    slots_total = db.Column(db.Integer, nullable=False, default=0)
+    slots_booked = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
 class Notification(db.Model):
     __tablename__ = "notifications"
+    __table_args__ = (
+        db.Index("ix_notifications_user_read", "user_id", "is_read"),
+        db.Index("ix_notifications_status", "status", "notif_id"),
+    )
     notif_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.user_id"), nullable=False)
     appointment_id = db.Column(db.Integer, db.ForeignKey("appointments.appointment_id"))
     message = db.Column(db.Text)
-    status = db.Column(db.String(10), default='pending')
+    status = db.Column(db.String(10), default='pending')  # delivery: pending / sent / failed
+    is_read = db.Column(db.Boolean, nullable=False, default=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    sent_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
 
+    def to_dict(self):
+        return {
+            "notif_id": self.notif_id,
+            "appointment_id": self.appointment_id,
+            "message": self.message,
+            "is_read": self.is_read,
+            "created_at": self.created_at
+        }
+
+notification_dispatcher = NotificationDispatcher(
+    app, db, Notification,
+    channel_from_config(NOTIFY_CHANNEL),
+    batch_size=NOTIFY_BATCH_SIZE,
+    interval=NOTIFY_INTERVAL_SECONDS,
+    max_attempts=NOTIFY_MAX_ATTEMPTS
+)
+if NOTIFY_DISPATCHER:
+    notification_dispatcher.start()
+
+def refresh_archived_doctor_stats(doctor_ids):
+    # dashboard counters describe the live tables
+    for doctor_id in doctor_ids:
+        rebuild_doctor_stats(doctor_id)
+
+archiver = Archiver(
+    app, db,
+    horizon_days=ARCHIVE_HORIZON_DAYS,
+    batch_size=ARCHIVE_BATCH_SIZE,
+    interval=ARCHIVE_INTERVAL_SECONDS,
+    on_batch=refresh_archived_doctor_stats
+)
+if ARCHIVE_JOB:
+    archiver.start()
+
+def current_route():
+    if has_request_context():
+        return request.url_rule.rule if request.url_rule else request.path
+    return None
+
+def llm_policy():
+    return LLM_POLICIES.get(current_route()) or LLM_POLICIES.get("default")
+
+def request_started_at():
+    return g.get("request_started_at") if has_request_context() else None
+
+@app.before_request
+def start_request_clock():
+    # model-call deadlines are measured from here
+    g.request_started_at = time.monotonic()
+
+llm_calls = llm.CallLog(lambda: db.engine, LLMCall.__table__)
+if LLM_TELEMETRY:
+    llm_backend = llm.MeteredBackend(llm_backend, llm_calls, route=current_route)
+# outermost, so every hedged duplicate is metered as its own call
+llm_backend = llm.HedgedBackend(llm_backend, llm_policy, request_started_at, pool_size=LLM_POOL_SIZE)
+
+@app.teardown_request
+def flush_llm_calls(exc):
+    try:
+        llm_calls.flush()
+    except Exception:
+        app.logger.exception("Failed to write llm_calls telemetry")
+
+def load_doctor_locations():
+    return (
+        db.session.query(User.user_id, User.pincode, Doctor.specialization, Doctor.specialty_id, Doctor.rating)
+        .join(Doctor, Doctor.doctor_id == User.user_id)
+        .all()
+    )
+
+doctor_locator = DoctorLocator(load_pincodes(PINCODE_DATA), load_doctor_locations,
+                               max_age=NEAREST_INDEX_MAX_AGE)
+
+def invalidate_doctor_locations(mapper, connection, target):
+    doctor_locator.invalidate()
+
+def invalidate_on_pincode_change(mapper, connection, target):
+    if target.role == "doctor" and db.inspect(target).attrs.pincode.history.has_changes():
+        doctor_locator.invalidate()
+
+for _evt in ("after_insert", "after_update", "after_delete"):
+    event.listen(Doctor, _evt, invalidate_doctor_locations)
+event.listen(User, "after_update", invalidate_on_pincode_change)
+
+def load_free_slots(doctor_ids):
+    return (
+        db.session.query(DoctorSlot.doctor_id, DoctorSlot.slot_start, DoctorSlot.slot_id, DoctorSlot.slot_end)
+        .filter(DoctorSlot.doctor_id.in_(doctor_ids))
+        .filter(DoctorSlot.is_booked.is_(False))
+        .filter(DoctorSlot.slot_start >= datetime.datetime.now())
+        .all()
+    )
+
+free_slots = FreeSlotIndex(load_free_slots, max_age=SLOT_INDEX_MAX_AGE)
+
+# slot writes are collected per session and applied to the index only once committed
+def note_slot_change(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("slot_doctors", set()).add(target.doctor_id)
+
+for _evt in ("after_insert", "after_update", "after_delete"):
+    event.listen(DoctorSlot, _evt, note_slot_change)
+
+@event.listens_for(RoutingSession, "after_commit")
+def apply_slot_changes(session):
+    doctors = session.info.pop("slot_doctors", None)
+    if doctors:
+        free_slots.invalidate(doctors)
+
+@event.listens_for(RoutingSession, "after_rollback")
+def discard_slot_changes(session):
+    session.info.pop("slot_doctors", None)
+
+# city-mode recommendation lists (see recommend_cache.py), dropped once a doctor write commits
+RECOMMEND_USER_FIELDS = ("name", "email", "phone", "city")
+
+def note_doctor_change(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info["recommendations_stale"] = True
+
+def note_doctor_user_change(mapper, connection, target):
+    attrs = db.inspect(target).attrs
+    if target.role == "doctor" and any(attrs[f].history.has_changes() for f in RECOMMEND_USER_FIELDS):
+        note_doctor_change(mapper, connection, target)
+
+def note_doctor_user_delete(mapper, connection, target):
+    if target.role == "doctor":
+        note_doctor_change(mapper, connection, target)
+
+for _evt in ("after_insert", "after_update", "after_delete"):
+    event.listen(Doctor, _evt, note_doctor_change)
+event.listen(User, "after_update", note_doctor_user_change)
+event.listen(User, "after_delete", note_doctor_user_delete)
+
+# a patient's latest recommended_specialist (GET /recommend) changes with their summaries
+def note_summary_change(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        user_id = connection.execute(
+            db.select(Upload.user_id).where(Upload.upload_id == target.upload_id)
+        ).scalar()
+        session.info.setdefault("specialist_patients", set()).add(user_id)
+
+for _evt in ("after_insert", "after_update", "after_delete"):
+    event.listen(Summary, _evt, note_summary_change)
+
+@event.listens_for(RoutingSession, "after_commit")
+def apply_doctor_changes(session):
+    if session.info.pop("recommendations_stale", False):
+        recommendations.invalidate()
+    for user_id in session.info.pop("specialist_patients", ()):
+        latest_specialists.invalidate(user_id)
+
+@event.listens_for(RoutingSession, "after_rollback")
+def discard_doctor_changes(session):
+    session.info.pop("recommendations_stale", None)
+    session.info.pop("specialist_patients", None)
+
 # ---------- AUTH UTILITIES ----------
 def create_token(user):
     """
@@ -235,18 +808,215 @@ def auth_required(roles=None):
         return decorated
     return decorator
 
+def admin_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        supplied = request.headers.get("X-Admin-Token", "")
+        if not ADMIN_TOKEN or not hmac.compare_digest(supplied, ADMIN_TOKEN):
+            return jsonify({"message": "Forbidden"}), 403
+        return f(*args, **kwargs)
+    return decorated
+
+idempotency_keys = IdempotencyStore(
+    lambda: db.engine, IdempotencyKey.__table__,
+    ttl_seconds=IDEMPOTENCY_TTL_SECONDS,
+    wait_seconds=IDEMPOTENCY_WAIT_SECONDS,
+    lock_seconds=IDEMPOTENCY_LOCK_SECONDS
+)
+
+def _complete_when_streamed(chunks, user_id, key, status, mimetype):
+    body, finished = [], False
+    try:
+        for chunk in chunks:
+            body.append(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+            yield chunk
+        finished = True
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+        # runs after the request context is gone
+        with app.app_context():
+            if finished:
+                idempotency_keys.complete(user_id, key, status, b"".join(body), mimetype)
+            else:
+                idempotency_keys.release(user_id, key)
+
+def idempotent(f):
+    """
+    Honour an Idempotency-Key header: a retry gets the original response
+    instead of re-running the route. Place below auth_required.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        key = request.headers.get("Idempotency-Key", "").strip()
+        if not key:
+            return f(*args, **kwargs)
+        if len(key) > 255:
+            return jsonify({"message": "Idempotency-Key must be at most 255 characters"}), 400
+
+        user_id = request.current_user.user_id
+        try:
+            stored = idempotency_keys.claim(user_id, key, request.endpoint, request_fingerprint(request))
+        except IdempotencyConflict as e:
+            headers = {"Retry-After": str(e.retry_after)} if e.retry_after else {}
+            return jsonify({"message": e.message}), e.status, headers
+        if stored is not None:
+            return app.response_class(stored["response_body"], status=stored["response_status"],
+                                      mimetype=stored["response_mimetype"],
+                                      headers={"Idempotent-Replayed": "true"})
+
+        # the key is stored on its own connection: end the request's transaction
+        # first, or a route that failed after writing still holds SQLite's write lock
+        try:
+            response = app.make_response(f(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            idempotency_keys.release(user_id, key)
+            raise
+        if response.is_streamed and response.status_code < 500:
+            response.response = _complete_when_streamed(
+                response.response, user_id, key, response.status_code, response.mimetype
+            )
+            return response
+        db.session.rollback()  # no-op after the route's commit
+        if response.status_code >= 500:
+            idempotency_keys.release(user_id, key)
+        else:
+            idempotency_keys.complete(user_id, key, response.status_code, response.get_data(), response.mimetype)
+        return response
+    return decorated
+
+def enqueue_notification(user_id, appointment_id, message):
+    """
+    Outbox write: added to the current session so it commits atomically with
+    the change it describes. Delivery happens later in NotificationDispatcher.
+    """
+    db.session.add(Notification(user_id=user_id, appointment_id=appointment_id, message=message))
+
+def appointment_label(appt):
+    slot = DoctorSlot.query.get(appt.slot_id)
+    return slot.slot_start.strftime("%d %b %Y, %I:%M %p") if slot else f"#{appt.appointment_id}"
+
+DOCTOR_STATS_COLUMNS = ("pending", "confirmed", "cancelled", "slots_total", "slots_booked")
+
+def rebuild_doctor_stats(doctor_id):
+    """Recompute one doctor's counters from scratch with GROUP BY aggregates."""
+    counts = dict.fromkeys(DOCTOR_STATS_COLUMNS, 0)
+    status_rows = db.session.execute(
+        text("SELECT status, COUNT(*) FROM appointments WHERE doctor_id = :did GROUP BY status"),
+        {"did": doctor_id}
+    ).fetchall()
+    for status, n in status_rows:
+        if status in counts:
+            counts[status] = n
+    total, booked = db.session.execute(
+        text("""
+            SELECT COUNT(*), SUM(CASE WHEN is_booked THEN 1 ELSE 0 END)
+            FROM doctor_slots WHERE doctor_id = :did
+        """),
+        {"did": doctor_id}
+    ).one()
+    counts["slots_total"] = total or 0
+    counts["slots_booked"] = booked or 0
+    return db.session.merge(DoctorStats(doctor_id=doctor_id, **counts))
+
+def bump_doctor_stats(doctor_id, **deltas):
+    """
+    Apply counter deltas (e.g. pending=-1, confirmed=1) in the current
+    transaction. Call after the change itself; a doctor without a stats row
+    yet gets one rebuilt, which already includes that change.
+    """
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not deltas:
+        return
+    db.session.flush()
+    updated = DoctorStats.query.filter_by(doctor_id=doctor_id).update(
+        {getattr(DoctorStats, k): getattr(DoctorStats, k) + v for k, v in deltas.items()},
+        synchronize_session=False
+    )
+    if not updated:
+        rebuild_doctor_stats(doctor_id)
+
+def status_change(old_status, new_status):
+    """Counter deltas for an appointment moving from old_status to new_status."""
+    deltas = {}
+    if old_status in DOCTOR_STATS_COLUMNS:
+        deltas[old_status] = -1
+    if new_status in DOCTOR_STATS_COLUMNS:
+        deltas[new_status] = deltas.get(new_status, 0) + 1
+    return deltas
+
+medical_contexts = MedicalContextCache(lambda: db.session, max_entries=MEDICAL_CONTEXT_CACHE_SIZE)
+
+def medical_context(user):
+    """Allergies and conditions for user, cached until their medical_version changes."""
+    return medical_contexts.get(user)
+
+def bump_medical_version(user_id):
+    """Call in the same transaction as any write to the patient's medical profile."""
+    User.query.filter_by(user_id=user_id).update(
+        {User.medical_version: User.medical_version + 1}, synchronize_session=False
+    )
+    medical_contexts.invalidate(user_id)
+
 def user_has_medical_profile(user_id: int) -> bool:
-    allergy_count = db.session.execute(
-        text("SELECT COUNT(*) FROM user_allergies WHERE user_id = :uid"),
+    # single round trip; each EXISTS stops at the first indexed row
+    return bool(db.session.execute(
+        text("""
+            SELECT EXISTS (SELECT 1 FROM user_allergies WHERE user_id = :uid)
+                OR EXISTS (SELECT 1 FROM user_conditions WHERE user_id = :uid)
+        """),
         {"uid": user_id}
-    ).scalar()
+    ).scalar())
 
-    condition_count = db.session.execute(
-        text("SELECT COUNT(*) FROM user_conditions WHERE user_id = :uid"),
-        {"uid": user_id}
-    ).scalar()
+# ---------- PASSWORD HASHING ----------
+class HashingBusy(Exception):
+    """The password hashing pool is saturated; the client should retry."""
+
+_hash_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="pwhash") \
+    if PASSWORD_HASH_WORKERS > 0 else None
+_hash_slots = threading.BoundedSemaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE)
 
-    return (allergy_count or 0) > 0 or (condition_count or 0) > 0
+_HASH_KWARGS = {"method": PASSWORD_HASH_METHOD} if PASSWORD_HASH_METHOD else {}
+_HASH_RANK = {"pbkdf2": 1, "scrypt": 2}
+
+def hash_strength(pw_hash):
+    """
+    Comparable (algorithm rank, work factor) from a werkzeug hash prefix such as
+    "scrypt:32768:8:1" or "pbkdf2:sha256:600000"; (0, 0) if unrecognised.
+    """
+    parts = pw_hash.split("$", 1)[0].split(":")
+    try:
+        if parts[0] == "scrypt":
+            return _HASH_RANK["scrypt"], int(parts[1]) * int(parts[2])
+        if parts[0] == "pbkdf2":
+            return _HASH_RANK["pbkdf2"], int(parts[2])
+    except (IndexError, ValueError):
+        pass
+    return 0, 0
+
+CURRENT_HASH_STRENGTH = hash_strength(generate_password_hash("probe", **_HASH_KWARGS))
+
+def _run_hashing(fn, *args, wait=PASSWORD_HASH_WAIT_SECONDS, **kwargs):
+    if _hash_pool is None:
+        return fn(*args, **kwargs)
+    if not _hash_slots.acquire(timeout=wait):
+        raise HashingBusy()
+    try:
+        return _hash_pool.submit(fn, *args, **kwargs).result()
+    finally:
+        _hash_slots.release()
+
+def hash_password(password, wait=PASSWORD_HASH_WAIT_SECONDS):
+    """wait=None queues for the pool instead of raising HashingBusy (bulk imports)."""
+    return _run_hashing(generate_password_hash, password, wait=wait, **_HASH_KWARGS)
+
+def verify_password(pw_hash, password):
+    return _run_hashing(check_password_hash, pw_hash, password)
+
+def password_needs_rehash(pw_hash):
+    # never downgrade: a stored scrypt hash stays even if PASSWORD_HASH_METHOD is pbkdf2
+    return hash_strength(pw_hash) < CURRENT_HASH_STRENGTH
 
 # ---------- OCR / Gemini helpers (optional, run only if GEMINI_API_KEY present) ----------
 def clean_json_text(text: str) -> dict:
@@ -272,14 +1042,12 @@ def clean_json_text(text: str) -> dict:
 def run_gemini_pipeline(image_path: str) -> (str, dict):
     """
     Returns (ocr_text, analysis_json).
-    Requires GEMINI_API_KEY present and google.generativeai installed.
+    Requires the configured LLM backend (a Gemini key for live/record, fixtures for replay).
     This is intentionally simple — adapt prompts/model as needed.
     """
-    if not GEMINI_AVAILABLE or not GEMINI_API_KEY:
+    if not llm_backend.available:
         raise RuntimeError("Gemini not configured on server (GEMINI_API_KEY missing or package unavailable)")
 
-    model = genai.GenerativeModel(GEMINI_MODEL)
-
     # read image bytes
     with open(image_path, "rb") as f:
         img_bytes = f.read()
@@ -290,8 +1058,8 @@ def run_gemini_pipeline(image_path: str) -> (str, dict):
     prompt_extract = (
         "Extract the printed/handwritten text exactly from the following image. Return plain text only."
     )
-    extract_resp = model.generate_content(
-        contents=[
+    extract_resp = llm_backend.generate(
+        [
             {
                 "role": "user",
                 "parts": [
@@ -300,8 +1068,9 @@ def run_gemini_pipeline(image_path: str) -> (str, dict):
                 ],
             }
         ],
+        kind="ocr"
     )
-    ocr_text = extract_resp.text.strip() if hasattr(extract_resp, "text") else str(extract_resp)
+    ocr_text = extract_resp.text.strip()
 
     # 2) analyze and create a structured JSON
     prompt_analyze = f"""
@@ -329,10 +1098,8 @@ OCR_TEXT:
         }
     ]
 
-    analyze_resp = model.generate_content(contents=analyze_contents)
-
-    analysis_text = analyze_resp.text if hasattr(analyze_resp, "text") else str(analyze_resp)
-    analysis_json = clean_json_text(analysis_text)
+    analyze_resp = llm_backend.generate(analyze_contents, kind="analysis")
+    analysis_json = clean_json_text(analyze_resp.text)
     return ocr_text, analysis_json
 
 # ---------- ROUTES ----------
@@ -357,7 +1124,10 @@ def signup():
     if User.query.filter_by(email=data["email"]).first():
         return jsonify({"message": "Email already registered"}), 400
 
-    pw_hash = generate_password_hash(data["password"])
+    try:
+        pw_hash = hash_password(data["password"])
+    except HashingBusy:
+        return jsonify({"message": "Server busy, please retry"}), 503, {"Retry-After": "1"}
     user = User(
         name=data["name"],
         email=data["email"],
@@ -368,13 +1138,13 @@ def signup():
         role=data["role"]
     )
     db.session.add(user)
-    db.session.commit()
+    db.session.flush()  # user_id for the doctors row
 
     # If role is doctor, create a doctors row placeholder so FK relationships work
     if user.role == "doctor":
         doc = Doctor(doctor_id=user.user_id, specialization=data.get("specialization","General"))
         db.session.add(doc)
-        db.session.commit()
+    db.session.commit()
 
     return jsonify({"message": "Account created", "user": user.to_dict()}), 201
 
@@ -384,8 +1154,17 @@ def login():
     if not data.get("email") or not data.get("password"):
         return jsonify({"message": "email and password required"}), 400
     user = User.query.filter_by(email=data["email"]).first()
-    if not user or not check_password_hash(user.password_hash, data["password"]):
-        return jsonify({"message": "Invalid credentials"}), 401
+    try:
+        if not user or not verify_password(user.password_hash, data["password"]):
+            return jsonify({"message": "Invalid credentials"}), 401
+
+        # transparently move old hashes to the configured parameters
+        if password_needs_rehash(user.password_hash):
+            user.password_hash = hash_password(data["password"])
+            db.session.commit()
+    except HashingBusy:
+        return jsonify({"message": "Server busy, please retry"}), 503, {"Retry-After": "1"}
+
     token = create_token(user)
     return jsonify({
     "access_token": token,
@@ -408,16 +1187,7 @@ def get_all_allergies():
 @api.route("/me/allergies", methods=["GET"])
 @auth_required(roles=["patient"])
 def get_my_allergies():
-    rows = db.session.execute(
-        text("""
-            SELECT a.allergy_id, a.name
-            FROM user_allergies ua
-            JOIN allergies a ON a.allergy_id = ua.allergy_id
-            WHERE ua.user_id = :uid
-        """),
-        {"uid": request.current_user.user_id}
-    ).mappings().all()
-    return jsonify(rows), 200
+    return jsonify(medical_context(request.current_user).allergies), 200
 
 
 @api.route("/me/allergies", methods=["POST"])
@@ -441,6 +1211,7 @@ def set_my_allergies():
             {"uid": uid, "aid": aid}
         )
 
+    bump_medical_version(uid)
     db.session.commit()
     return jsonify({"message": "Allergies updated"}), 200
 
@@ -448,15 +1219,7 @@ def set_my_allergies():
 @api.route("/me/conditions", methods=["GET"])
 @auth_required(roles=["patient"])
 def get_my_conditions():
-    rows = db.session.execute(
-        text("""
-            SELECT conditn
-            FROM user_conditions
-            WHERE user_id = :uid
-        """),
-        {"uid": request.current_user.user_id}
-    ).scalars().all()
-    return jsonify(rows), 200
+    return jsonify(medical_context(request.current_user).conditions), 200
 
 
 @api.route("/me/conditions", methods=["POST"])
@@ -482,9 +1245,23 @@ def set_my_conditions():
                 {"uid": uid, "cond": c}
             )
 
+    bump_medical_version(uid)
     db.session.commit()
     return jsonify({"message": "Conditions updated"}), 200
 
+
+@api.route("/me/medications", methods=["GET"])
+@auth_required(roles=["patient"])
+def get_my_medications():
+    """Medication timeline, most recently prescribed first."""
+    rows = (
+        MedicationTimeline.query
+        .filter_by(user_id=request.current_user.user_id)
+        .order_by(MedicationTimeline.last_seen.desc())
+        .all()
+    )
+    return jsonify([r.to_dict() for r in rows]), 200
+
 # -------------------------
 # Save complete medical profile (allergies + conditions + vitals)
 # -------------------------
@@ -575,6 +1352,7 @@ def save_medical_profile():
                 {"uid": uid, "cond": c}
             )
 
+    bump_medical_version(uid)
     db.session.commit()
 
     return jsonify({
@@ -596,7 +1374,7 @@ def analyze_symptoms():
         return jsonify({"message": "Symptoms are required"}), 400
 
     # If Gemini is not configured, fail gracefully
-    if not GEMINI_AVAILABLE or not GEMINI_API_KEY:
+    if not llm_backend.available:
         return jsonify({
             "condition": "Unknown",
             "explanation": "AI analysis is currently unavailable. Please consult a doctor directly.",
@@ -604,8 +1382,6 @@ def analyze_symptoms():
         }), 200
 
     try:
-        model = genai.GenerativeModel(GEMINI_MODEL)
-
         prompt = f"""
 You are a medical assistant AI.
 
@@ -634,11 +1410,10 @@ Example:
 }}
 """
 
-        response = model.generate_content(prompt)
+        response = llm_backend.generate(prompt, kind="symptoms")
 
         # Extract and clean JSON
-        analysis_text = response.text if hasattr(response, "text") else str(response)
-        analysis_json = clean_json_text(analysis_text)
+        analysis_json = clean_json_text(response.text)
 
         # Safety fallback
         return jsonify({
@@ -654,7 +1429,10 @@ Example:
         }), 200
 
     except Exception as e:
-        app.logger.exception("Symptom analysis failed")
+        if isinstance(e, llm.DeadlineExceeded):
+            app.logger.warning("Symptom analysis exceeded its deadline; returning fallback")
+        else:
+            app.logger.exception("Symptom analysis failed")
         return jsonify({
             "condition": "Unknown",
             "explanation": "We encountered an issue while analyzing your symptoms. Please consult a doctor.",
@@ -664,6 +1442,115 @@ Example:
 # -------------------------
 # Recommend doctors from symptom analysis
 # -------------------------
+def specialty_filter(specialist):
+    """Indexed equality on the canonical specialty; substring match for unmapped text."""
+    sid = specialties.specialty_id(specialist)
+    if sid:
+        return Doctor.specialty_id == sid
+    return Doctor.specialization.ilike(f"%{specialist}%")
+
+def nearest_doctors(pincode, specialist, k):
+    """
+    [(User, Doctor, distance_km)] for the k nearest doctors matching specialist,
+    or None when the pincode is not in the pincode table.
+    """
+    hits = doctor_locator.nearest(pincode, k, specialist, specialties.specialty_id(specialist))
+    if hits is None:
+        return None
+    distances = dict(hits)
+    rank = {doctor_id: i for i, (doctor_id, _) in enumerate(hits)}
+    rows = (
+        db.session.query(User, Doctor)
+        .join(Doctor, Doctor.doctor_id == User.user_id)
+        .filter(User.user_id.in_(distances))
+        .all()
+    )
+    rows.sort(key=lambda r: rank[r[0].user_id])
+    return [(user, doc, distances[user.user_id]) for user, doc in rows]
+
+def nearest_k_param(value):
+    try:
+        return min(max(int(value), 1), 50)
+    except (TypeError, ValueError):
+        return NEAREST_DEFAULT_K
+
+def recommend_item(user, doc, distance=None):
+    """Doctor entry of GET /recommend."""
+    item = {
+        "doctor_id": user.user_id,
+        "name": user.name,
+        "email": user.email,
+        "phone": user.phone,
+        "city": user.city,
+        "specialization": doc.specialization,
+        "rating": doc.rating or 0,
+        "experience": doc.years_experience or 0,
+        "clinicAddress": doc.clinic_address,
+        "consultationFee": doc.consultation_fee or 0
+    }
+    if distance is not None:
+        item["distanceKm"] = distance
+    return item
+
+def symptoms_item(user, doc, distance=None):
+    """Doctor entry of POST /recommend/from-symptoms."""
+    item = {
+        "doctor_id": user.user_id,
+        "name": user.name,
+        "specialization": doc.specialization,
+        "rating": doc.rating or 0,
+        "experience": doc.years_experience or 0,
+        "clinic_address": doc.clinic_address,
+        "consultation_fee": doc.consultation_fee or 0
+    }
+    if distance is not None:
+        item["distance_km"] = distance
+    return item
+
+def recommendation_key(city, specialist):
+    """(city, "id", specialty_id) for mapped specialists, (city, "text", specialist) otherwise."""
+    sid = specialties.specialty_id(specialist) if specialist else None
+    if sid:
+        return normalise_city(city), "id", sid
+    return normalise_city(city), "text", " ".join((specialist or "").split()).lower()
+
+def load_recommendations(key):
+    """Both routes' doctor lists for a city match, rating order, as JSON strings."""
+    city, kind, value = key
+    q = (
+        db.session.query(User, Doctor)
+        .join(Doctor, Doctor.doctor_id == User.user_id)
+        .filter(User.city.ilike(f"%{city}%"))
+    )
+    if kind == "id":
+        q = q.filter(Doctor.specialty_id == value)
+    elif value:
+        q = q.filter(Doctor.specialization.ilike(f"%{value}%"))
+    rows = q.order_by(Doctor.rating.desc()).all()
+    return {
+        "recommend": app.json.dumps([recommend_item(user, doc) for user, doc in rows]),
+        "symptoms": app.json.dumps([symptoms_item(user, doc) for user, doc in rows]),
+    }
+
+recommendations = RecommendationCache(load_recommendations, max_entries=RECOMMEND_CACHE_SIZE,
+                                      max_age=RECOMMEND_CACHE_MAX_AGE)
+
+def load_latest_specialist(user_id):
+    return db.session.query(Summary.recommended_specialist) \
+        .join(Upload, Upload.upload_id == Summary.upload_id) \
+        .filter(Upload.user_id == user_id) \
+        .order_by(Summary.created_at.desc()) \
+        .limit(1) \
+        .scalar()
+
+latest_specialists = RecommendationCache(load_latest_specialist, max_entries=RECOMMEND_PATIENT_CACHE_SIZE,
+                                         max_age=RECOMMEND_CACHE_MAX_AGE)
+
+# GET /recommend audit rows, written in batches off the request path
+recommendation_log = RecommendationLog(app, lambda: db.engine, DoctorRecommendation.__table__,
+                                       interval=RECOMMEND_LOG_INTERVAL_SECONDS)
+recommendation_log.start()
+
 @api.route("/recommend/from-symptoms", methods=["POST"])
 @auth_required(roles=["patient"])
 def recommend_from_symptoms():
@@ -675,38 +1562,130 @@ def recommend_from_symptoms():
     if not recommended_specialist:
         return jsonify({"message": "Specialist not provided"}), 400
 
-    # reuse existing recommend logic
-    user_city = request.current_user.city or ""
+    # mode=nearest ranks by distance from the patient's pincode; unknown pincodes fall back to city
+    ranked = None
+    if (data.get("mode") or request.args.get("mode")) == "nearest":
+        pincode = data.get("pincode") or request.current_user.pincode
+        ranked = nearest_doctors(pincode, recommended_specialist, nearest_k_param(data.get("k")))
 
-    q = (
-        db.session.query(User, Doctor)
-        .join(Doctor, Doctor.doctor_id == User.user_id)
-        .filter(User.city.ilike(f"%{user_city}%"))
-        .filter(Doctor.specialization.ilike(f"%{recommended_specialist}%"))
-        .order_by(Doctor.rating.desc())
-    )
+    if ranked is None:
+        # same city match as GET /recommend, served from the cache
+        key = recommendation_key(request.current_user.city, recommended_specialist)
+        doctors = recommendations.get(key)["symptoms"]
+    else:
+        doctors = app.json.dumps([symptoms_item(user, doc, distance) for user, doc, distance in ranked])
 
-    doctors = []
-    for user, doc in q.all():
-        doctors.append({
-            "doctor_id": user.user_id,
-            "name": user.name,
-            "specialization": doc.specialization,
-            "rating": float(doc.rating or 0),
-            "experience": int(doc.years_experience or 0),
-            "clinic_address": doc.clinic_address,
-            "consultation_fee": float(doc.consultation_fee or 0)
-        })
+    body = '{"condition":%s,"recommended_specialist":%s,"doctors":%s}' % (
+        app.json.dumps(condition), app.json.dumps(recommended_specialist), doctors)
+    return app.response_class(body, mimetype="application/json"), 200
 
-    return jsonify({
-        "condition": condition,
-        "recommended_specialist": recommended_specialist,
-        "doctors": doctors
-    }), 200
 
+def record_medical_entities(upload, analysis_json):
+    """
+    Write CONDITION/DRUG/DOSAGE/FREQUENCY entities for an analysed upload and
+    fold its medicines into the owner's medication timeline. Caller commits.
+    """
+    if analysis_json.get("condition"):
+        db.session.add(MedicalEntity(
+            upload_id=upload.upload_id,
+            type="CONDITION",
+            text=analysis_json["condition"],
+            normalized_value=analysis_json["condition"],
+            confidence=1.0,
+            source="gemini"
+        ))
+
+    for med in analysis_json.get("medicines", []):
+        if med.get("name"):
+            db.session.add(MedicalEntity(
+                upload_id=upload.upload_id,
+                type="DRUG",
+                text=med["name"],
+                normalized_value=med["name"],
+                confidence=1.0,
+                source="gemini"
+            ))
+        if med.get("dosage"):
+            db.session.add(MedicalEntity(
+                upload_id=upload.upload_id,
+                type="DOSAGE",
+                text=med["dosage"],
+                normalized_value=med["dosage"],
+                confidence=1.0,
+                source="gemini"
+            ))
+        if med.get("frequency"):
+            db.session.add(MedicalEntity(
+                upload_id=upload.upload_id,
+                type="FREQUENCY",
+                text=med["frequency"],
+                normalized_value=med["frequency"],
+                confidence=1.0,
+                source="gemini"
+            ))
+
+    medicines = [m for m in analysis_json.get("medicines") or [] if isinstance(m, dict)]
+    MedicationTimeline.record(db.session, upload.user_id, upload.upload_id,
+                              upload.created_at or datetime.datetime.utcnow(), medicines)
+
+
+UPLOAD_PLACEHOLDER = {
+    "medicines": [],
+    "condition": "Processing",
+    "explanation": "Your file has been uploaded and will be processed shortly."
+}
+
+def save_upload_file(f):
+    filename = secure_filename(f.filename)
+    unique_name = f"{datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{filename}"
+    path = os.path.join(app.config["UPLOAD_FOLDER"], unique_name)
+    f.save(path)
+    return path
+
+def record_upload(user_id, path, upload_type, consent_flag, analysis=None):
+    """
+    Add an upload and its summary, plus (when analysis = (ocr_text, analysis_json)
+    is given) the OCR text, entities and search index row, as one unit.
+    The model calls run before this, so no write transaction is held open
+    across them. Caller commits.
+    """
+    upload = Upload(
+        user_id=user_id,
+        file_path=path,
+        upload_type=upload_type,
+        consent_cloud_ocr=consent_flag
+    )
+    db.session.add(upload)
+    db.session.flush()  # upload_id for the summary
+
+    summary = Summary(upload_id=upload.upload_id)
+    db.session.add(summary)
+    if analysis is None:
+        summary.apply_analysis(UPLOAD_PLACEHOLDER)
+        return upload
+
+    ocr_text, analysis_json = analysis
+    upload.ocr_text = ocr_text
+    upload.ocr_provider = "gemini"
+    summary.apply_analysis(analysis_json, GEMINI_MODEL)
+    record_medical_entities(upload, analysis_json)
+    index_upload(db.session, upload, summary)
+    return upload
+
+def publish_upload_events(upload, analysis, failed):
+    """SSE notifications for a committed upload."""
+    if analysis is not None:
+        upload_events.publish(upload.user_id, "ocr_complete", {"upload_id": upload.upload_id})
+        upload_events.publish(upload.user_id, "analysis_complete", {
+            "upload_id": upload.upload_id,
+            "summary": analysis[1]
+        })
+    elif failed:
+        upload_events.publish(upload.user_id, "processing_failed", {"upload_id": upload.upload_id})
 
 @api.route("/upload", methods=["POST"])
 @auth_required(roles=["patient","doctor"])
+@idempotent
 def upload_file():
     try:
         # Accepts multipart/form-data with 'file' and upload_type, consent_cloud_ocr optional
@@ -718,48 +1697,20 @@ def upload_file():
         upload_type = request.form.get("upload_type", "prescription")
         consent_flag = request.form.get("consent_cloud_ocr", "false").lower() == "true"
 
-        filename = secure_filename(f.filename)
-        unique_name = f"{datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{filename}"
-        path = os.path.join(app.config["UPLOAD_FOLDER"], unique_name)
-        f.save(path)
-
-        upload = Upload(
-            user_id=request.current_user.user_id,
-            file_path=path,
-            upload_type=upload_type,
-            consent_cloud_ocr=consent_flag
-        )
-        db.session.add(upload)
-        db.session.commit()
-
-        # placeholder summary
-        placeholder = {
-            "medicines": [],
-            "condition": "Processing",
-            "explanation": "Your file has been uploaded and will be processed shortly."
-        }
-        summary = Summary(
-            upload_id=upload.upload_id,
-            summary_text=json.dumps(placeholder),
-            llm_model_used=None
-        )
-        db.session.add(summary)
-        db.session.commit()
+        path = save_upload_file(f)
 
         # If consented, run Gemini pipeline synchronously (for demo). In production, enqueue to worker.
+        analysis = failed = None
         if consent_flag:
             try:
-                ocr_text, analysis_json = run_gemini_pipeline(path)
-                upload.ocr_text = ocr_text
-                upload.ocr_provider = 'gemini'
-                db.session.commit()
-
-                summary.summary_text = json.dumps(analysis_json)
-                summary.llm_model_used = GEMINI_MODEL if GEMINI_API_KEY else "gemini"
-                summary.recommended_specialist = analysis_json.get("recommended_specialist")
-                db.session.commit()
+                analysis = run_gemini_pipeline(path)
             except Exception:
                 app.logger.exception("Gemini pipeline failed. Upload saved with placeholder summary.")
+                failed = True
+
+        upload = record_upload(request.current_user.user_id, path, upload_type, consent_flag, analysis)
+        db.session.commit()
+        publish_upload_events(upload, analysis, failed)
 
         return jsonify({"uploadId": upload.upload_id, "message": "File uploaded"}), 201
     except Exception as e:
@@ -776,13 +1727,11 @@ def get_summary(upload_id):
     # only owner or doctor can fetch
     if upload.user_id != request.current_user.user_id and request.current_user.role != "doctor":
         return jsonify({"message": "Forbidden"}), 403
-    summary = Summary.query.filter_by(upload_id=upload_id).first()
-    if not summary:
+    summary_text = db.session.query(Summary.summary_text).filter_by(upload_id=upload_id).scalar()
+    if summary_text is None:
         return jsonify({"message": "No summary available"}), 404
-    try:
-        return jsonify(json.loads(summary.summary_text)), 200
-    except Exception:
-        return jsonify({"summary_text": summary.summary_text}), 200
+    # stored pre-serialized by Summary.apply_analysis; no parse/re-encode per read
+    return app.response_class(summary_text, status=200, mimetype="application/json")
 
 # -------------------------
 # Validate prescription against patient allergies/conditions
@@ -801,40 +1750,40 @@ def validate_prescription(upload_id):
     if not summary:
         return jsonify({"message": "No summary available"}), 404
 
-    try:
-        summary_data = json.loads(summary.summary_text)
-    except Exception:
-        summary_data = {"medicines": [], "condition": "Unknown"}
-
-    medicines = summary_data.get("medicines", [])
-    condition = summary_data.get("condition", "Unknown")
+    condition = summary.condition_text or "Unknown"
+    summary_specialist = summary.recommended_specialist or "General Physician"
 
-    # Get patient's allergies
+    # Patient's allergies and conditions
     uid = request.current_user.user_id
-    allergy_rows = db.session.execute(
-        text("""
-            SELECT a.name FROM user_allergies ua
-            JOIN allergies a ON a.allergy_id = ua.allergy_id
-            WHERE ua.user_id = :uid
-        """),
-        {"uid": uid}
-    ).scalars().all()
-    patient_allergies = list(allergy_rows) if allergy_rows else []
-
-    # Get patient's conditions
-    condition_rows = db.session.execute(
-        text("SELECT conditn FROM user_conditions WHERE user_id = :uid"),
-        {"uid": uid}
-    ).scalars().all()
-    patient_conditions = list(condition_rows) if condition_rows else []
+    context = medical_context(request.current_user)
+    patient_allergies = context.allergy_names
+    patient_conditions = context.conditions
 
     # Build medicine names list
-    med_names = [m.get("name", "") for m in medicines if isinstance(m, dict)]
+    med_names = [m.name for m in summary.medicines]
+
+    # Duplicate therapy: drugs on this prescription already on the timeline from other uploads
+    prescribed = {MedicationTimeline.drug_key_for(n): n.strip() for n in med_names}
+    current_medications, duplicates = [], []
+    for row in MedicationTimeline.query.filter_by(user_id=uid).order_by(MedicationTimeline.last_seen.desc()):
+        other_uploads = [u for u in json.loads(row.upload_ids) if u != upload_id]
+        if not other_uploads:
+            continue
+        current_medications.append(row.drug_name)
+        if row.drug_key in prescribed:
+            duplicates.append({
+                "drug": prescribed[row.drug_key],
+                "since": row.first_seen,
+                "upload_ids": other_uploads
+            })
+    duplicate_warnings = [
+        f"{d['drug']} is already on your medication list (prescribed since {d['since']:%d %b %Y})"
+        for d in duplicates
+    ]
 
     # If Gemini is available, use AI validation
-    if GEMINI_AVAILABLE and GEMINI_API_KEY:
+    if llm_backend.available:
         try:
-            model = genai.GenerativeModel(GEMINI_MODEL)
             prompt = f"""
 You are a pharmacist assistant AI. Check if the following prescription is safe for the patient.
 
@@ -842,11 +1791,13 @@ Prescribed medicines: {json.dumps(med_names)}
 Prescribed condition: {condition}
 Patient allergies: {json.dumps(patient_allergies)}
 Patient existing conditions: {json.dumps(patient_conditions)}
+Patient's medications from earlier prescriptions: {json.dumps(current_medications[:50])}
 
 Your task:
 1. Check if any prescribed medicine conflicts with the patient's ALLERGIES.
 2. Check if any medicine may be unsafe given the patient's EXISTING CONDITIONS.
-3. Provide a safety verdict and advice.
+3. Check for duplicate therapy or interactions with the patient's earlier medications.
+4. Provide a safety verdict and advice.
 
 Return STRICT JSON with keys:
 - is_safe: boolean (true if no major conflicts found)
@@ -862,17 +1813,17 @@ Example:
   "recommended_specialist": "General Physician"
 }}
 """
-            response = model.generate_content(prompt)
-            analysis_text = response.text if hasattr(response, "text") else str(response)
-            result = clean_json_text(analysis_text)
+            response = llm_backend.generate(prompt, kind="validation")
+            result = clean_json_text(response.text)
 
+            ai_warnings = result.get("warnings", [])
             return jsonify({
                 "validation": {
-                    "is_safe": result.get("is_safe", True),
-                    "warnings": result.get("warnings", []),
+                    "is_safe": result.get("is_safe", True) and not duplicates,
+                    "warnings": duplicate_warnings + [w for w in ai_warnings if w not in duplicate_warnings],
+                    "duplicate_therapy": duplicates,
                     "patient_advice": result.get("patient_advice", "Please consult your doctor."),
-                    "recommended_specialist": result.get("recommended_specialist",
-                                                         summary_data.get("recommended_specialist", "General Physician"))
+                    "recommended_specialist": result.get("recommended_specialist", summary_specialist)
                 }
             }), 200
 
@@ -880,7 +1831,7 @@ Example:
             app.logger.exception("Gemini validation failed, falling back to basic check")
 
     # Fallback: basic string-matching validation (no AI)
-    warnings = []
+    warnings = list(duplicate_warnings)
     for med in med_names:
         for allergy in patient_allergies:
             if allergy.lower() in med.lower() or med.lower() in allergy.lower():
@@ -891,18 +1842,57 @@ Example:
         "validation": {
             "is_safe": is_safe,
             "warnings": warnings,
+            "duplicate_therapy": duplicates,
             "patient_advice": (
                 "No conflicts detected. This prescription appears safe for you."
                 if is_safe else
                 "Potential conflicts were found. Please consult your doctor before taking these medicines."
             ),
-            "recommended_specialist": summary_data.get("recommended_specialist", "General Physician")
+            "recommended_specialist": summary_specialist
         }
     }), 200
 
+def process_uploads(saved, user_id, upload_type, consent_flag):
+    """
+    Record (and, with consent, analyse) each saved (filename, path) in turn,
+    yielding one result per file as soon as it is done: upload_id, filename,
+    status ("processed" | "stored" | "failed"), summary or error.
+    """
+    for original_name, path in saved:
+        # ---- GEMINI PIPELINE ----
+        analysis = failed = None
+        if consent_flag and llm_backend.available:
+            try:
+                analysis = run_gemini_pipeline(path)
+            except Exception:
+                traceback.print_exc()
+                failed = True
+
+        # one commit per file, so each streamed result is durable when it is sent
+        upload = record_upload(user_id, path, upload_type, consent_flag, analysis)
+        db.session.commit()
+        publish_upload_events(upload, analysis, failed)
+
+        result = {"upload_id": upload.upload_id, "filename": original_name, "status": "stored"}
+        if analysis is not None:
+            result.update(status="processed", summary=analysis[1])
+        elif failed:
+            result.update(status="failed", error="Processing failed; the file was saved")
+        yield result
+
+def wants_ndjson():
+    return request.args.get("stream") in ("1", "true") or \
+        request.accept_mimetypes.best == "application/x-ndjson"
+
 @api.route("/upload-multiple", methods=["POST"])
 @auth_required(roles=["patient", "doctor"])
+@idempotent
 def upload_multiple():
+    """
+    Returns {"uploads": [ids]} once every file is done, or, with ?stream=1 or
+    Accept: application/x-ndjson, one JSON line per file as it finishes
+    followed by {"done": true, "uploads": [ids]}.
+    """
     try:
         if "files" not in request.files:
             return jsonify({"message": "No files provided"}), 400
@@ -910,107 +1900,121 @@ def upload_multiple():
         files = request.files.getlist("files")
         upload_type = request.form.get("upload_type", "prescription")
         consent_flag = request.form.get("consent_cloud_ocr", "false").lower() == "true"
+        # files are written to disk up front: the request's file streams are closed once streaming starts
+        saved = [(f.filename, save_upload_file(f)) for f in files if f.filename != ""]
+        results = process_uploads(saved, request.current_user.user_id, upload_type, consent_flag)
 
-        upload_ids = []
-
-        for f in files:
-            if f.filename == "":
-                continue
-
-            filename = secure_filename(f.filename)
-            unique_name = f"{datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{filename}"
-            path = os.path.join(app.config["UPLOAD_FOLDER"], unique_name)
-            f.save(path)
-
-            upload = Upload(
-                user_id=request.current_user.user_id,
-                file_path=path,
-                upload_type=upload_type,
-                consent_cloud_ocr=consent_flag
-            )
-            db.session.add(upload)
-            db.session.commit()
-            upload_ids.append(upload.upload_id)
-
-            placeholder = {
-                "condition": "Processing",
-                "explanation": "Your file has been uploaded and will be processed shortly.",
-                "medicines": []
-            }
-
-            summary = Summary(
-                upload_id=upload.upload_id,
-                summary_text=json.dumps(placeholder),
-                llm_model_used=None
-            )
-            db.session.add(summary)
-            db.session.commit()
-
-            # ---- GEMINI PIPELINE ----
-            if consent_flag and GEMINI_AVAILABLE and GEMINI_API_KEY:
+        if wants_ndjson():
+            def stream():
+                upload_ids = []
                 try:
-                    ocr_text, analysis_json = run_gemini_pipeline(path)
-
-                    upload.ocr_text = ocr_text
-                    upload.ocr_provider = "gemini"
-                    db.session.commit()
-
-                    summary.summary_text = json.dumps(analysis_json)
-                    summary.llm_model_used = GEMINI_MODEL
-                    db.session.commit()
-
-                    # medical entities
-                    if analysis_json.get("condition"):
-                        db.session.add(MedicalEntity(
-                            upload_id=upload.upload_id,
-                            type="CONDITION",
-                            text=analysis_json["condition"],
-                            normalized_value=analysis_json["condition"],
-                            confidence=1.0,
-                            source="gemini"
-                        ))
-
-                    for med in analysis_json.get("medicines", []):
-                        if med.get("name"):
-                            db.session.add(MedicalEntity(
-                                upload_id=upload.upload_id,
-                                type="DRUG",
-                                text=med["name"],
-                                normalized_value=med["name"],
-                                confidence=1.0,
-                                source="gemini"
-                            ))
-                        if med.get("dosage"):
-                            db.session.add(MedicalEntity(
-                                upload_id=upload.upload_id,
-                                type="DOSAGE",
-                                text=med["dosage"],
-                                normalized_value=med["dosage"],
-                                confidence=1.0,
-                                source="gemini"
-                            ))
-                        if med.get("frequency"):
-                            db.session.add(MedicalEntity(
-                                upload_id=upload.upload_id,
-                                type="FREQUENCY",
-                                text=med["frequency"],
-                                normalized_value=med["frequency"],
-                                confidence=1.0,
-                                source="gemini"
-                            ))
-
-                    db.session.commit()
-
-                except Exception:
+                    for result in results:
+                        upload_ids.append(result["upload_id"])
+                        yield app.json.dumps(result) + "\n"
+                except Exception as e:
                     traceback.print_exc()
                     db.session.rollback()
+                    yield app.json.dumps({"status": "error", "error": str(e)}) + "\n"
+                yield app.json.dumps({"done": True, "uploads": upload_ids}) + "\n"
 
+            return Response(stream_with_context(stream()), status=201, mimetype="application/x-ndjson",
+                            headers={"X-Accel-Buffering": "no"})
+
+        upload_ids = [result["upload_id"] for result in results]
         return jsonify({"uploads": upload_ids}), 201
 
     except Exception as e:
         traceback.print_exc()
         return jsonify({"message": "Server error", "error": str(e)}), 500
 
+# -------------------------
+# Full-text search over uploads
+# -------------------------
+@api.route("/search", methods=["GET"])
+@auth_required(roles=["patient", "doctor"])
+def search_route():
+    """
+    ?q=amoxicillin&page=1&per_page=20. Same visibility as get_summary:
+    patients search their own uploads, doctors search all uploads.
+    """
+    q = (request.args.get("q") or "").strip()
+    if not q:
+        return jsonify({"message": "q is required"}), 400
+    page = max(request.args.get("page", 1, type=int), 1)
+    per_page = min(max(request.args.get("per_page", 20, type=int), 1), 50)
+
+    owner = request.current_user.user_id if request.current_user.role != "doctor" else None
+    total, hits = search_uploads(db.session, q, user_id=owner, page=page, per_page=per_page)
+
+    uploads = {}
+    if hits:
+        rows = (
+            db.session.query(Upload.upload_id, Upload.user_id, Upload.upload_type,
+                             Upload.created_at, Summary.condition_text)
+            .outerjoin(Summary, Summary.upload_id == Upload.upload_id)
+            .filter(Upload.upload_id.in_([h["upload_id"] for h in hits]))
+            .all()
+        )
+        uploads = {r.upload_id: r for r in rows}
+
+    results = []
+    for h in hits:
+        u = uploads.get(h["upload_id"])
+        if u is None:
+            continue
+        results.append({
+            "upload_id": u.upload_id,
+            "user_id": u.user_id,
+            "upload_type": u.upload_type,
+            "created_at": u.created_at,
+            "condition": u.condition_text,
+            "snippet": h["snippet"],
+            "score": round(h["score"] or 0, 4)
+        })
+
+    return jsonify({
+        "query": q,
+        "page": page,
+        "per_page": per_page,
+        "total": total,
+        "results": results
+    }), 200
+
+# -------------------------
+# Upload processing events (server-sent events)
+# -------------------------
+@api.route("/uploads/events", methods=["GET"])
+@auth_required(roles=["patient", "doctor"])
+def upload_events_stream():
+    """
+    Pushes ocr_complete / analysis_complete / processing_failed events for the
+    caller's uploads, replacing polling of /upload/<id>/summary. Reconnecting
+    clients resume via the Last-Event-ID header (or ?last_event_id=).
+    """
+    user_id = request.current_user.user_id
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    last_event_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+
+    q, backlog = upload_events.subscribe(user_id, last_event_id)
+
+    def stream():
+        try:
+            yield f"retry: {SSE_HEARTBEAT_SECONDS * 1000}\n\n"
+            for item in backlog:
+                yield format_sse(item)
+            while True:
+                try:
+                    yield format_sse(q.get(timeout=SSE_HEARTBEAT_SECONDS))
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+        finally:
+            upload_events.unsubscribe(user_id, q)
+
+    return Response(stream(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
 @api.route("/uploads/my", methods=["GET"])
 @auth_required(roles=["patient","doctor"])
 def get_my_uploads():
@@ -1027,7 +2031,7 @@ def get_my_uploads():
             "upload_id": u.upload_id,
             "type": u.upload_type,
             "file_name": u.file_path.split("/")[-1],
-            "created_at": u.created_at.isoformat(),
+            "created_at": u.created_at,
             "status": "Processed" if u.ocr_text else "Uploaded"
         })
 
@@ -1039,20 +2043,8 @@ def recommend_doctors():
     # 1) fetch patient city
     user_city = request.current_user.city or request.args.get("city") or ""
 
-    # 2) try to get recommended_specialist from latest summary
-    latest_summary = Summary.query \
-        .join(Upload, Upload.upload_id == Summary.upload_id) \
-        .filter(Upload.user_id == request.current_user.user_id) \
-        .order_by(Summary.created_at.desc()) \
-        .first()
-
-    recommended_specialist = None
-    if latest_summary:
-        try:
-            summary_json = json.loads(latest_summary.summary_text)
-            recommended_specialist = summary_json.get("recommended_specialist")
-        except Exception:
-            pass
+    # 2) try to get recommended_specialist from latest summary (cached per patient)
+    recommended_specialist = latest_specialists.get(request.current_user.user_id)
 
     # 3) fallback: query param
     if not recommended_specialist:
@@ -1062,94 +2054,143 @@ def recommend_doctors():
     if not recommended_specialist and condition:
         recommended_specialist = condition
 
-    # 4) build doctor query
-    q = (
-        db.session.query(User, Doctor)
-        .join(Doctor, Doctor.doctor_id == User.user_id)
-        .filter(User.city.ilike(f"%{user_city}%"))
-    )
-
-    if recommended_specialist:
-        q = q.filter(Doctor.specialization.ilike(f"%{recommended_specialist}%"))
-
-    q = q.order_by(Doctor.rating.desc())
-
-    results = []
-    for user, doc in q.all():
-        results.append({
-            "doctor_id": user.user_id,
-            "name": user.name,
-            "email": user.email,
-            "phone": user.phone,
-            "city": user.city,
-            "specialization": doc.specialization,
-            "rating": float(doc.rating or 0),
-            "experience": int(doc.years_experience or 0),
-            "clinicAddress": doc.clinic_address,
-            "consultationFee": float(doc.consultation_fee or 0)
-        })
-
-    # log recommendation
-    log = DoctorRecommendation(
-        user_id=request.current_user.user_id,
-        user_condition=recommended_specialist or condition,
-        city=user_city,
-        recommended_doctors=results
-    )
-    db.session.add(log)
-    db.session.commit()
-
-    return jsonify(results), 200
+    # 4) ?mode=nearest&k=N: k nearest by pincode (falls back to the city match below)
+    ranked = None
+    if request.args.get("mode") == "nearest":
+        pincode = request.args.get("pincode") or request.current_user.pincode
+        ranked = nearest_doctors(pincode, recommended_specialist, nearest_k_param(request.args.get("k")))
+
+    # 5) city match by rating, pre-serialised per (city, specialist)
+    if ranked is None:
+        results = recommendations.get(recommendation_key(user_city, recommended_specialist))["recommend"]
+    else:
+        results = app.json.dumps([recommend_item(user, doc, distance) for user, doc, distance in ranked])
+
+    # log recommendation (buffered; see RecommendationLog)
+    recommendation_log.record({
+        "user_id": request.current_user.user_id,
+        "user_condition": recommended_specialist or condition,
+        "city": user_city,
+        "recommended_doctors": results,
+        "created_at": datetime.datetime.utcnow(),
+    })
+
+    return app.response_class(results, mimetype="application/json"), 200
 
 # -------------------------
 # Doctor profile & slots (single canonical implementations)
 # -------------------------
-@api.route("/doctor/<int:doctor_id>", methods=["GET"])
-@auth_required(roles=["patient","doctor"])
-def doctor_profile_route(doctor_id):
-    doc = Doctor.query.get(doctor_id)
-    if not doc:
-        return jsonify({"message": "Doctor not found"}), 404
-    user = User.query.get(doctor_id)
-
-    slots = DoctorSlot.query.filter_by(doctor_id=doctor_id).order_by(DoctorSlot.slot_start.asc()).all()
-    slots_out = [{
+def upcoming_slots_query(doctor_id):
+    """
+    Live slots of one doctor (or a list of doctors) from now on;
+    ?include_past=true adds past slots that are not archived yet.
+    """
+    ids = doctor_id if isinstance(doctor_id, list) else [doctor_id]
+    q = DoctorSlot.query.filter(DoctorSlot.doctor_id.in_(ids))
+    if request.args.get("include_past", "false").lower() != "true":
+        q = q.filter(DoctorSlot.slot_start >= datetime.datetime.now())
+    return q.order_by(DoctorSlot.slot_start.asc())
+
+def slot_dict(s):
+    return {
         "slot_id": s.slot_id,
-        "slot_start": s.slot_start.isoformat(),
-        "slot_end": s.slot_end.isoformat(),
+        "slot_start": s.slot_start,
+        "slot_end": s.slot_end,
         "is_booked": s.is_booked
-    } for s in slots]
+    }
 
-    doc_info = {
+def doctor_profile_dict(doc, user, slots):
+    return {
         "doctor_id": doc.doctor_id,
         "name": user.name if user else None,
         "specialization": doc.specialization,
-        "rating": float(doc.rating or 0),
-        "years_experience": int(doc.years_experience or 0),
+        "rating": doc.rating or 0,
+        "years_experience": doc.years_experience or 0,
         "languages": json.loads(doc.languages) if isinstance(doc.languages, str) else (doc.languages or []),
         "clinic_address": doc.clinic_address,
         "city": user.city if user else None,
-        "consultation_fee": float(doc.consultation_fee or 0),
+        "consultation_fee": doc.consultation_fee or 0,
         "bio": doc.bio,
-        "slots": slots_out
+        "slots": [slot_dict(s) for s in slots]
+    }
+
+def slot_details_dict(slot, doctor, user):
+    return {
+        "slot_id": slot.slot_id,
+        "slot_start": slot.slot_start,
+        "slot_end": slot.slot_end,
+        "doctor_name": user.name if user else None,
+        "doctor_specialization": doctor.specialization if doctor else None,
+        "clinic_address": doctor.clinic_address if doctor else None
     }
-    return jsonify(doc_info), 200
+
+MAX_BATCH_IDS = 100
+
+def batch_ids_param():
+    """?ids=1,2,3 (or repeated ids=); returns a de-duplicated list, or None if malformed."""
+    raw = ",".join(request.args.getlist("ids"))
+    try:
+        ids = list(dict.fromkeys(int(x) for x in raw.split(",") if x.strip()))
+    except ValueError:
+        return None
+    return ids if 0 < len(ids) <= MAX_BATCH_IDS else None
+
+@api.route("/doctor/<int:doctor_id>", methods=["GET"])
+@auth_required(roles=["patient","doctor"])
+def doctor_profile_route(doctor_id):
+    doc = Doctor.query.get(doctor_id)
+    if not doc:
+        return jsonify({"message": "Doctor not found"}), 404
+    user = User.query.get(doctor_id)
+
+    slots = upcoming_slots_query(doctor_id).all()
+    return jsonify(doctor_profile_dict(doc, user, slots)), 200
+
+@api.route("/doctors", methods=["GET"])
+@auth_required(roles=["patient", "doctor"])
+def doctors_batch_route():
+    """
+    ?ids=1,2,3 -> {doctor_id: profile} in the /doctor/<id> shape (unknown ids are
+    omitted). One query for the doctors and one for all of their slots.
+    """
+    ids = batch_ids_param()
+    if ids is None:
+        return jsonify({"message": f"ids must be 1-{MAX_BATCH_IDS} comma-separated integers"}), 400
+
+    rows = (
+        db.session.query(Doctor, User)
+        .join(User, User.user_id == Doctor.doctor_id)
+        .filter(Doctor.doctor_id.in_(ids))
+        .all()
+    )
+    slots_by_doctor = {}
+    for slot in upcoming_slots_query(ids).all():
+        slots_by_doctor.setdefault(slot.doctor_id, []).append(slot)
+
+    return jsonify({
+        doc.doctor_id: doctor_profile_dict(doc, user, slots_by_doctor.get(doc.doctor_id, []))
+        for doc, user in rows
+    }), 200
 
 @api.route("/doctor/<int:doctor_id>/slots", methods=["GET"])
 @auth_required(roles=["patient", "doctor"])
 def doctor_slots_route(doctor_id):
-    slots = DoctorSlot.query.filter_by(doctor_id=doctor_id).order_by(DoctorSlot.slot_start.asc()).all()
-
-    output = []
-    for s in slots:
-        output.append({
-            "slot_id": s.slot_id,
-            "slot_start": s.slot_start.isoformat(),
-            "slot_end": s.slot_end.isoformat(),
-            "is_booked": s.is_booked
-        })
+    slots = upcoming_slots_query(doctor_id).all()
+    return jsonify([slot_dict(s) for s in slots]), 200
 
-    return jsonify(output), 200
+@api.route("/doctor/<int:doctor_id>/slots/history", methods=["GET"])
+@auth_required(roles=["patient", "doctor"])
+def doctor_slots_history_route(doctor_id):
+    """Archived slots, newest first. ?before=ISO&limit=50"""
+    limit = min(max(request.args.get("limit", 50, type=int), 1), 200)
+    q = DoctorSlotArchive.query.filter_by(doctor_id=doctor_id)
+    if request.args.get("before"):
+        try:
+            q = q.filter(DoctorSlotArchive.slot_start < datetime.datetime.fromisoformat(request.args["before"]))
+        except ValueError:
+            return jsonify({"message": "Invalid datetime format. Use ISO format."}), 400
+    slots = q.order_by(DoctorSlotArchive.slot_start.desc()).limit(limit).all()
+    return jsonify([slot_dict(s) for s in slots]), 200
 
 @api.route("/slots/<int:slot_id>", methods=["GET"])
 @auth_required(roles=["patient", "doctor"])
@@ -1161,14 +2202,77 @@ def slot_details_route(slot_id):
     doctor = Doctor.query.get(slot.doctor_id)
     user = User.query.get(slot.doctor_id)
 
-    return jsonify({
-        "slot_id": slot.slot_id,
-        "slot_start": slot.slot_start.isoformat(),
-        "slot_end": slot.slot_end.isoformat(),
-        "doctor_name": user.name if user else None,
-        "doctor_specialization": doctor.specialization if doctor else None,
-        "clinic_address": doctor.clinic_address if doctor else None
-    }), 200
+    return jsonify(slot_details_dict(slot, doctor, user)), 200
+
+@api.route("/slots", methods=["GET"])
+@auth_required(roles=["patient", "doctor"])
+def slots_batch_route():
+    """?ids=1,2,3 -> {slot_id: details} in the /slots/<id> shape (unknown ids are omitted)."""
+    ids = batch_ids_param()
+    if ids is None:
+        return jsonify({"message": f"ids must be 1-{MAX_BATCH_IDS} comma-separated integers"}), 400
+
+    rows = (
+        db.session.query(DoctorSlot, Doctor, User)
+        .outerjoin(Doctor, Doctor.doctor_id == DoctorSlot.doctor_id)
+        .outerjoin(User, User.user_id == DoctorSlot.doctor_id)
+        .filter(DoctorSlot.slot_id.in_(ids))
+        .all()
+    )
+    return jsonify({slot.slot_id: slot_details_dict(slot, doctor, user) for slot, doctor, user in rows}), 200
+
+@api.route("/slots/search", methods=["GET"])
+@auth_required(roles=["patient", "doctor"])
+def slots_search_route():
+    """
+    Earliest free slots across all matching doctors.
+    ?specialist=Cardiologist&city=Pune&from=ISO&to=ISO&limit=10
+    """
+    specialist = request.args.get("specialist") or request.args.get("specialization")
+    city = request.args.get("city")
+    limit = min(max(request.args.get("limit", 10, type=int), 1), 100)
+    try:
+        start = datetime.datetime.fromisoformat(request.args["from"]) if request.args.get("from") else None
+        end = datetime.datetime.fromisoformat(request.args["to"]) if request.args.get("to") else None
+    except ValueError:
+        return jsonify({"message": "Invalid datetime format. Use ISO format."}), 400
+    start = max(start or datetime.datetime.min, datetime.datetime.now())
+
+    q = db.session.query(Doctor.doctor_id)
+    if city:
+        q = q.join(User, User.user_id == Doctor.doctor_id).filter(User.city.ilike(f"%{city}%"))
+    if specialist:
+        q = q.filter(specialty_filter(specialist))
+    doctor_ids = [d for (d,) in q.all()]
+
+    hits = free_slots.earliest(doctor_ids, start, end, limit) if doctor_ids else []
+
+    doctors = {}
+    if hits:
+        rows = (
+            db.session.query(User.user_id, User.name, User.city, Doctor.specialization,
+                             Doctor.clinic_address, Doctor.consultation_fee)
+            .join(Doctor, Doctor.doctor_id == User.user_id)
+            .filter(User.user_id.in_({h[1] for h in hits}))
+            .all()
+        )
+        doctors = {r.user_id: r for r in rows}
+
+    results = []
+    for slot_start, doctor_id, slot_id, slot_end in hits:
+        d = doctors.get(doctor_id)
+        results.append({
+            "slot_id": slot_id,
+            "slot_start": slot_start,
+            "slot_end": slot_end,
+            "doctor_id": doctor_id,
+            "doctor_name": d.name if d else None,
+            "specialization": d.specialization if d else None,
+            "city": d.city if d else None,
+            "clinic_address": d.clinic_address if d else None,
+            "consultation_fee": (d.consultation_fee or 0) if d else 0
+        })
+    return jsonify(results), 200
 
 # -------------------------
 # Add slot (doctor)
@@ -1198,6 +2302,7 @@ def doctor_addslot_route():
 
     slot = DoctorSlot(doctor_id=request.current_user.user_id, slot_start=s_start, slot_end=s_end, is_booked=False)
     db.session.add(slot)
+    bump_doctor_stats(slot.doctor_id, slots_total=1)
     db.session.commit()
     return jsonify({"message": "Slot added", "slot_id": slot.slot_id}), 201
 
@@ -1206,6 +2311,7 @@ def doctor_addslot_route():
 # -------------------------
 @api.route("/appointments", methods=["POST"])
 @auth_required(roles=["patient"])
+@idempotent
 def appointments_create_route():
     data = request.json or {}
     slot_id = data.get("slot_id")
@@ -1225,6 +2331,12 @@ def appointments_create_route():
         status="pending"
     )
     db.session.add(appt)
+    db.session.flush()
+    enqueue_notification(
+        slot.doctor_id, appt.appointment_id,
+        f"New appointment request from {request.current_user.name} for {appointment_label(appt)}."
+    )
+    bump_doctor_stats(slot.doctor_id, pending=1, slots_booked=1)
     db.session.commit()
 
     return jsonify({"appointment_id": appt.appointment_id}), 201
@@ -1258,6 +2370,68 @@ def doctor_appointments_route():
 
     return jsonify(out), 200
 
+# -------------------------
+# Doctor: dashboard (pre-aggregated counters + today's schedule)
+# -------------------------
+@api.route("/doctor/dashboard", methods=["GET"])
+@auth_required(roles=["doctor"])
+def doctor_dashboard_route():
+    doctor_id = request.current_user.user_id
+
+    stats = DoctorStats.query.get(doctor_id)
+    if not stats:
+        stats = rebuild_doctor_stats(doctor_id)
+        db.session.commit()
+
+    try:
+        day = datetime.date.fromisoformat(request.args["date"]) if request.args.get("date") else datetime.date.today()
+    except ValueError:
+        return jsonify({"message": "Invalid date. Use YYYY-MM-DD."}), 400
+    day_start = datetime.datetime.combine(day, datetime.time.min)
+
+    # today's slots with their live (non-cancelled) appointment, if any
+    rows = (
+        db.session.query(DoctorSlot, Appointment, User.name)
+        .outerjoin(Appointment, db.and_(
+            Appointment.slot_id == DoctorSlot.slot_id,
+            Appointment.status != "cancelled"
+        ))
+        .outerjoin(User, User.user_id == Appointment.patient_id)
+        .filter(
+            DoctorSlot.doctor_id == doctor_id,
+            DoctorSlot.slot_start >= day_start,
+            DoctorSlot.slot_start < day_start + datetime.timedelta(days=1)
+        )
+        .order_by(DoctorSlot.slot_start.asc())
+        .all()
+    )
+    schedule = [{
+        "slot_id": slot.slot_id,
+        "slot_start": slot.slot_start,
+        "slot_end": slot.slot_end,
+        "is_booked": slot.is_booked,
+        "appointment_id": appt.appointment_id if appt else None,
+        "status": appt.status if appt else None,
+        "patient_name": patient_name
+    } for slot, appt, patient_name in rows]
+
+    return jsonify({
+        "appointments": {
+            "pending": stats.pending,
+            "confirmed": stats.confirmed,
+            "cancelled": stats.cancelled,
+            "total": stats.pending + stats.confirmed + stats.cancelled
+        },
+        "slots": {
+            "total": stats.slots_total,
+            "booked": stats.slots_booked,
+            "free": stats.slots_total - stats.slots_booked,
+            "utilisation": round(stats.slots_booked / stats.slots_total, 3) if stats.slots_total else 0
+        },
+        "date": day,
+        "schedule": schedule
+    }), 200
+
 # -------------------------
 # Accept appointment (doctor)
 # -------------------------
@@ -1267,7 +2441,16 @@ def appointment_accept_route(appointment_id):
     appt = Appointment.query.get(appointment_id)
     if not appt or appt.doctor_id != request.current_user.user_id:
         return jsonify({"message": "Appointment not found or forbidden"}), 404
+    if appt.status == "confirmed":
+        return jsonify({"message": "Appointment confirmed"}), 200
+
+    deltas = status_change(appt.status, "confirmed")
     appt.status = "confirmed"
+    enqueue_notification(
+        appt.patient_id, appt.appointment_id,
+        f"Your appointment on {appointment_label(appt)} was confirmed by {request.current_user.name}."
+    )
+    bump_doctor_stats(appt.doctor_id, **deltas)
     db.session.commit()
     return jsonify({"message": "Appointment confirmed"}), 200
 
@@ -1287,14 +2470,32 @@ def appointment_cancel_route(appointment_id):
     if request.current_user.role == "patient" and appt.patient_id != request.current_user.user_id:
         return jsonify({"message": "Forbidden"}), 403
 
+    # already cancelled: don't notify twice or free a slot someone else has rebooked since
+    if appt.status == "cancelled":
+        return jsonify({"message": "Appointment cancelled"}), 200
+
+    deltas = status_change(appt.status, "cancelled")
     appt.status = "cancelled"
-    db.session.commit()
+    # tell the other party
+    if request.current_user.role == "doctor":
+        enqueue_notification(
+            appt.patient_id, appt.appointment_id,
+            f"Your appointment on {appointment_label(appt)} was cancelled by {request.current_user.name}."
+        )
+    else:
+        enqueue_notification(
+            appt.doctor_id, appt.appointment_id,
+            f"{request.current_user.name} cancelled the appointment on {appointment_label(appt)}."
+        )
 
-    # free the slot
+    # free the slot (same transaction as the status change)
     slot = DoctorSlot.query.get(appt.slot_id)
     if slot:
+        if slot.is_booked:
+            deltas["slots_booked"] = -1
         slot.is_booked = False
-        db.session.commit()
+    bump_doctor_stats(appt.doctor_id, **deltas)
+    db.session.commit()
 
     return jsonify({"message": "Appointment cancelled"}), 200
 
@@ -1334,10 +2535,10 @@ def my_appointments_route():
             "doctor_specialization": doctor_info.specialization if doctor_info else None,
             "doctor_experience": doctor_info.years_experience if doctor_info else None,
             "doctor_clinic": doctor_info.clinic_address if doctor_info else None,
-            "doctor_fee": float(doctor_info.consultation_fee or 0) if doctor_info else None,
+            "doctor_fee": (doctor_info.consultation_fee or 0) if doctor_info else None,
 
             # slot time
-            "slot_start": slot.slot_start.isoformat() if slot else None,
+            "slot_start": slot.slot_start if slot else None,
 
             # appointment status
             "status": a.status
@@ -1345,6 +2546,102 @@ def my_appointments_route():
 
     return jsonify(out), 200
 
+@api.route("/appointments/history", methods=["GET"])
+@auth_required(roles=["patient", "doctor"])
+def appointments_history_route():
+    """Archived appointments of the caller (as patient or doctor), newest first. ?before=ISO&limit=50"""
+    user = request.current_user
+    limit = min(max(request.args.get("limit", 50, type=int), 1), 200)
+    owner_col = AppointmentArchive.doctor_id if user.role == "doctor" else AppointmentArchive.patient_id
+    other_col = AppointmentArchive.patient_id if user.role == "doctor" else AppointmentArchive.doctor_id
+
+    q = (
+        db.session.query(AppointmentArchive, User.name)
+        .outerjoin(User, User.user_id == other_col)
+        .filter(owner_col == user.user_id)
+    )
+    if request.args.get("before"):
+        try:
+            q = q.filter(AppointmentArchive.slot_start < datetime.datetime.fromisoformat(request.args["before"]))
+        except ValueError:
+            return jsonify({"message": "Invalid datetime format. Use ISO format."}), 400
+    rows = q.order_by(AppointmentArchive.slot_start.desc()).limit(limit).all()
+
+    name_key = "patient_name" if user.role == "doctor" else "doctor_name"
+    return jsonify([{
+        "appointment_id": a.appointment_id,
+        "patient_id": a.patient_id,
+        "doctor_id": a.doctor_id,
+        name_key: name,
+        "slot_start": a.slot_start,
+        "slot_end": a.slot_end,
+        "status": a.status
+    } for a, name in rows]), 200
+
+# -------------------------
+# Notifications feed
+# -------------------------
+@api.route("/notifications", methods=["GET"])
+@auth_required(roles=["patient", "doctor"])
+def notifications_feed_route():
+    """
+    Without since_id: newest first; page back with ?before_id=<smallest notif_id seen>.
+    With ?since_id=<largest notif_id seen>: what is new, oldest first, so clients
+    can poll this cheaply instead of re-reading /appointments/my. While has_more
+    is true, call again with since_id set to the last notif_id returned.
+    """
+    uid = request.current_user.user_id
+    since_id = request.args.get("since_id", type=int)
+    before_id = request.args.get("before_id", type=int)
+    limit = min(max(request.args.get("limit", type=int) or 50, 1), 200)
+
+    q = Notification.query.filter(Notification.user_id == uid)
+    if since_id is not None:
+        q = q.filter(Notification.notif_id > since_id).order_by(Notification.notif_id.asc())
+    else:
+        if before_id is not None:
+            q = q.filter(Notification.notif_id < before_id)
+        q = q.order_by(Notification.notif_id.desc())
+    rows = q.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    unread_count = (
+        db.session.query(db.func.count(Notification.notif_id))
+        .filter(Notification.user_id == uid, Notification.is_read.is_(False))
+        .scalar()
+    )
+
+    return jsonify({
+        "notifications": [n.to_dict() for n in rows],
+        "has_more": has_more,
+        "unread_count": unread_count
+    }), 200
+
+@api.route("/notifications/read", methods=["POST"])
+@auth_required(roles=["patient", "doctor"])
+def notifications_mark_read_route():
+    """Body: {"ids": [...]} or {"up_to_id": n} to mark everything up to n as read."""
+    data = request.json or {}
+    uid = request.current_user.user_id
+
+    q = Notification.query.filter(Notification.user_id == uid, Notification.is_read.is_(False))
+    try:
+        if data.get("ids"):
+            if not isinstance(data["ids"], list):
+                raise ValueError
+            q = q.filter(Notification.notif_id.in_([int(i) for i in data["ids"]]))
+        elif data.get("up_to_id"):
+            q = q.filter(Notification.notif_id <= int(data["up_to_id"]))
+        else:
+            return jsonify({"message": "Provide ids or up_to_id"}), 400
+    except (TypeError, ValueError):
+        return jsonify({"message": "ids must be a list of integers and up_to_id an integer"}), 400
+
+    updated = q.update({Notification.is_read: True}, synchronize_session=False)
+    db.session.commit()
+    return jsonify({"message": "Notifications marked as read", "updated": updated}), 200
+
 # -------------------------
 # Update slot (doctor) - Option A: PUT /doctor/slot/<slot_id>
 # -------------------------
@@ -1385,8 +2682,8 @@ def doctor_update_slot_route(slot_id):
     return jsonify({
         "message": "Slot updated",
         "slot_id": slot.slot_id,
-        "slot_start": slot.slot_start.isoformat(),
-        "slot_end": slot.slot_end.isoformat()
+        "slot_start": slot.slot_start,
+        "slot_end": slot.slot_end
     }), 200
 
 # -------------------------
@@ -1406,10 +2703,129 @@ def doctor_delete_slot_route(slot_id):
         return jsonify({"message": "Cannot delete a booked slot"}), 400
 
     db.session.delete(slot)
+    bump_doctor_stats(slot.doctor_id, slots_total=-1)
     db.session.commit()
     return jsonify({"message": "Slot deleted", "slot_id": slot_id}), 200
 
 
+# -------------------------
+# Admin: bulk doctor import
+# -------------------------
+@api.route("/admin/doctors/import", methods=["POST"])
+@admin_required
+def admin_import_doctors_route():
+    """
+    Streams a CSV or JSON Lines file of doctors (multipart field "file", or the
+    raw request body) through DoctorImporter and returns its report.
+    ?format=csv|jsonl (default: from the file name / Content-Type), ?chunk_size=N
+    """
+    if "file" in request.files:
+        upload = request.files["file"]
+        stream, name = upload.stream, upload.filename or ""
+    else:
+        stream, name = request.stream, ""
+
+    fmt = request.args.get("format")
+    if not fmt:
+        is_jsonl = name.endswith((".jsonl", ".ndjson")) or "ndjson" in (request.content_type or "")
+        fmt = "jsonl" if is_jsonl else "csv"
+    if fmt not in ("csv", "jsonl"):
+        return jsonify({"message": "format must be csv or jsonl"}), 400
+
+    chunk_size = min(max(request.args.get("chunk_size", type=int) or 500, 1), 5000)
+    # an import queues for the hashing pool rather than failing rows under login load
+    importer = DoctorImporter(db, User, Doctor, partial(hash_password, wait=None), chunk_size)
+    report = importer.run(iter_records(stream, fmt))
+    return jsonify(report), 200
+
+# -------------------------
+# Admin: metrics
+# -------------------------
+@api.route("/admin/metrics", methods=["GET"])
+@admin_required
+def admin_metrics_route():
+    return jsonify({
+        "llm": llm_backend.stats(),
+        "recommendations": dict(recommendations.stats(), patients=latest_specialists.stats(),
+                                log_dropped=recommendation_log.dropped),
+        "compression": {
+            "enabled": compressor is not None,
+            "encodings": compressor.encodings if compressor else [],
+            "routes": compressor.stats() if compressor else {},
+        }
+    }), 200
+
+
+# -------------------------
+# Admin: LLM usage
+# -------------------------
+LLM_USAGE_DIMENSIONS = {
+    "route": LLMCall.route,
+    "model": LLMCall.model,
+    "day": db.func.date(LLMCall.created_at),
+    "kind": LLMCall.kind,
+    "backend": LLMCall.backend,
+}
+
+@api.route("/admin/llm-usage", methods=["GET"])
+@admin_required
+def admin_llm_usage_route():
+    """
+    Model calls aggregated over the last ?days=N (default 7), grouped by
+    ?group=route,model,day (any of route, model, day, kind, backend).
+    """
+    days = min(max(request.args.get("days", type=int) or 7, 1), 366)
+    group = [g.strip() for g in request.args.get("group", "route,model,day").split(",") if g.strip()]
+    unknown = [g for g in group if g not in LLM_USAGE_DIMENSIONS]
+    if unknown or not group:
+        return jsonify({"message": f"group must be a subset of {', '.join(LLM_USAGE_DIMENSIONS)}"}), 400
+
+    llm_calls.flush()
+    dims = [LLM_USAGE_DIMENSIONS[g].label(g) for g in group]
+    since = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+    rows = (
+        db.session.query(
+            *dims,
+            db.func.count().label("calls"),
+            db.func.sum(db.case((LLMCall.outcome != "ok", 1), else_=0)).label("errors"),
+            db.func.avg(LLMCall.latency_ms).label("avg_latency_ms"),
+            db.func.max(LLMCall.latency_ms).label("max_latency_ms"),
+            db.func.sum(LLMCall.latency_ms).label("total_latency_ms"),
+            db.func.sum(LLMCall.prompt_bytes).label("prompt_bytes"),
+            db.func.sum(LLMCall.image_bytes).label("image_bytes"),
+            db.func.sum(LLMCall.response_bytes).label("response_bytes"),
+            db.func.sum(LLMCall.prompt_tokens).label("prompt_tokens"),
+            db.func.sum(LLMCall.response_tokens).label("response_tokens"),
+        )
+        .filter(LLMCall.created_at >= since)
+        .group_by(*dims)
+        .order_by(db.func.sum(LLMCall.latency_ms).desc())
+        .all()
+    )
+
+    report = []
+    for r in rows:
+        row = r._asdict()
+        row["avg_latency_ms"] = round(float(row["avg_latency_ms"] or 0), 1)
+        if "day" in row:
+            row["day"] = str(row["day"])
+        for k in ("errors", "total_latency_ms", "prompt_bytes", "image_bytes", "response_bytes",
+                  "prompt_tokens", "response_tokens"):
+            row[k] = int(row[k] or 0)
+        row["estimated_cost_usd"] = round(
+            (row["prompt_tokens"] * LLM_PRICE_INPUT_PER_MTOK + row["response_tokens"] * LLM_PRICE_OUTPUT_PER_MTOK) / 1e6, 6
+        )
+        report.append(row)
+
+    return jsonify({
+        "days": days,
+        "group": group,
+        "prices_per_mtok": {"input": LLM_PRICE_INPUT_PER_MTOK, "output": LLM_PRICE_OUTPUT_PER_MTOK},
+        "dropped": llm_calls.dropped,
+        "rows": report,
+    }), 200
+
+
 # register blueprint under /api
 app.register_blueprint(api, url_prefix="/api")
 
@@ -0,0 +1,157 @@
+"""
+Moves past doctor slots, and the appointments booked on them, out of the live
+tables into doctor_slots_archive / appointments_archive.
+
+Slots that ended more than the horizon ago are moved in batches; each batch
+(slots, their appointments, notification back-references) is one
+transaction, so readers never see an appointment without its slot. Only
+settled history moves: a slot stays live while any appointment on it is
+still pending (never accepted or cancelled). The app has no "completed"
+status, so a confirmed appointment whose slot is past the horizon counts
+as completed; its status is kept in appointments_archive.
+
+Ids are kept in the archive, so they must never be handed out again. Without
+AUTOINCREMENT, SQLite gives a new row max(rowid) + 1, which would reuse the
+id of an archived newest row; the newest slot and appointment therefore stay
+live until something newer exists. Run it in-process (ARCHIVE_JOB=true) or
+on a schedule:
+
+    python archive.py [--horizon-days 30] [--batch-size 500]
+"""
+import logging
+import datetime
+import threading
+
+from sqlalchemy import text, bindparam
+
+logger = logging.getLogger("meditrust.archive")
+
+# appointment statuses that no longer change once the slot is over
+SETTLED_STATUSES = ("confirmed", "cancelled")
+
+
+def _in(sql):
+    return text(sql).bindparams(bindparam("ids", expanding=True))
+
+
+class Archiver:
+    def __init__(self, app, db, horizon_days=30, batch_size=500, interval=3600, on_batch=None,
+                 settled_statuses=SETTLED_STATUSES):
+        """on_batch(doctor_ids) runs inside each batch's transaction (e.g. to rebuild counters)."""
+        self.app = app
+        self.db = db
+        self.settled_statuses = tuple(settled_statuses)
+        self.horizon_days = horizon_days
+        self.batch_size = batch_size
+        self.interval = interval
+        self.on_batch = on_batch
+        self._stop = threading.Event()
+        self._thread = None
+
+    def archive_batch(self, cutoff):
+        """
+        Archive up to batch_size slots that ended before cutoff and have only
+        settled appointments. Returns (slots, appointments).
+        """
+        session = self.db.session
+        slot_ids = session.execute(
+            text("""
+                SELECT s.slot_id FROM doctor_slots s
+                WHERE s.slot_end < :cutoff
+                  AND s.slot_id < (SELECT MAX(slot_id) FROM doctor_slots)
+                  AND NOT EXISTS (
+                      SELECT 1 FROM appointments a
+                      WHERE a.slot_id = s.slot_id
+                        AND (COALESCE(a.status, 'pending') NOT IN :settled
+                             OR a.appointment_id = (SELECT MAX(appointment_id) FROM appointments))
+                  )
+                ORDER BY s.slot_end LIMIT :n
+            """).bindparams(bindparam("settled", expanding=True)),
+            {"cutoff": cutoff, "n": self.batch_size, "settled": list(self.settled_statuses)}
+        ).scalars().all()
+        if not slot_ids:
+            return 0, 0
+
+        params = {"ids": slot_ids, "now": datetime.datetime.utcnow()}
+        doctor_ids = session.execute(
+            _in("SELECT DISTINCT doctor_id FROM doctor_slots WHERE slot_id IN :ids"), params
+        ).scalars().all()
+
+        appointments = session.execute(_in("""
+            INSERT INTO appointments_archive
+                (appointment_id, patient_id, doctor_id, slot_id, status,
+                 slot_start, slot_end, created_at, updated_at, archived_at)
+            SELECT a.appointment_id, a.patient_id, a.doctor_id, a.slot_id, a.status,
+                   s.slot_start, s.slot_end, a.created_at, a.updated_at, :now
+            FROM appointments a JOIN doctor_slots s ON s.slot_id = a.slot_id
+            WHERE a.slot_id IN :ids
+        """), params).rowcount
+        # notifications keep their text; the FK can't point into the archive
+        session.execute(_in("""
+            UPDATE notifications SET appointment_id = NULL
+            WHERE appointment_id IN (SELECT appointment_id FROM appointments WHERE slot_id IN :ids)
+        """), params)
+        session.execute(_in("DELETE FROM appointments WHERE slot_id IN :ids"), params)
+
+        session.execute(_in("""
+            INSERT INTO doctor_slots_archive (slot_id, doctor_id, slot_start, slot_end, is_booked, archived_at)
+            SELECT slot_id, doctor_id, slot_start, slot_end, is_booked, :now
+            FROM doctor_slots WHERE slot_id IN :ids
+        """), params)
+        session.execute(_in("DELETE FROM doctor_slots WHERE slot_id IN :ids"), params)
+
+        if self.on_batch:
+            self.on_batch(doctor_ids)
+        session.commit()
+        return len(slot_ids), appointments
+
+    def archive_once(self, horizon_days=None):
+        """Archive everything past the horizon. Returns {"slots": n, "appointments": n}."""
+        days = self.horizon_days if horizon_days is None else horizon_days
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=days)
+        totals = {"slots": 0, "appointments": 0}
+        with self.app.app_context():
+            while True:
+                try:
+                    slots, appointments = self.archive_batch(cutoff)
+                except Exception:
+                    self.db.session.rollback()
+                    raise
+                if not slots:
+                    break
+                totals["slots"] += slots
+                totals["appointments"] += appointments
+                logger.info("archived %d slot(s), %d appointment(s)", slots, appointments)
+        return totals
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            try:
+                self.archive_once()
+            except Exception:
+                logger.exception("Archival run failed")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run_forever, name="archiver", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Archive past slots and appointments.")
+    parser.add_argument("--horizon-days", type=int)
+    parser.add_argument("--batch-size", type=int)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from app import archiver
+    if args.batch_size:
+        archiver.batch_size = args.batch_size
+    print(archiver.archive_once(args.horizon_days))
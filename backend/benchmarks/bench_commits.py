@@ -0,0 +1,143 @@
+"""
+Commits per request on the multi-step write routes: signup, upload (with the
+replayed OCR + analysis pipeline), upload-multiple, booking and cancel.
+
+    python benchmarks/bench_commits.py [--requests 20] [--baseline REF]
+
+Every engine-level COMMIT is counted, including the ones the request makes
+on side connections (LLM telemetry, idempotency keys). The database runs with
+SQLITE_SYNCHRONOUS=FULL, where each WAL commit is one fsync, so commits per
+request is also fsyncs per request. --baseline REF runs the same load against
+backend/ as of a git revision (e.g. HEAD~1) and prints the difference.
+"""
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(BACKEND_DIR)
+IMAGE = os.path.join(BACKEND_DIR, "prescription.jpg")
+ROUTES = ("signup", "signup_doctor", "upload", "upload_multiple", "book", "cancel")
+
+
+def run_load(requests, backend_dir):
+    sys.path.insert(0, backend_dir)
+    import datetime
+    import contextlib
+    with contextlib.redirect_stdout(io.StringIO()):
+        import init_db
+        init_db.init()
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from app import app, db, User, Upload, create_token
+
+    commits = [0]
+    event.listen(Engine, "commit", lambda conn: commits.__setitem__(0, commits[0] + 1))
+    stats = {name: {"n": 0, "commits": 0, "seconds": 0.0, "errors": 0} for name in ROUTES}
+
+    def timed(name, fn):
+        c0, t0 = commits[0], time.perf_counter()
+        r = fn()
+        s = stats[name]
+        s["n"] += 1
+        s["commits"] += commits[0] - c0
+        s["seconds"] += time.perf_counter() - t0
+        s["errors"] += r.status_code >= 400
+        return r
+
+    def auth(email):
+        with app.app_context():
+            return {"Authorization": "Bearer " + create_token(User.query.filter_by(email=email).first())}
+
+    c = app.test_client()
+    for i in range(requests):
+        timed("signup", lambda: c.post("/api/signup", json={
+            "name": "Bench", "email": f"bench-commits{i}@example.com", "password": "pw", "role": "patient"}))
+        timed("signup_doctor", lambda: c.post("/api/signup", json={
+            "name": "Dr Bench", "email": f"bench-commits-dr{i}@example.com", "password": "pw",
+            "role": "doctor", "specialization": "General"}))
+    patient, doctor = auth("bench-commits0@example.com"), auth("bench-commits-dr0@example.com")
+
+    with open(IMAGE, "rb") as f:
+        image = f.read()
+    with app.app_context():
+        first_upload = db.session.query(db.func.max(Upload.upload_id)).scalar() or 0
+    for i in range(requests):
+        timed("upload", lambda: c.post("/api/upload", headers=patient, content_type="multipart/form-data", data={
+            "file": (io.BytesIO(image), "prescription.jpg"), "consent_cloud_ocr": "true"}))
+        timed("upload_multiple", lambda: c.post(
+            "/api/upload-multiple", headers=patient, content_type="multipart/form-data", data={
+                "files": [(io.BytesIO(image), f"page{n}.jpg") for n in range(3)], "consent_cloud_ocr": "true"}))
+
+    start = datetime.datetime.now().replace(microsecond=0) + datetime.timedelta(days=2)
+    for i in range(requests):
+        slot_start = start + datetime.timedelta(minutes=30 * i)
+        slot_id = c.post("/api/doctor/add-slot", headers=doctor, json={
+            "slot_start": slot_start.isoformat(),
+            "slot_end": (slot_start + datetime.timedelta(minutes=30)).isoformat()}).get_json()["slot_id"]
+        r = timed("book", lambda: c.post("/api/appointments", headers=patient, json={"slot_id": slot_id}))
+        appointment_id = r.get_json()["appointment_id"]
+        timed("cancel", lambda: c.post(f"/api/appointments/{appointment_id}/cancel", headers=patient))
+
+    with app.app_context():
+        paths = db.session.query(Upload.file_path).filter(Upload.upload_id > first_upload).all()
+    for (path,) in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    print(json.dumps(stats))
+
+
+def measure(requests, backend_dir):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, SQLITE_SYNCHRONOUS="FULL", LLM_BACKEND="replay", LLM_REPLAY_LATENCY="none",
+                   LLM_FIXTURES_DIR=os.path.join(BACKEND_DIR, "fixtures", "llm"),
+                   DATABASE_URL="sqlite:///" + os.path.join(tmp, "bench.db"))
+        out = subprocess.run(
+            [sys.executable, __file__, "--child", "--requests", str(requests), "--backend", backend_dir],
+            env=env, cwd=backend_dir, capture_output=True, text=True, check=True,
+        ).stdout.strip().splitlines()[-1]
+    return json.loads(out)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20, help="requests per route")
+    parser.add_argument("--baseline", help="git revision to compare against")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--backend", default=BACKEND_DIR, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_load(args.requests, args.backend)
+
+    current = measure(args.requests, BACKEND_DIR)
+    baseline = None
+    if args.baseline:
+        with tempfile.TemporaryDirectory() as tree:
+            archive = subprocess.run(["git", "-C", REPO_DIR, "archive", args.baseline, "backend"],
+                                     capture_output=True, check=True).stdout
+            subprocess.run(["tar", "-x", "-C", tree], input=archive, check=True)
+            baseline = measure(args.requests, os.path.join(tree, "backend"))
+
+    print(f"{args.requests} requests per route, SQLITE_SYNCHRONOUS=FULL (1 fsync per commit), replay backend")
+    for name in ROUTES:
+        s = current[name]
+        line = (f"  {name:<16} commits/req={s['commits'] / s['n']:5.2f}  "
+                f"ms/req={s['seconds'] * 1000 / s['n']:7.1f}  errors={s['errors']}")
+        if baseline:
+            b = baseline[name]
+            line += (f"   {args.baseline}: commits/req={b['commits'] / b['n']:5.2f}  "
+                     f"ms/req={b['seconds'] * 1000 / b['n']:7.1f}  "
+                     f"saved/req={(b['commits'] - s['commits']) / s['n']:5.2f}")
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Serialization cost of large list payloads (slot calendars, doctor lists):
+the old per-row float()/isoformat() + stdlib jsonify path versus
+FastJSONProvider with native datetime/Decimal handling.
+
+    python benchmarks/bench_json.py [--rows 20000] [--repeat 5]
+"""
+import os
+import sys
+import time
+import decimal
+import argparse
+import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from json_provider import FastJSONProvider, ORJSON_AVAILABLE
+
+
+def make_rows(n):
+    start = datetime.datetime(2030, 1, 1, 9, 0)
+    return [{
+        "slot_id": i,
+        "doctor_id": i % 50,
+        "slot_start": start + datetime.timedelta(minutes=30 * i),
+        "slot_end": start + datetime.timedelta(minutes=30 * i + 30),
+        "rating": 4.0 + (i % 10) / 10,
+        "consultation_fee": decimal.Decimal("450.00") + i % 7,
+        "clinic_address": f"Clinic {i % 50}, Pune",
+        "is_booked": i % 3 == 0,
+    } for i in range(n)]
+
+
+def legacy(app, rows):
+    # what the routes did before: convert every row by hand, then stdlib jsonify
+    out = [{
+        **r,
+        "slot_start": r["slot_start"].isoformat(),
+        "slot_end": r["slot_end"].isoformat(),
+        "rating": float(r["rating"] or 0),
+        "consultation_fee": float(r["consultation_fee"] or 0),
+    } for r in rows]
+    return app.json.response(out).get_data()
+
+
+def native(app, rows):
+    return app.json.response(rows).get_data()
+
+
+def timed(fn, app, rows, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        body = fn(app, rows)
+        best = min(best, time.perf_counter() - t0)
+    return best, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    cases = []
+
+    app = Flask("legacy")
+    app.json = DefaultJSONProvider(app)
+    cases.append(("manual conversions + stdlib jsonify", legacy, app))
+
+    app = Flask("stdlib")
+    app.json = FastJSONProvider(app, backend="stdlib")
+    cases.append(("FastJSONProvider (stdlib)", native, app))
+
+    if ORJSON_AVAILABLE:
+        app = Flask("orjson")
+        app.json = FastJSONProvider(app, backend="orjson")
+        cases.append(("FastJSONProvider (orjson)", native, app))
+    else:
+        print("orjson not installed; skipping the orjson backend")
+
+    print(f"{args.rows} rows, best of {args.repeat}")
+    baseline = None
+    for name, fn, case_app in cases:
+        with case_app.app_context():
+            seconds, size = timed(fn, case_app, rows, args.repeat)
+        baseline = baseline or seconds
+        print(f"{name:<38} {seconds * 1000:8.1f} ms  {size / 1024:8.0f} KiB  {baseline / seconds:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Login throughput, and how much a login burst slows down other requests,
+with password verification inline vs. on the bounded hashing pool.
+
+    python benchmarks/bench_login.py [--seconds 10] [--login-threads 16] [--workers 4]
+
+Each configuration runs in a fresh subprocess on a throwaway database since the
+hashing pool is sized at import time.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_load(seconds, login_threads):
+    sys.path.insert(0, BACKEND_DIR)
+    import contextlib, io
+    with contextlib.redirect_stdout(io.StringIO()):
+        import init_db
+        init_db.init()
+    from app import app
+
+    client = app.test_client()
+    emails = []
+    for i in range(login_threads):
+        email = f"bench{i}@example.com"
+        client.post("/api/signup", json={"name": "Bench", "email": email, "password": "pw", "role": "patient"})
+        emails.append(email)
+
+    logins, busy, other_latencies = [0], [0], []
+    lock = threading.Lock()
+    stop = time.monotonic() + seconds
+
+    def login(email):
+        c = app.test_client()
+        while time.monotonic() < stop:
+            r = c.post("/api/login", json={"email": email, "password": "pw"})
+            with lock:
+                if r.status_code == 200:
+                    logins[0] += 1
+                elif r.status_code == 503:
+                    busy[0] += 1
+
+    def other():
+        c = app.test_client()
+        while time.monotonic() < stop:
+            t0 = time.perf_counter()
+            c.get("/api/allergies")
+            with lock:
+                other_latencies.append(time.perf_counter() - t0)
+
+    threads = [threading.Thread(target=login, args=(e,)) for e in emails]
+    threads += [threading.Thread(target=other) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    other_latencies.sort()
+    print(json.dumps({
+        "logins": logins[0],
+        "busy": busy[0],
+        "other_p50_ms": other_latencies[len(other_latencies) // 2] * 1000,
+        "other_p95_ms": other_latencies[int(len(other_latencies) * 0.95)] * 1000,
+        "other_requests": len(other_latencies),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--login-threads", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_load(args.seconds, args.login_threads)
+
+    print(f"{args.login_threads} login threads + 2 threads on GET /api/allergies, {args.seconds:.0f}s per mode")
+    for mode, workers in (("inline", 0), (f"pool ({args.workers} workers)", args.workers)):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, PASSWORD_HASH_WORKERS=str(workers),
+                       DATABASE_URL="sqlite:///" + os.path.join(tmp, "bench.db"))
+            out = subprocess.run(
+                [sys.executable, __file__, "--child", "--seconds", str(args.seconds),
+                 "--login-threads", str(args.login_threads)],
+                env=env, cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+            ).stdout.strip().splitlines()[-1]
+        r = json.loads(out)
+        print(f"{mode:<20} logins/s={r['logins'] / args.seconds:6.1f}  503s={r['busy']:<4} "
+              f"other GET p50={r['other_p50_ms']:6.1f}ms p95={r['other_p95_ms']:6.1f}ms "
+              f"({r['other_requests'] / args.seconds:.0f} req/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Offline load test of the upload -> OCR -> analysis pipeline and the other
+LLM-backed routes, served by the replay backend (no Gemini key needed).
+
+    python benchmarks/bench_pipeline.py [--seconds 10] [--clients 8] \
+        [--latency none --latency lognormal:2000:0.4 ...] [--fixtures DIR]
+
+Each client loops: POST /upload (consented, so OCR + analysis run inline),
+GET /upload/<id>/summary, POST /prescription/<id>/validate and
+POST /symptoms/analyze. Every --latency value (see llm.py for the syntax)
+runs in a fresh subprocess on a throwaway database; "none" isolates the
+server's own overhead from model latency. The shipped fixtures are
+synthetic and carry no latency, so "recorded" only means something with
+fixtures recorded against the live API (LLM_BACKEND=record).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGE = os.path.join(BACKEND_DIR, "prescription.jpg")
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000 if values else 0.0
+
+
+def run_load(seconds, clients):
+    sys.path.insert(0, BACKEND_DIR)
+    import io
+    import contextlib
+    with contextlib.redirect_stdout(io.StringIO()):
+        import init_db
+        init_db.init()
+    from app import app, db, User, Upload, create_token
+
+    signup = app.test_client()
+    for i in range(clients):
+        signup.post("/api/signup", json={"name": "Bench", "email": f"bench{i}@example.com",
+                                         "password": "pw", "role": "patient"})
+    with app.app_context():
+        patients = User.query.filter(User.email.like("bench%@example.com")).all()
+        headers = [{"Authorization": "Bearer " + create_token(p)} for p in patients]
+        first_upload = db.session.query(db.func.max(Upload.upload_id)).scalar() or 0
+    with open(IMAGE, "rb") as f:
+        image = f.read()
+
+    latencies = {"upload": [], "summary": [], "validate": [], "symptoms": []}
+    errors = [0]
+    lock = threading.Lock()
+    stop = time.monotonic() + seconds
+
+    def timed(name, fn):
+        t0 = time.perf_counter()
+        r = fn()
+        with lock:
+            latencies[name].append(time.perf_counter() - t0)
+            if r.status_code >= 400:
+                errors[0] += 1
+        return r
+
+    def client(h):
+        c = app.test_client()
+        while time.monotonic() < stop:
+            r = timed("upload", lambda: c.post("/api/upload", headers=h, content_type="multipart/form-data", data={
+                "file": (io.BytesIO(image), "prescription.jpg"),
+                "consent_cloud_ocr": "true",
+            }))
+            upload_id = (r.get_json() or {}).get("uploadId")
+            if upload_id:
+                timed("summary", lambda: c.get(f"/api/upload/{upload_id}/summary", headers=h))
+                timed("validate", lambda: c.post(f"/api/prescription/{upload_id}/validate", headers=h))
+            timed("symptoms", lambda: c.post("/api/symptoms/analyze", headers=h, json={
+                "symptoms": "fever, sore throat and dry cough for 2 days", "severity": "moderate"
+            }))
+
+    threads = [threading.Thread(target=client, args=(h,)) for h in headers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # uploads are saved under backend/uploads; don't leave benchmark files behind
+    with app.app_context():
+        paths = db.session.query(Upload.file_path).filter(Upload.upload_id > first_upload).all()
+    for (path,) in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    result = {"errors": errors[0]}
+    for name, values in latencies.items():
+        values.sort()
+        result[name] = {"n": len(values), "p50_ms": percentile(values, 0.5), "p95_ms": percentile(values, 0.95)}
+    print(json.dumps(result))
+
+
+def synthetic_fixtures(fixtures_dir):
+    names = [n for n in os.listdir(fixtures_dir) if n.endswith(".json")] if os.path.isdir(fixtures_dir) else []
+    for name in names:
+        with open(os.path.join(fixtures_dir, name), encoding="utf-8") as f:
+            if json.load(f).get("synthetic"):
+                return True
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--latency", action="append", help="replay latency spec; repeatable")
+    parser.add_argument("--fixtures", help="fixture directory (default: LLM_FIXTURES_DIR / backend/fixtures/llm)")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_load(args.seconds, args.clients)
+
+    fixtures_dir = os.path.abspath(args.fixtures) if args.fixtures else \
+        os.environ.get("LLM_FIXTURES_DIR", os.path.join(BACKEND_DIR, "fixtures", "llm"))
+    latencies = args.latency or ["none"]
+    if any("recorded" in spec for spec in latencies) and synthetic_fixtures(fixtures_dir):
+        print(f"warning: {fixtures_dir} has synthetic fixtures with no recorded latency; "
+              "'recorded' replays them instantly")
+
+    print(f"{args.clients} clients, {args.seconds:.0f}s per latency profile, replay backend")
+    for latency in latencies:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, LLM_BACKEND="replay", LLM_REPLAY_LATENCY=latency, LLM_REPLAY_SEED="1",
+                       DATABASE_URL="sqlite:///" + os.path.join(tmp, "bench.db"))
+            if args.fixtures:
+                env["LLM_FIXTURES_DIR"] = os.path.abspath(args.fixtures)
+            out = subprocess.run(
+                [sys.executable, __file__, "--child", "--seconds", str(args.seconds), "--clients", str(args.clients)],
+                env=env, cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+            ).stdout.strip().splitlines()[-1]
+        r = json.loads(out)
+        print(f"latency={latency}  uploads/s={r['upload']['n'] / args.seconds:.1f}  errors={r['errors']}")
+        for name in ("upload", "summary", "validate", "symptoms"):
+            s = r[name]
+            print(f"  {name:<9} n={s['n']:<6} p50={s['p50_ms']:8.1f}ms  p95={s['p95_ms']:8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Mixed read/write load against the SQLite engine, with and without the
+production profile (WAL + pragmas + read-only pool for GET requests).
+
+    python benchmarks/bench_sqlite_concurrency.py [--seconds 10] [--workers 4] [--threads 2] \
+        [--writers 2] [--write-rate 15]
+
+Load comes from separate worker processes sharing one database file, like
+gunicorn workers: --workers reader processes with --threads reader threads
+each, plus --writers writer processes. Within one process the Flask test
+client is serialised by the GIL, so only several processes can show readers
+running alongside a writer. Writers are paced to the same rate in both modes
+so the read numbers are compared under an identical write load. Each mode
+uses a fresh database, because the engine profile is chosen once at import
+time from the environment.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def init_database():
+    sys.path.insert(0, BACKEND_DIR)
+    import contextlib, io
+    with contextlib.redirect_stdout(io.StringIO()):
+        import init_db
+        init_db.init()
+
+
+def run_worker(role, seconds, threads, write_rate, index):
+    sys.path.insert(0, BACKEND_DIR)
+    from app import app, User, create_token
+
+    # writers add slots to a different doctor so the read payload stays constant
+    with app.app_context():
+        read_doctor, write_doctor = User.query.filter_by(role="doctor").order_by(User.user_id).limit(2).all()
+        read_headers = {"Authorization": "Bearer " + create_token(read_doctor)}
+        write_headers = {"Authorization": "Bearer " + create_token(write_doctor)}
+        doctor_id = read_doctor.user_id
+
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def reader():
+        client = app.test_client()
+        while time.monotonic() < stop:
+            r = client.get(f"/api/doctor/{doctor_id}/slots", headers=read_headers)
+            with lock:
+                counts["reads" if r.status_code == 200 else "errors"] += 1
+
+    def writer():
+        client = app.test_client()
+        minute = 0
+        next_at = time.monotonic()
+        while time.monotonic() < stop:
+            next_at += 1.0 / write_rate
+            time.sleep(max(0.0, next_at - time.monotonic()))
+            minute += 1
+            # one day per writer process so their slots never collide
+            r = client.post("/api/doctor/add-slot", headers=write_headers, json={
+                "slot_start": f"2031-01-{index + 1:02d}T{(minute // 60) % 24:02d}:{minute % 60:02d}:00",
+                "slot_end": f"2031-01-{index + 1:02d}T{(minute // 60) % 24:02d}:{minute % 60:02d}:30",
+            })
+            with lock:
+                counts["writes" if r.status_code == 201 else "errors"] += 1
+
+    # imports are done: tell the parent, then start together on its signal
+    print("ready", flush=True)
+    sys.stdin.readline()
+    stop = time.monotonic() + seconds
+
+    target = reader if role == "reader" else writer
+    workers = [threading.Thread(target=target) for _ in range(threads if role == "reader" else 1)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    print(json.dumps(counts), flush=True)
+
+
+def run_mode(tuning, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, SQLITE_TUNING=tuning, PYTHONWARNINGS="ignore",
+                   DATABASE_URL="sqlite:///" + os.path.join(tmp, "bench.db"))
+        subprocess.run([sys.executable, __file__, "--child", "init"],
+                       env=env, cwd=BACKEND_DIR, capture_output=True, check=True)
+
+        roles = [("reader", i) for i in range(args.workers)] + [("writer", i) for i in range(args.writers)]
+        procs = [subprocess.Popen(
+            [sys.executable, __file__, "--child", role, "--index", str(i), "--seconds", str(args.seconds),
+             "--threads", str(args.threads), "--write-rate", str(args.write_rate)],
+            env=env, cwd=BACKEND_DIR, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+        ) for role, i in roles]
+        for p in procs:
+            if p.stdout.readline().strip() != "ready":
+                raise RuntimeError("worker failed to start")
+        for p in procs:
+            p.stdin.write("go\n")
+            p.stdin.flush()
+
+        total = {"reads": 0, "writes": 0, "errors": 0}
+        for p in procs:
+            out, _ = p.communicate()
+            if p.returncode:
+                raise RuntimeError(f"worker exited with {p.returncode}")
+            for key, value in json.loads(out.strip().splitlines()[-1]).items():
+                total[key] += value
+        return total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--workers", type=int, default=4, help="reader processes")
+    parser.add_argument("--threads", type=int, default=2, help="reader threads per process")
+    parser.add_argument("--writers", type=int, default=2, help="writer processes")
+    parser.add_argument("--write-rate", type=float, default=15, help="writes/s per writer process")
+    parser.add_argument("--child", choices=("init", "reader", "writer"), help=argparse.SUPPRESS)
+    parser.add_argument("--index", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child == "init":
+        return init_database()
+    if args.child:
+        return run_worker(args.child, args.seconds, args.threads, args.write_rate, args.index)
+
+    print(f"{args.workers} reader processes x {args.threads} threads / {args.writers} writer processes "
+          f"at {args.write_rate:g} writes/s each, {args.seconds:.0f}s per mode, {os.cpu_count()} CPUs")
+    if (os.cpu_count() or 1) < 2:
+        print("warning: a single CPU serialises the workers; the modes will look alike")
+    results = {}
+    for mode, tuning in (("default", "false"), ("wal+read-pool", "true")):
+        counts = run_mode(tuning, args)
+        results[mode] = counts
+        print(f"{mode:<15} reads/s={counts['reads'] / args.seconds:8.1f}  "
+              f"writes/s={counts['writes'] / args.seconds:7.1f}  errors={counts['errors']}")
+
+    base = results["default"]["reads"] or 1
+    print(f"read throughput gain: {results['wal+read-pool']['reads'] / base:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Response compression for the JSON API.
+
+An after_request hook picks br (if the brotli package is installed) or gzip
+from Accept-Encoding and compresses bodies of at least min_size bytes.
+Buffered responses are compressed in one call; streamed responses are
+wrapped so each chunk is compressed and flushed as it is produced. Skipped:
+responses that already carry a Content-Encoding, file downloads
+(direct_passthrough, e.g. send_from_directory), Server-Sent Events,
+already-compressed content types and excluded endpoints.
+
+Raw vs. sent bytes are tallied per route rule for /api/admin/metrics.
+"""
+import gzip
+import zlib
+import threading
+
+from flask import request
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except Exception:
+    BROTLI_AVAILABLE = False
+
+# content types that are already compressed (or must not be buffered)
+SKIP_TYPES = ("image/", "video/", "audio/", "text/event-stream")
+SKIP_MIMETYPES = {
+    "application/pdf", "application/zip", "application/gzip", "application/x-gzip",
+    "application/x-7z-compressed", "application/x-rar-compressed", "application/octet-stream",
+}
+
+
+class _GzipStream:
+    def __init__(self, level):
+        self._z = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+
+    def compress(self, chunk):
+        return self._z.compress(chunk) + self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._z.flush(zlib.Z_FINISH)
+
+
+class _BrotliStream:
+    def __init__(self, quality):
+        self._c = brotli.Compressor(quality=quality)
+
+    def compress(self, chunk):
+        return self._c.process(chunk) + self._c.flush()
+
+    def finish(self):
+        return self._c.finish()
+
+
+class Compressor:
+    def __init__(self, app, min_size=1024, gzip_level=6, brotli_quality=4, exclude_endpoints=()):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.exclude_endpoints = set(exclude_endpoints)
+        self.encodings = (["br"] if BROTLI_AVAILABLE else []) + ["gzip"]
+        self._lock = threading.Lock()
+        self._routes = {}  # rule -> [responses, raw bytes, sent bytes]
+        app.after_request(self.after_request)
+
+    # ---------- METRICS ----------
+    def _record(self, route, raw, sent):
+        with self._lock:
+            entry = self._routes.setdefault(route, [0, 0, 0])
+            entry[0] += 1
+            entry[1] += raw
+            entry[2] += sent
+
+    def stats(self):
+        """{route: {responses, bytes_in, bytes_out, bytes_saved}}, largest saving first."""
+        with self._lock:
+            rows = [(route, *entry) for route, entry in self._routes.items()]
+        rows.sort(key=lambda r: r[2] - r[3], reverse=True)
+        return {
+            route: {"responses": n, "bytes_in": raw, "bytes_out": sent, "bytes_saved": raw - sent}
+            for route, n, raw, sent in rows
+        }
+
+    # ---------- NEGOTIATION ----------
+    def _skip(self, response):
+        if response.status_code < 200 or response.status_code in (204, 206, 304):
+            return True
+        if request.method == "HEAD" or "Content-Encoding" in response.headers:
+            return True
+        if response.direct_passthrough or request.endpoint in self.exclude_endpoints:
+            return True
+        mimetype = response.mimetype or ""
+        return mimetype.startswith(SKIP_TYPES) or mimetype in SKIP_MIMETYPES
+
+    def _stream(self, encoding):
+        if encoding == "br":
+            return _BrotliStream(self.brotli_quality)
+        return _GzipStream(self.gzip_level)
+
+    def after_request(self, response):
+        if self._skip(response):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = request.accept_encodings.best_match(self.encodings)
+        if not encoding:
+            return response
+
+        route = request.url_rule.rule if request.url_rule else request.path
+        if response.is_streamed:
+            response.response = self._compress_iter(response.response, encoding, route)
+            response.headers.pop("Content-Length", None)
+        else:
+            body = response.get_data()
+            if len(body) < self.min_size:
+                return response
+            if encoding == "br":
+                data = brotli.compress(body, quality=self.brotli_quality)
+            else:
+                data = gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+            response.set_data(data)
+            self._record(route, len(body), len(data))
+
+        response.headers["Content-Encoding"] = encoding
+        if response.headers.get("ETag"):
+            # the compressed representation is not byte-identical
+            response.set_etag(response.get_etag()[0], weak=True)
+        return response
+
+    def _compress_iter(self, chunks, encoding, route):
+        stream = self._stream(encoding)
+        raw = sent = 0
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode("utf-8")
+                if not chunk:
+                    continue
+                out = stream.compress(chunk)
+                raw, sent = raw + len(chunk), sent + len(out)
+                yield out
+            out = stream.finish()
+            sent += len(out)
+            yield out
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+            self._record(route, raw, sent)
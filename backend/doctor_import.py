@@ -0,0 +1,232 @@
+"""
+Streaming bulk import of the doctor directory (CSV or JSON Lines).
+
+Rows are parsed and validated one at a time and written in chunks: one
+`SELECT email ... WHERE lower(email) IN (...)` per chunk to skip emails
+already registered in any letter case, then the chunk's users and doctors
+rows are inserted and committed together. Emails are stored as given, since
+signup and login match them exactly. Memory stays bounded by the chunk size
+regardless of file size.
+
+Columns (CSV header or JSON keys):
+    name, email, specialization            required
+    phone, city, pincode, bio, clinic_address
+    years_experience, rating, consultation_fee, verified
+    languages        JSON list, or "Marathi|English"
+    password_hash    pre-hashed (preferred for large files)
+    password         plaintext; hashed on import, which is slow per row
+Rows without a password get a disabled login until one is set.
+
+    python doctor_import.py doctors.csv [--format csv|jsonl] [--chunk-size 500]
+"""
+import io
+import csv
+import sys
+import json
+import time
+import secrets
+import decimal
+import functools
+
+MAX_REPORTED_ERRORS = 1000
+
+
+def iter_records(stream, fmt):
+    """Yield (line_no, record, error) from a binary stream without reading it all."""
+    text_stream = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text_stream)
+        for record in reader:
+            yield reader.line_num, record, None
+        return
+
+    for line_no, line in enumerate(text_stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, None, f"invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line_no, None, "expected a JSON object"
+            continue
+        yield line_no, record, None
+
+
+def _str(record, key, size):
+    value = record.get(key)
+    if value is None:
+        return None
+    value = str(value).strip()
+    if len(value) > size:
+        raise ValueError(f"{key} longer than {size} characters")
+    return value or None
+
+
+def validate(record):
+    """Return a cleaned dict for one doctor, or raise ValueError."""
+    clean = {
+        "name": _str(record, "name", 100),
+        "email": _str(record, "email", 150),
+        "specialization": _str(record, "specialization", 100),
+        "phone": _str(record, "phone", 20),
+        "city": _str(record, "city", 100),
+        "pincode": _str(record, "pincode", 10),
+        "bio": _str(record, "bio", 10000),
+        "clinic_address": _str(record, "clinic_address", 10000),
+        "password": record.get("password") or None,
+        "password_hash": _str(record, "password_hash", 255),
+    }
+    for key in ("name", "email", "specialization"):
+        if not clean[key]:
+            raise ValueError(f"missing {key}")
+    if "@" not in clean["email"]:
+        raise ValueError("invalid email")
+
+    try:
+        clean["years_experience"] = int(record.get("years_experience") or 0)
+        clean["rating"] = float(record.get("rating") or 0)
+        fee = record.get("consultation_fee")
+        clean["consultation_fee"] = decimal.Decimal(str(fee)) if fee not in (None, "") else None
+    except (ValueError, decimal.InvalidOperation):
+        raise ValueError("years_experience, rating and consultation_fee must be numbers")
+
+    verified = record.get("verified")
+    clean["verified"] = str(verified).strip().lower() in ("1", "true", "yes") if verified is not None else False
+
+    languages = record.get("languages") or []
+    if isinstance(languages, str):
+        languages = json.loads(languages) if languages.strip().startswith("[") else languages.split("|")
+    clean["languages"] = json.dumps([str(lang).strip() for lang in languages if str(lang).strip()])
+    return clean
+
+
+class DoctorImporter:
+    def __init__(self, db, User, Doctor, hash_password, chunk_size=500, on_progress=None):
+        self.db = db
+        self.User = User
+        self.Doctor = Doctor
+        self.hash_password = hash_password
+        self.chunk_size = chunk_size
+        self.on_progress = on_progress
+        self.report = {"processed": 0, "imported": 0, "duplicates": 0, "failed": 0, "errors": []}
+
+    def _error(self, line_no, message):
+        self.report["failed"] += 1
+        if len(self.report["errors"]) < MAX_REPORTED_ERRORS:
+            self.report["errors"].append({"line": line_no, "error": message})
+
+    def run(self, records):
+        started = time.monotonic()
+        chunk = []
+        for line_no, record, error in records:
+            self.report["processed"] += 1
+            if error:
+                self._error(line_no, error)
+                continue
+            try:
+                chunk.append((line_no, validate(record)))
+            except (ValueError, TypeError) as e:
+                self._error(line_no, str(e))
+                continue
+            if len(chunk) >= self.chunk_size:
+                self._write_chunk(chunk)
+                chunk = []
+        if chunk:
+            self._write_chunk(chunk)
+
+        self.report["elapsed_seconds"] = round(time.monotonic() - started, 3)
+        return self.report
+
+    def _write_chunk(self, chunk):
+        User, Doctor, session = self.User, self.Doctor, self.db.session
+
+        emails = {row["email"].lower() for _, row in chunk}
+        existing = {email.lower() for (email,) in
+                    session.query(User.email).filter(self.db.func.lower(User.email).in_(emails))}
+
+        users, details = [], []
+        for line_no, row in chunk:
+            key = row["email"].lower()
+            if key in existing:
+                self.report["duplicates"] += 1
+                continue
+            existing.add(key)  # duplicates inside the same chunk
+
+            if row["password_hash"]:
+                pw_hash = row["password_hash"]
+            elif row["password"]:
+                try:
+                    pw_hash = self.hash_password(row["password"])
+                except Exception as e:
+                    self._error(line_no, f"password hashing failed: {e.__class__.__name__}")
+                    existing.discard(key)
+                    continue
+            else:
+                pw_hash = "!" + secrets.token_hex(16)  # never matches check_password_hash
+
+            users.append(User(
+                name=row["name"], email=row["email"], phone=row["phone"],
+                city=row["city"], pincode=row["pincode"],
+                password_hash=pw_hash, role="doctor"
+            ))
+            details.append((line_no, row))
+
+        if not users:
+            self._progress()
+            return
+
+        try:
+            session.add_all(users)
+            session.flush()
+            session.add_all([
+                Doctor(
+                    doctor_id=user.user_id,
+                    specialization=row["specialization"],
+                    years_experience=row["years_experience"],
+                    rating=row["rating"],
+                    bio=row["bio"],
+                    clinic_address=row["clinic_address"],
+                    languages=row["languages"],
+                    consultation_fee=row["consultation_fee"],
+                    verified=row["verified"]
+                )
+                for user, (_, row) in zip(users, details)
+            ])
+            session.commit()
+            self.report["imported"] += len(users)
+        except Exception as e:
+            session.rollback()
+            for line_no, _ in details:
+                self._error(line_no, f"chunk rolled back: {e.__class__.__name__}")
+        self._progress()
+
+    def _progress(self):
+        if self.on_progress:
+            self.on_progress(self.report)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Bulk import doctors from CSV or JSON Lines.")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=("csv", "jsonl"))
+    parser.add_argument("--chunk-size", type=int, default=500)
+    args = parser.parse_args()
+
+    fmt = args.format or ("jsonl" if args.path.endswith((".jsonl", ".ndjson")) else "csv")
+
+    from app import app, db, User, Doctor, hash_password
+
+    def progress(report):
+        print(f"  processed={report['processed']} imported={report['imported']} "
+              f"duplicates={report['duplicates']} failed={report['failed']}", file=sys.stderr)
+
+    with app.app_context(), open(args.path, "rb") as f:
+        importer = DoctorImporter(db, User, Doctor, functools.partial(hash_password, wait=None),
+                              args.chunk_size, on_progress=progress)
+        report = importer.run(iter_records(f, fmt))
+    print(json.dumps(report, indent=2))
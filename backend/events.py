@@ -0,0 +1,65 @@
+"""
+In-process pub/sub for upload processing events, consumed by the
+server-sent events stream in app.py.
+
+Events are kept in a bounded history so a reconnecting client can resume from
+the last event id it saw. The broker and its ids are per process: with several
+gunicorn workers a client only sees uploads processed by the worker serving its
+stream, so deploy one gthread worker with several threads (see DEPLOYMENT.md).
+"""
+import json
+import queue
+import threading
+from collections import deque
+
+
+class EventBroker:
+    def __init__(self, history_size=1000, queue_size=100):
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._history = deque(maxlen=history_size)
+        self._subscribers = {}  # user_id -> set of queues
+        self._queue_size = queue_size
+
+    def publish(self, user_id, event, data):
+        """Record an event for user_id and push it to any open streams."""
+        with self._lock:
+            item = (self._next_id, user_id, event, data)
+            self._next_id += 1
+            self._history.append(item)
+            subscribers = list(self._subscribers.get(user_id, ()))
+
+        for q in subscribers:
+            try:
+                q.put_nowait(item)
+            except queue.Full:
+                # a stalled client; it can catch up via Last-Event-ID on reconnect
+                pass
+        return item[0]
+
+    def subscribe(self, user_id, last_event_id=None):
+        """
+        Returns (queue, backlog). The backlog holds the user's events newer than
+        last_event_id that are still in history, oldest first.
+        """
+        q = queue.Queue(maxsize=self._queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(q)
+            backlog = []
+            if last_event_id is not None:
+                backlog = [item for item in self._history
+                           if item[1] == user_id and item[0] > last_event_id]
+        return q, backlog
+
+    def unsubscribe(self, user_id, q):
+        with self._lock:
+            subs = self._subscribers.get(user_id)
+            if subs:
+                subs.discard(q)
+                if not subs:
+                    del self._subscribers[user_id]
+
+
+def format_sse(item):
+    event_id, _, event, data = item
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
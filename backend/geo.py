@@ -0,0 +1,165 @@
+"""
+Pincode proximity search for doctor recommendations.
+
+Pincodes are resolved to coordinates from a bundled CSV (data/pincodes.csv:
+approximate post-office centroids for the seeded cities; point PINCODE_DATA at
+a full India Post directory for production). Doctors are placed at their
+pincode and kept in an array-backed k-d tree over unit-sphere (x, y, z)
+points, so nearest-neighbour order is exact great-circle order without any
+per-query trigonometry.
+"""
+import csv
+import math
+import heapq
+import threading
+import time
+from array import array
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def _to_xyz(lat, lon):
+    lat, lon = math.radians(lat), math.radians(lon)
+    cos_lat = math.cos(lat)
+    return cos_lat * math.cos(lon), cos_lat * math.sin(lon), math.sin(lat)
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+def load_pincodes(path):
+    """pincode -> (lat, lon). A missing file just disables proximity search."""
+    table = {}
+    try:
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                try:
+                    table[row["pincode"].strip()] = (float(row["latitude"]), float(row["longitude"]))
+                except (KeyError, ValueError, AttributeError):
+                    continue
+    except FileNotFoundError:
+        pass
+    return table
+
+
+# ---------- K-D TREE ----------
+class KDTree:
+    """
+    Static 3-d tree stored as flat arrays: the subtree for [lo, hi) has its
+    root at (lo + hi) // 2 and splits on axis depth % 3.
+    """
+    def __init__(self, points, payloads):
+        order = list(range(len(points)))
+        self._build(points, order, 0, len(order), 0)
+        self.coords = array("d")
+        for i in order:
+            self.coords.extend(points[i])
+        self.payloads = [payloads[i] for i in order]
+
+    def __len__(self):
+        return len(self.payloads)
+
+    @classmethod
+    def _build(cls, points, order, lo, hi, depth):
+        if hi - lo <= 1:
+            return
+        axis = depth % 3
+        order[lo:hi] = sorted(order[lo:hi], key=lambda i: points[i][axis])
+        mid = (lo + hi) // 2
+        cls._build(points, order, lo, mid, depth + 1)
+        cls._build(points, order, mid + 1, hi, depth + 1)
+
+    def nearest(self, point, k, accept=None):
+        """
+        Up to k (chord_distance, payload) pairs closest to point, nearest first.
+        accept(payload) filters candidates without affecting pruning.
+        """
+        coords, payloads = self.coords, self.payloads
+        px, py, pz = point
+        best = []  # max-heap of (-dist2, index)
+
+        def visit(lo, hi, depth):
+            if lo >= hi:
+                return
+            mid = (lo + hi) // 2
+            base = mid * 3
+            dx, dy, dz = coords[base] - px, coords[base + 1] - py, coords[base + 2] - pz
+            d2 = dx * dx + dy * dy + dz * dz
+            if (len(best) < k or d2 < -best[0][0]) and (accept is None or accept(payloads[mid])):
+                if len(best) < k:
+                    heapq.heappush(best, (-d2, mid))
+                else:
+                    heapq.heapreplace(best, (-d2, mid))
+
+            diff = (dx, dy, dz)[depth % 3]
+            near, far = ((lo, mid), (mid + 1, hi)) if diff > 0 else ((mid + 1, hi), (lo, mid))
+            visit(near[0], near[1], depth + 1)
+            if len(best) < k or diff * diff < -best[0][0]:
+                visit(far[0], far[1], depth + 1)
+
+        if k > 0:
+            visit(0, len(payloads), 0)
+        return [(math.sqrt(-d2), payloads[i]) for d2, i in sorted(best, reverse=True)]
+
+
+# ---------- DOCTOR LOCATOR ----------
+class DoctorLocator:
+    """
+    Lazily (re)built tree of doctor locations. load_doctors() returns
+    (doctor_id, pincode, specialization, specialty_id, rating) rows; call
+    invalidate() when doctors or their pincodes change. max_age bounds
+    staleness across processes.
+    """
+    def __init__(self, pincodes, load_doctors, max_age=300):
+        self.pincodes = pincodes
+        self.load_doctors = load_doctors
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._tree = None
+        self._built_at = 0.0
+
+    def invalidate(self):
+        self._tree = None
+
+    def locate(self, pincode):
+        latlon = self.pincodes.get((pincode or "").strip())
+        return _to_xyz(*latlon) if latlon else None
+
+    def _current_tree(self):
+        tree = self._tree
+        if tree is not None and time.monotonic() - self._built_at < self.max_age:
+            return tree
+        with self._lock:
+            if self._tree is None or time.monotonic() - self._built_at >= self.max_age:
+                points, payloads = [], []
+                for doctor_id, pincode, specialization, specialty_id, rating in self.load_doctors():
+                    point = self.locate(pincode)
+                    if point is None:
+                        continue
+                    points.append(point)
+                    payloads.append((doctor_id, (specialization or "").lower(), specialty_id, rating or 0))
+                self._tree = KDTree(points, payloads)
+                self._built_at = time.monotonic()
+            return self._tree
+
+    def nearest(self, pincode, k, specialist=None, specialty_id=None):
+        """
+        [(doctor_id, distance_km)] for the k doctors nearest to pincode with the
+        given canonical specialty_id (or, failing that, whose specialization
+        contains specialist), ranked by distance then rating.
+        Returns None when the pincode is unknown.
+        """
+        origin = self.locate(pincode)
+        if origin is None:
+            return None
+        needle = (specialist or "").lower()
+        if specialty_id:
+            accept = lambda p: p[2] == specialty_id
+        elif needle:
+            accept = lambda p: needle in p[1]
+        else:
+            accept = None
+        hits = self._current_tree().nearest(origin, k, accept)
+        ranked = sorted(hits, key=lambda h: (round(h[0], 9), -h[1][3]))
+        return [(payload[0], round(chord_to_km(chord), 2)) for chord, payload in ranked]
@@ -0,0 +1,129 @@
+"""
+Idempotency-Key support for expensive POST routes (uploads, booking).
+
+The first request with a given (user, key) claims a row in idempotency_keys
+by inserting it on its own connection, so concurrent retries in any worker
+see the claim at once. When the request finishes, its status and body are
+stored on that row. A retry with the same key then gets:
+
+    stored response         if the first request has finished
+    the same, after waiting if it is still running (up to wait_seconds)
+    409 + Retry-After       if it is still running after that
+    422                     if the key was used for a different request
+
+5xx responses and exceptions release the claim so the client can retry for
+real. Rows expire after ttl_seconds; a claim left behind by a crashed
+worker can be taken over after lock_seconds.
+"""
+import time
+import hashlib
+import datetime
+
+from sqlalchemy import select, insert, update, delete
+from sqlalchemy.exc import IntegrityError
+
+IN_PROGRESS = "in_progress"
+DONE = "done"
+
+
+def request_fingerprint(request):
+    """sha256 over method, path, query, form fields, file names/contents and raw JSON body."""
+    h = hashlib.sha256()
+    h.update(f"{request.method} {request.path}?{request.query_string.decode('latin-1')}\n".encode("utf-8"))
+    if request.mimetype == "multipart/form-data" or request.mimetype == "application/x-www-form-urlencoded":
+        for name, value in sorted(request.form.items(multi=True)):
+            h.update(f"form:{name}={value}\n".encode("utf-8"))
+        for name, storage in sorted(request.files.items(multi=True), key=lambda kv: (kv[0], kv[1].filename or "")):
+            h.update(f"file:{name}={storage.filename}\n".encode("utf-8"))
+            stream = storage.stream
+            pos = stream.tell()
+            for chunk in iter(lambda: stream.read(65536), b""):
+                h.update(chunk)
+            stream.seek(pos)
+    else:
+        h.update(request.get_data(cache=True))
+    return h.hexdigest()
+
+
+class Conflict(Exception):
+    def __init__(self, status, message, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+
+
+class IdempotencyStore:
+    def __init__(self, engine, table, ttl_seconds=86400, wait_seconds=30, lock_seconds=600,
+                 poll_seconds=0.25, purge_interval=300):
+        self.engine = engine  # callable -> Engine
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+        self.wait_seconds = wait_seconds
+        self.lock_seconds = lock_seconds
+        self.poll_seconds = poll_seconds
+        self.purge_interval = purge_interval
+        self._last_purge = 0.0
+
+    def _where(self, user_id, key):
+        t = self.table.c
+        return (t.user_id == user_id) & (t.idempotency_key == key)
+
+    def purge_expired(self):
+        if time.monotonic() - self._last_purge < self.purge_interval:
+            return
+        self._last_purge = time.monotonic()
+        with self.engine().begin() as conn:
+            conn.execute(delete(self.table).where(self.table.c.expires_at < datetime.datetime.utcnow()))
+
+    def claim(self, user_id, key, endpoint, fingerprint):
+        """
+        Returns None when this request now owns the key, or the stored row
+        (status, body, mimetype) to replay. Raises Conflict otherwise.
+        """
+        self.purge_expired()
+        give_up = time.monotonic() + self.wait_seconds
+        while True:
+            now = datetime.datetime.utcnow()
+            try:
+                with self.engine().begin() as conn:
+                    conn.execute(insert(self.table).values(
+                        user_id=user_id, idempotency_key=key, endpoint=endpoint, fingerprint=fingerprint,
+                        state=IN_PROGRESS, created_at=now,
+                        expires_at=now + datetime.timedelta(seconds=self.ttl_seconds),
+                    ))
+                return None
+            except IntegrityError:
+                pass
+
+            with self.engine().begin() as conn:
+                row = conn.execute(select(self.table).where(self._where(user_id, key))).mappings().first()
+                if row is None:
+                    continue  # released between our insert and read
+                stale = row["expires_at"] < now or (
+                    row["state"] == IN_PROGRESS
+                    and row["created_at"] < now - datetime.timedelta(seconds=self.lock_seconds)
+                )
+                if stale:
+                    conn.execute(delete(self.table).where(
+                        self._where(user_id, key) & (self.table.c.created_at == row["created_at"])
+                    ))
+                    continue
+
+            if row["fingerprint"] != fingerprint or row["endpoint"] != endpoint:
+                raise Conflict(422, "Idempotency-Key was already used for a different request")
+            if row["state"] == DONE:
+                return row
+            if time.monotonic() >= give_up:
+                raise Conflict(409, "A request with this Idempotency-Key is still in progress", retry_after=1)
+            time.sleep(self.poll_seconds)
+
+    def complete(self, user_id, key, status, body, mimetype):
+        with self.engine().begin() as conn:
+            conn.execute(update(self.table).where(self._where(user_id, key)).values(
+                state=DONE, response_status=status, response_body=body, response_mimetype=mimetype,
+            ))
+
+    def release(self, user_id, key):
+        with self.engine().begin() as conn:
+            conn.execute(delete(self.table).where(self._where(user_id, key) & (self.table.c.state == IN_PROGRESS)))
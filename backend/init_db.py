@@ -7,6 +7,7 @@ import os
 import json
 import datetime
 from app import app, db, User, Doctor, DoctorSlot
+from migrate import upgrade
 from sqlalchemy import text, event, inspect
 from werkzeug.security import generate_password_hash
 
@@ -78,6 +79,9 @@ def init():
 
         db.session.commit()
 
+        # Indexes and any later schema steps; stamps schema_migrations on fresh DBs
+        upgrade(db.engine)
+
         # ---- SEED DATA ----
         # Only seed if the users table is empty
         user_count = db.session.execute(text("SELECT COUNT(*) FROM users")).scalar()
@@ -0,0 +1,58 @@
+"""
+Flask JSON provider used for every API response.
+
+Serializes with orjson when it is installed and falls back to the stdlib
+encoder otherwise. Either way datetimes/dates come out as ISO 8601 strings,
+Decimal columns (consultation_fee) as numbers and SQLAlchemy row mappings as
+objects, so routes can hand column values straight to jsonify().
+"""
+import json
+import decimal
+import datetime
+from collections.abc import Mapping
+
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def _default(o):
+    if isinstance(o, decimal.Decimal):
+        return float(o)
+    if isinstance(o, (datetime.datetime, datetime.date, datetime.time)):
+        return o.isoformat()
+    if isinstance(o, Mapping):
+        return dict(o)
+    if isinstance(o, (set, frozenset, tuple)):
+        return list(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+class FastJSONProvider(JSONProvider):
+    mimetype = "application/json"
+
+    def __init__(self, app, backend="orjson"):
+        super().__init__(app)
+        self.use_orjson = backend == "orjson" and ORJSON_AVAILABLE
+
+    def dumps_bytes(self, obj) -> bytes:
+        if self.use_orjson:
+            # int keys (id -> object maps) are allowed, like the stdlib encoder
+            return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(obj, default=_default, separators=(",", ":")).encode("utf-8")
+
+    def dumps(self, obj, **kwargs) -> str:
+        return self.dumps_bytes(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if self.use_orjson:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b"\n", mimetype=self.mimetype)
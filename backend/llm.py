@@ -0,0 +1,485 @@
+"""
+Pluggable inference backend for the Gemini calls (prescription OCR and
+analysis, symptom analysis, prescription validation).
+
+    live    google.generativeai, as before
+    record  live, plus every prompt/response written to a fixture file
+    replay  serves recorded fixtures, no network, with synthetic latency
+
+Fixtures are one JSON file per call in LLM_FIXTURES_DIR, named
+<kind>-<key>.json where key hashes the model and the prompt (inline image
+bytes are hashed, not stored). Replay looks up the exact key first; for
+prompts it has never seen (a new upload during a load test) it serves a
+fixture of the same kind, chosen deterministically from the key.
+
+The fixtures shipped in backend/fixtures/llm are synthetic ("synthetic":
+true): real prompts for prescription.jpg, hand-written responses, and no
+measured latency or token usage. Record your own with LLM_BACKEND=record for
+real ones.
+
+Replay latency (LLM_REPLAY_LATENCY) is a comma-separated list of
+[kind=]distribution, a bare distribution applying to every kind:
+
+    recorded                  the latency measured when recording (default;
+                              0 for fixtures without one, e.g. synthetic ones)
+    none | fixed:MS
+    uniform:LO_MS:HI_MS
+    normal:MEAN_MS:SD_MS
+    lognormal:MEDIAN_MS:SIGMA
+
+e.g. "ocr=lognormal:1800:0.4,analysis=lognormal:2500:0.5,fixed:900"
+
+MeteredBackend wraps any backend and reports one row per call (sizes,
+tokens, wall time, outcome) to a CallLog, which buffers rows in memory and
+writes them to llm_calls in batches.
+
+HedgedBackend bounds calls by a per-route policy: a deadline measured from
+the start of the HTTP request, a per-call timeout, and optionally a hedged
+duplicate sent once the call has run longer than the recent p95 for its
+kind. The first successful response wins; past the deadline the caller gets
+DeadlineExceeded while the abandoned call finishes on the pool.
+"""
+import os
+import json
+import math
+import time
+import random
+import base64
+import hashlib
+import threading
+import datetime
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class FixtureMissing(RuntimeError):
+    """Replay has no fixture for this kind of call."""
+
+
+class DeadlineExceeded(RuntimeError):
+    """The call did not finish within the route's deadline."""
+
+
+class LLMResponse:
+    __slots__ = ("text", "usage", "latency")
+
+    def __init__(self, text, usage=None, latency=0.0):
+        self.text = text
+        self.usage = usage      # {"prompt_tokens", "response_tokens", "total_tokens"} when reported
+        self.latency = latency  # seconds spent in the backend
+
+
+def redact(contents):
+    """Prompt contents with inline image data replaced by its sha256 and size."""
+    if isinstance(contents, dict):
+        out = {}
+        for k, v in contents.items():
+            if k == "inline_data" and isinstance(v, dict) and "data" in v:
+                raw = v["data"]
+                raw = base64.b64decode(raw) if isinstance(raw, str) else raw
+                out[k] = {**{kk: vv for kk, vv in v.items() if kk != "data"},
+                          "sha256": hashlib.sha256(raw).hexdigest(), "bytes": len(raw)}
+            else:
+                out[k] = redact(v)
+        return out
+    if isinstance(contents, (list, tuple)):
+        return [redact(c) for c in contents]
+    return contents
+
+
+def fixture_key(model, prompt):
+    blob = json.dumps({"model": model, "prompt": prompt}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:24]
+
+
+# ---------- BACKENDS ----------
+class LiveBackend:
+    name = "live"
+
+    def __init__(self, genai, model):
+        """genai: the configured google.generativeai module, or None when unavailable."""
+        self.genai = genai
+        self.model = model
+
+    @property
+    def available(self):
+        return self.genai is not None
+
+    def generate(self, contents, kind="generic", timeout=None):
+        if self.genai is None:
+            raise RuntimeError("Gemini not configured on server (GEMINI_API_KEY missing or package unavailable)")
+        started = time.perf_counter()
+        response = self.genai.GenerativeModel(self.model).generate_content(
+            contents, request_options={"timeout": timeout} if timeout else None
+        )
+        latency = time.perf_counter() - started
+        text = response.text if hasattr(response, "text") else str(response)
+        return LLMResponse(text, _usage(response), latency)
+
+
+def _usage(response):
+    meta = getattr(response, "usage_metadata", None)
+    if meta is None:
+        return None
+    return {
+        "prompt_tokens": getattr(meta, "prompt_token_count", None),
+        "response_tokens": getattr(meta, "candidates_token_count", None),
+        "total_tokens": getattr(meta, "total_token_count", None),
+    }
+
+
+class RecordBackend:
+    name = "record"
+
+    def __init__(self, live, fixtures_dir):
+        self.live = live
+        self.model = live.model
+        self.fixtures_dir = fixtures_dir
+
+    @property
+    def available(self):
+        return self.live.available
+
+    def generate(self, contents, kind="generic", timeout=None):
+        response = self.live.generate(contents, kind, timeout)
+        prompt = redact(contents)
+        key = fixture_key(self.model, prompt)
+        fixture = {
+            "kind": kind,
+            "model": self.model,
+            "prompt": prompt,
+            "response": response.text,
+            "usage": response.usage,
+            "latency_ms": round(response.latency * 1000, 1),
+            "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+        os.makedirs(self.fixtures_dir, exist_ok=True)
+        path = os.path.join(self.fixtures_dir, f"{kind}-{key}.json")
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(fixture, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, path)
+        return response
+
+
+class ReplayBackend:
+    name = "replay"
+    available = True
+
+    def __init__(self, fixtures_dir, model, latency="recorded", seed=None):
+        self.fixtures_dir = fixtures_dir
+        self.model = model
+        self.latency = parse_latency(latency)
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._by_key, self._by_kind = {}, {}
+        self.reload()
+
+    def reload(self):
+        by_key, by_kind = {}, {}
+        if os.path.isdir(self.fixtures_dir):
+            for name in sorted(os.listdir(self.fixtures_dir)):
+                if not name.endswith(".json"):
+                    continue
+                with open(os.path.join(self.fixtures_dir, name), encoding="utf-8") as f:
+                    fixture = json.load(f)
+                key = fixture_key(fixture.get("model"), fixture.get("prompt"))
+                by_key[key] = fixture
+                by_kind.setdefault(fixture.get("kind", "generic"), []).append(fixture)
+        self._by_key, self._by_kind = by_key, by_kind
+
+    def __len__(self):
+        return len(self._by_key)
+
+    def generate(self, contents, kind="generic", timeout=None):
+        key = fixture_key(self.model, redact(contents))
+        fixture = self._by_key.get(key)
+        if fixture is None:
+            candidates = self._by_kind.get(kind)
+            if not candidates:
+                raise FixtureMissing(f"no {kind!r} fixtures in {self.fixtures_dir}")
+            fixture = candidates[int(key, 16) % len(candidates)]
+
+        with self._random_lock:
+            delay = self.latency(kind, fixture, self._random)
+        if timeout is not None and delay > timeout:
+            time.sleep(max(timeout, 0))
+            raise DeadlineExceeded(f"replayed {kind} call took longer than {timeout:.2f}s")
+        if delay > 0:
+            time.sleep(delay)
+        return LLMResponse(fixture["response"], fixture.get("usage"), delay)
+
+
+# ---------- SYNTHETIC LATENCY ----------
+def _distribution(spec):
+    name, _, args = spec.strip().partition(":")
+    params = [float(a) for a in args.split(":")] if args else []
+    if name == "recorded":
+        return lambda fixture, rng: fixture.get("latency_ms", 0) / 1000
+    if name in ("none", "0", ""):
+        return lambda fixture, rng: 0.0
+    if name == "fixed":
+        return lambda fixture, rng: params[0] / 1000
+    if name == "uniform":
+        lo, hi = params
+        return lambda fixture, rng: rng.uniform(lo, hi) / 1000
+    if name == "normal":
+        mean, sd = params
+        return lambda fixture, rng: max(0.0, rng.gauss(mean, sd)) / 1000
+    if name == "lognormal":
+        median, sigma = params
+        mu = math.log(median)
+        return lambda fixture, rng: rng.lognormvariate(mu, sigma) / 1000
+    raise ValueError(f"unknown latency distribution {spec!r}")
+
+
+def parse_latency(spec):
+    """LLM_REPLAY_LATENCY string -> fn(kind, fixture, rng) returning seconds."""
+    per_kind, default = {}, _distribution("recorded")
+    for part in filter(None, (p.strip() for p in (spec or "recorded").split(","))):
+        kind, sep, dist = part.partition("=")
+        if sep:
+            per_kind[kind.strip()] = _distribution(dist)
+        else:
+            default = _distribution(part)
+    return lambda kind, fixture, rng: per_kind.get(kind, default)(fixture, rng)
+
+
+# ---------- TELEMETRY ----------
+def payload_sizes(contents):
+    """(prompt text bytes, inline image bytes) of a prompt."""
+    if isinstance(contents, str):
+        return len(contents.encode("utf-8")), 0
+    if isinstance(contents, dict):
+        text_bytes = image_bytes = 0
+        for k, v in contents.items():
+            if k == "text" and isinstance(v, str):
+                text_bytes += len(v.encode("utf-8"))
+            elif k == "inline_data" and isinstance(v, dict):
+                data = v.get("data") or b""
+                if isinstance(data, str):
+                    # decoded size of base64 text, without decoding it
+                    image_bytes += len(data) * 3 // 4 - data[-2:].count("=")
+                else:
+                    image_bytes += len(data)
+            else:
+                t, i = payload_sizes(v)
+                text_bytes, image_bytes = text_bytes + t, image_bytes + i
+        return text_bytes, image_bytes
+    if isinstance(contents, (list, tuple)):
+        sizes = [payload_sizes(c) for c in contents]
+        return sum(t for t, _ in sizes), sum(i for _, i in sizes)
+    return 0, 0
+
+
+class MeteredBackend:
+    """Forwards to backend and reports each call to log; route() names the caller."""
+    def __init__(self, backend, log, route=lambda: None):
+        self.backend = backend
+        self.log = log
+        self.route = route
+        self.name = backend.name
+        self.model = backend.model
+
+    @property
+    def available(self):
+        return self.backend.available
+
+    def generate(self, contents, kind="generic", timeout=None):
+        prompt_bytes, image_bytes = payload_sizes(contents)
+        row = {
+            "created_at": datetime.datetime.utcnow(),
+            "route": (self.route() or "")[:100],
+            "kind": kind,
+            "model": self.model,
+            "backend": self.name,
+            "prompt_bytes": prompt_bytes,
+            "image_bytes": image_bytes,
+            "response_bytes": 0,
+            "prompt_tokens": None,
+            "response_tokens": None,
+        }
+        started = time.perf_counter()
+        try:
+            response = self.backend.generate(contents, kind, timeout)
+        except Exception as e:
+            if isinstance(e, DeadlineExceeded):
+                row["outcome"] = "deadline"
+            else:
+                row["outcome"] = "missing_fixture" if isinstance(e, FixtureMissing) else "error"
+            row["latency_ms"] = int((time.perf_counter() - started) * 1000)
+            self.log.record(row)
+            raise
+        usage = response.usage or {}
+        row.update(
+            outcome="ok",
+            latency_ms=int((time.perf_counter() - started) * 1000),
+            response_bytes=len(response.text.encode("utf-8")),
+            prompt_tokens=usage.get("prompt_tokens"),
+            response_tokens=usage.get("response_tokens"),
+        )
+        self.log.record(row)
+        return response
+
+
+class CallLog:
+    """
+    In-memory buffer of llm_calls rows. flush() writes them in one INSERT on
+    its own connection, so telemetry never joins (or rolls back with) the
+    request's transaction. A full buffer drops new rows rather than grow.
+    """
+    def __init__(self, engine, table, max_buffer=10000):
+        self.engine = engine  # callable -> Engine (resolved lazily; needs an app context)
+        self.table = table
+        self.max_buffer = max_buffer
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._rows = []
+
+    def record(self, row):
+        with self._lock:
+            if len(self._rows) < self.max_buffer:
+                self._rows.append(row)
+            else:
+                self.dropped += 1
+
+    def flush(self):
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if rows:
+            with self.engine().begin() as conn:
+                conn.execute(self.table.insert(), rows)
+        return len(rows)
+
+
+# ---------- DEADLINES & HEDGING ----------
+class LatencyTracker:
+    """Rolling window of successful call latencies per kind."""
+    def __init__(self, window=200, min_samples=20):
+        self.window = window
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def add(self, kind, seconds):
+        with self._lock:
+            self._samples.setdefault(kind, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, kind, p):
+        """p-th percentile in seconds, or None until min_samples calls have been seen."""
+        with self._lock:
+            samples = sorted(self._samples.get(kind, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+class HedgedBackend:
+    """
+    policy_for() -> dict for the current route (None outside a request):
+        deadline_ms        budget from request start (started_at()) for all model calls
+        timeout_ms         budget for each call
+        hedge              send a duplicate after hedge_percentile of recent latency
+        hedge_percentile   default 0.95
+        hedge_after_ms     delay used until enough latencies have been seen
+    Calls run on a shared pool so the request thread can stop waiting; the
+    caller's contextvars (Flask's request context) are copied into each call.
+    """
+    def __init__(self, backend, policy_for, started_at, pool_size=32, tracker=None):
+        self.backend = backend
+        self.policy_for = policy_for
+        self.started_at = started_at
+        self.name = backend.name
+        self.model = backend.model
+        self.tracker = tracker or LatencyTracker()
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "hedges_sent": 0, "hedges_won": 0, "deadlines_exceeded": 0}
+        self._pool = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="llm")
+
+    @property
+    def available(self):
+        return self.backend.available
+
+    def _budget(self, policy):
+        """Seconds left for this call, or None for no limit."""
+        limits = []
+        if policy.get("deadline_ms"):
+            started = self.started_at() or time.monotonic()
+            limits.append(started + policy["deadline_ms"] / 1000 - time.monotonic())
+        if policy.get("timeout_ms"):
+            limits.append(policy["timeout_ms"] / 1000)
+        return min(limits) if limits else None
+
+    def _submit(self, contents, kind, timeout):
+        def call():
+            started = time.monotonic()
+            response = self.backend.generate(contents, kind, timeout)
+            self.tracker.add(kind, time.monotonic() - started)
+            return response
+        return self._pool.submit(contextvars.copy_context().run, call)
+
+    def generate(self, contents, kind="generic", timeout=None):
+        policy = self.policy_for() or {}
+        budget = self._budget(policy)
+        if timeout is not None:
+            budget = timeout if budget is None else min(budget, timeout)
+        self._count("calls")
+        if budget is None and not policy.get("hedge"):
+            return self.backend.generate(contents, kind)
+        if budget is not None and budget <= 0:
+            self._count("deadlines_exceeded")
+            raise DeadlineExceeded(f"no time left for {kind} call")
+
+        end = None if budget is None else time.monotonic() + budget
+        primary = self._submit(contents, kind, budget)
+        pending = {primary}
+        errors = []
+
+        if policy.get("hedge"):
+            delay = self.tracker.percentile(kind, policy.get("hedge_percentile", 0.95))
+            if delay is None:
+                delay = policy.get("hedge_after_ms", 2000) / 1000
+            if budget is not None:
+                delay = min(delay, budget)
+            done, _ = wait(pending, timeout=delay)
+            if not done and (end is None or time.monotonic() < end):
+                remaining = None if end is None else end - time.monotonic()
+                pending.add(self._submit(contents, kind, remaining))
+                self._count("hedges_sent")
+
+        while pending:
+            remaining = None if end is None else end - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        self._count("hedges_won")
+                    return future.result()
+                errors.append(future.exception())
+
+        if pending or any(isinstance(e, DeadlineExceeded) for e in errors):
+            self._count("deadlines_exceeded")
+            raise DeadlineExceeded(f"{kind} call did not finish within its budget")
+        raise errors[0]
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters)
+
+
+def create_backend(name, genai, model, fixtures_dir, replay_latency="recorded", seed=None):
+    live = LiveBackend(genai, model)
+    if name == "live":
+        return live
+    if name == "record":
+        return RecordBackend(live, fixtures_dir)
+    if name == "replay":
+        return ReplayBackend(fixtures_dir, model, replay_latency, seed)
+    raise ValueError(f"LLM_BACKEND must be live, record or replay (got {name!r})")
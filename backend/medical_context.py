@@ -0,0 +1,86 @@
+"""
+Per-patient medical context: allergies (with category) and conditions,
+loaded in one place and cached per user.
+
+Entries are keyed by users.medical_version. Every route that writes
+allergies, conditions or the profile bumps that column in the same
+transaction, and readers pass the version of the user row they already have
+(auth_required loads it anyway), so a stale entry is never served, even
+when the write happened in another worker.
+
+user_medical_profile is not read here: no cached reader needs the vitals, and
+databases built from database_schema.sql do not have that table.
+"""
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import text
+
+
+class MedicalContext:
+    __slots__ = ("user_id", "version", "allergies", "conditions")
+
+    def __init__(self, user_id, version, allergies, conditions):
+        self.user_id = user_id
+        self.version = version
+        self.allergies = allergies    # [{"allergy_id", "name", "category"}]
+        self.conditions = conditions  # [str]
+
+    @property
+    def allergy_names(self):
+        return [a["name"] for a in self.allergies]
+
+    def to_dict(self):
+        return {
+            "allergies": self.allergies,
+            "conditions": self.conditions,
+        }
+
+
+def load(session, user_id, version):
+    allergies = [dict(r) for r in session.execute(text("""
+        SELECT a.allergy_id, a.name, COALESCE(a.category, 'other') AS category
+        FROM user_allergies ua
+        JOIN allergies a ON a.allergy_id = ua.allergy_id
+        WHERE ua.user_id = :uid
+        ORDER BY a.name
+    """), {"uid": user_id}).mappings()]
+    conditions = session.execute(
+        text("SELECT conditn FROM user_conditions WHERE user_id = :uid ORDER BY condition_id"),
+        {"uid": user_id}
+    ).scalars().all()
+    return MedicalContext(user_id, version, allergies, list(conditions))
+
+
+class MedicalContextCache:
+    """LRU of user_id -> MedicalContext; an entry is reused only for the same version."""
+    def __init__(self, session_factory, max_entries=2048):
+        self.session_factory = session_factory
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, user):
+        user_id, version = user.user_id, user.medical_version or 0
+        with self._lock:
+            ctx = self._entries.get(user_id)
+            if ctx is not None and ctx.version == version:
+                self._entries.move_to_end(user_id)
+                return ctx
+
+        ctx = load(self.session_factory(), user_id, version)
+        with self._lock:
+            current = self._entries.get(user_id)
+            if current is None or current.version <= version:
+                self._entries[user_id] = ctx
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return ctx
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
@@ -0,0 +1,314 @@
+"""
+Versioned schema migrations for databases created before a model change.
+Works against both SQLite and MySQL (whatever DATABASE_URL points to).
+
+    python migrate.py            # apply pending migrations
+    python migrate.py --status   # list applied / pending migrations
+    python migrate.py --check    # call every route on a copy of the db, EXPLAIN what it ran, fail on full scans
+
+init_db.py runs upgrade() on fresh databases too, so new installs are stamped
+with the current schema version.
+"""
+import os
+import sys
+import json
+import sqlite3
+import secrets
+import datetime
+import tempfile
+import subprocess
+
+from sqlalchemy import text, inspect
+
+from app import (
+    app, db, Upload, Summary, SummaryMedicine, DoctorStats, MedicationTimeline,
+    DoctorSlotArchive, AppointmentArchive, LLMCall, IdempotencyKey
+)
+from specialties import specialty_id
+import search
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# ---------- MIGRATION STEPS ----------
+# (index name, table, columns) - names match the ones declared on the ORM models
+# so db.create_all() on a fresh database and this migration agree.
+HOT_FILTER_INDEXES = [
+    ("ix_users_city", "users", ["city"]),
+    ("ix_uploads_user_created", "uploads", ["user_id", "created_at"]),
+    ("ix_summaries_upload_created", "summaries", ["upload_id", "created_at"]),
+    ("ix_medical_entities_upload_id", "medical_entities", ["upload_id"]),
+    ("ix_doctor_slots_doctor_start", "doctor_slots", ["doctor_id", "slot_start"]),
+    ("ix_appointments_patient_created", "appointments", ["patient_id", "created_at"]),
+    ("ix_appointments_doctor_created", "appointments", ["doctor_id", "created_at"]),
+    ("ix_user_conditions_user_id", "user_conditions", ["user_id"]),
+]
+
+
+def create_index_if_missing(conn, name, table, columns):
+    """CREATE INDEX without relying on IF NOT EXISTS (MySQL has no such clause)."""
+    insp = inspect(conn)
+    if table not in insp.get_table_names():
+        return False
+    if any(ix["name"] == name for ix in insp.get_indexes(table)):
+        return False
+    conn.execute(text(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})"))
+    return True
+
+
+def add_column_if_missing(conn, table, column, ddl):
+    insp = inspect(conn)
+    if any(c["name"] == column for c in insp.get_columns(table)):
+        return False
+    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    return True
+
+
+def m001_hot_filter_indexes(conn):
+    for name, table, columns in HOT_FILTER_INDEXES:
+        if create_index_if_missing(conn, name, table, columns):
+            print(f"  created index {name} on {table}({', '.join(columns)})")
+
+
+def m002_structured_summaries(conn):
+    add_column_if_missing(conn, "summaries", "condition_text", "VARCHAR(255)")
+    add_column_if_missing(conn, "summaries", "explanation", "TEXT")
+    SummaryMedicine.__table__.create(conn, checkfirst=True)
+
+    # one-time parse of the legacy JSON blobs into the structured columns
+    rows = conn.execute(text("SELECT summary_id, summary_text, recommended_specialist FROM summaries")).fetchall()
+    for summary_id, summary_text, specialist in rows:
+        try:
+            data = json.loads(summary_text)
+            if not isinstance(data, dict):
+                raise ValueError("not an object")
+        except Exception:
+            # keep serving the old {"summary_text": ...} fallback shape as-is
+            data = {"summary_text": summary_text}
+            conn.execute(text("UPDATE summaries SET summary_text = :t WHERE summary_id = :id"),
+                         {"t": json.dumps(data), "id": summary_id})
+
+        condition = data.get("condition")
+        conn.execute(text("""
+            UPDATE summaries SET condition_text = :c, explanation = :e, recommended_specialist = :rs
+            WHERE summary_id = :id
+        """), {
+            "c": str(condition)[:255] if condition else None,
+            "e": data.get("explanation"),
+            "rs": specialist or (str(data["recommended_specialist"])[:100] if data.get("recommended_specialist") else None),
+            "id": summary_id
+        })
+
+        conn.execute(text("DELETE FROM summary_medicines WHERE summary_id = :id"), {"id": summary_id})
+        medicines = [m for m in (data.get("medicines") or []) if isinstance(m, dict)]
+        for i, m in enumerate(medicines):
+            conn.execute(text("""
+                INSERT INTO summary_medicines (summary_id, position, name, dosage, frequency, instructions)
+                VALUES (:sid, :pos, :name, :dosage, :freq, :instr)
+            """), {
+                "sid": summary_id, "pos": i,
+                "name": str(m.get("name") or "")[:255],
+                "dosage": str(m["dosage"])[:255] if m.get("dosage") else None,
+                "freq": str(m["frequency"])[:255] if m.get("frequency") else None,
+                "instr": m.get("instructions")
+            })
+
+
+def m003_notification_outbox(conn):
+    add_column_if_missing(conn, "notifications", "is_read", "BOOLEAN NOT NULL DEFAULT 0")
+    add_column_if_missing(conn, "notifications", "attempts", "INTEGER NOT NULL DEFAULT 0")
+    add_column_if_missing(conn, "notifications", "sent_at", "TIMESTAMP NULL")
+    create_index_if_missing(conn, "ix_notifications_user_read", "notifications", ["user_id", "is_read"])
+    create_index_if_missing(conn, "ix_notifications_status", "notifications", ["status", "notif_id"])
+
+
+def m004_doctor_stats(conn):
+    create_index_if_missing(conn, "ix_appointments_slot_id", "appointments", ["slot_id"])
+    DoctorStats.__table__.create(conn, checkfirst=True)
+    conn.execute(text("DELETE FROM doctor_stats"))
+    conn.execute(text("""
+        INSERT INTO doctor_stats (doctor_id, pending, confirmed, cancelled, slots_total, slots_booked, updated_at)
+        SELECT d.doctor_id,
+               COALESCE(a.pending, 0), COALESCE(a.confirmed, 0), COALESCE(a.cancelled, 0),
+               COALESCE(s.total, 0), COALESCE(s.booked, 0), :now
+        FROM doctors d
+        LEFT JOIN (
+            SELECT doctor_id,
+                   SUM(CASE WHEN status = 'pending' THEN 1 ELSE 0 END) AS pending,
+                   SUM(CASE WHEN status = 'confirmed' THEN 1 ELSE 0 END) AS confirmed,
+                   SUM(CASE WHEN status = 'cancelled' THEN 1 ELSE 0 END) AS cancelled
+            FROM appointments GROUP BY doctor_id
+        ) a ON a.doctor_id = d.doctor_id
+        LEFT JOIN (
+            SELECT doctor_id, COUNT(*) AS total,
+                   SUM(CASE WHEN is_booked THEN 1 ELSE 0 END) AS booked
+            FROM doctor_slots GROUP BY doctor_id
+        ) s ON s.doctor_id = d.doctor_id
+    """), {"now": datetime.datetime.utcnow()})
+
+
+def m005_doctor_specialty_ids(conn):
+    add_column_if_missing(conn, "doctors", "specialty_id", "VARCHAR(40)")
+    create_index_if_missing(conn, "ix_doctors_specialty_id", "doctors", ["specialty_id"])
+    # resolve each distinct free-text specialization once
+    for (specialization,) in conn.execute(text("SELECT DISTINCT specialization FROM doctors")).fetchall():
+        conn.execute(text("UPDATE doctors SET specialty_id = :sid WHERE specialization = :spec"),
+                     {"sid": specialty_id(specialization), "spec": specialization})
+
+
+def m006_upload_search(conn):
+    search.create_index(conn)
+    print(f"  indexed {search.rebuild(conn, Upload, Summary)} upload(s)")
+
+
+def m007_medication_timeline(conn):
+    from sqlalchemy.orm import Session
+
+    MedicationTimeline.__table__.create(conn, checkfirst=True)
+    session = Session(bind=conn)
+    rows = conn.execute(text("""
+        SELECT u.upload_id, u.user_id, u.created_at, m.name, m.dosage, m.frequency
+        FROM summary_medicines m
+        JOIN summaries s ON s.summary_id = m.summary_id
+        JOIN uploads u ON u.upload_id = s.upload_id
+        ORDER BY u.created_at, u.upload_id, m.position
+    """)).fetchall()
+
+    by_upload = {}
+    for upload_id, user_id, created_at, name, dosage, frequency in rows:
+        entry = by_upload.setdefault(upload_id, (user_id, created_at, []))
+        entry[2].append({"name": name, "dosage": dosage, "frequency": frequency})
+    for upload_id, (user_id, created_at, medicines) in by_upload.items():
+        if isinstance(created_at, str):
+            created_at = datetime.datetime.fromisoformat(created_at)
+        MedicationTimeline.record(session, user_id, upload_id, created_at or datetime.datetime.utcnow(), medicines)
+        session.flush()
+    print(f"  folded {len(by_upload)} upload(s) into the timeline")
+
+
+def m008_archive_tables(conn):
+    create_index_if_missing(conn, "ix_doctor_slots_end", "doctor_slots", ["slot_end"])
+    DoctorSlotArchive.__table__.create(conn, checkfirst=True)
+    AppointmentArchive.__table__.create(conn, checkfirst=True)
+
+
+def m009_medical_context_version(conn):
+    add_column_if_missing(conn, "users", "medical_version", "INTEGER NOT NULL DEFAULT 0")
+    # the MySQL DDL predates allergy categories
+    if inspect(conn).has_table("allergies"):
+        add_column_if_missing(conn, "allergies", "category", "VARCHAR(20) DEFAULT 'other'")
+
+
+def m010_llm_calls(conn):
+    LLMCall.__table__.create(conn, checkfirst=True)
+
+
+def m011_idempotency_keys(conn):
+    IdempotencyKey.__table__.create(conn, checkfirst=True)
+
+
+def m012_rematch_specialty_ids(conn):
+    # the first matcher's trigram fallback mapped e.g. Rheumatologist -> dermatology
+    for (specialization,) in conn.execute(text("SELECT DISTINCT specialization FROM doctors")).fetchall():
+        conn.execute(text("UPDATE doctors SET specialty_id = :sid WHERE specialization = :spec"),
+                     {"sid": specialty_id(specialization), "spec": specialization})
+
+# Append new steps here; never renumber or edit a step that has shipped.
+MIGRATIONS = [
+    (1, "hot_filter_indexes", m001_hot_filter_indexes),
+    (2, "structured_summaries", m002_structured_summaries),
+    (3, "notification_outbox", m003_notification_outbox),
+    (4, "doctor_stats", m004_doctor_stats),
+    (5, "doctor_specialty_ids", m005_doctor_specialty_ids),
+    (6, "upload_search", m006_upload_search),
+    (7, "medication_timeline", m007_medication_timeline),
+    (8, "archive_tables", m008_archive_tables),
+    (9, "medical_context_version", m009_medical_context_version),
+    (10, "llm_calls", m010_llm_calls),
+    (11, "idempotency_keys", m011_idempotency_keys),
+    (12, "rematch_specialty_ids", m012_rematch_specialty_ids),
+]
+
+
+# ---------- RUNNER ----------
+def _ensure_version_table(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            applied_at TIMESTAMP NOT NULL
+        )
+    """))
+
+
+def applied_versions(conn):
+    _ensure_version_table(conn)
+    return set(conn.execute(text("SELECT version FROM schema_migrations")).scalars().all())
+
+
+def upgrade(engine=None):
+    """Apply every pending migration, each in its own transaction."""
+    engine = engine or db.engine
+    with engine.begin() as conn:
+        done = applied_versions(conn)
+
+    applied = []
+    for version, name, step in MIGRATIONS:
+        if version in done:
+            continue
+        print(f"Applying migration {version:03d} {name}...")
+        with engine.begin() as conn:
+            step(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)"),
+                {"v": version, "n": name, "t": datetime.datetime.utcnow()}
+            )
+        applied.append(version)
+    return applied
+
+
+def status(engine=None):
+    engine = engine or db.engine
+    with engine.begin() as conn:
+        done = applied_versions(conn)
+    for version, name, _ in MIGRATIONS:
+        print(f"{version:03d} {name:<40} {'applied' if version in done else 'PENDING'}")
+
+
+# ---------- QUERY PLAN CHECK ----------
+def check_query_plans():
+    """
+    Run plan_check.py on a throwaway copy of a SQLite database (or, for other
+    databases, on a scratch SQLite database built from the models and these
+    migrations). Returns its exit status: non-zero on any full scan.
+    """
+    url = app.config["SQLALCHEMY_DATABASE_URI"]
+    source = url.split("///", 1)[1] if url.startswith("sqlite:///") else None
+    with tempfile.TemporaryDirectory() as tmp:
+        copy = os.path.join(tmp, "plan_check.db")
+        args = [sys.executable, os.path.join(BACKEND_DIR, "plan_check.py")]
+        if source and source != ":memory:":
+            src, dst = sqlite3.connect(source), sqlite3.connect(copy)
+            with dst:
+                src.backup(dst)
+            src.close()
+            dst.close()
+        else:
+            print(f"note: {db.engine.dialect.name} database; checking plans on a scratch SQLite database")
+            args.append("--fresh")
+        env = dict(os.environ, PLAN_CHECK_SCRATCH="1", DATABASE_URL="sqlite:///" + copy,
+                   LLM_BACKEND="replay", LLM_REPLAY_LATENCY="none",
+                   NOTIFY_DISPATCHER="false", ARCHIVE_JOB="false",
+                   MEDITRUST_ADMIN_TOKEN=secrets.token_hex(16))
+        return subprocess.run(args, env=env, cwd=BACKEND_DIR).returncode
+
+
+if __name__ == "__main__":
+    with app.app_context():
+        if "--status" in sys.argv:
+            status()
+        elif "--check" in sys.argv:
+            sys.exit(check_query_plans())
+        else:
+            applied = upgrade()
+            print(f"[OK] Applied {len(applied)} migration(s)." if applied else "[OK] Schema is up to date.")
@@ -0,0 +1,127 @@
+"""
+Outbox dispatcher for the notifications table.
+
+Routes only INSERT notification rows (status 'pending') in the same commit as
+the appointment change that caused them. The dispatcher picks pending rows up
+in batches and hands them to a delivery channel, then marks them 'sent' (or
+'failed' after NOTIFY_MAX_ATTEMPTS). Run one dispatcher per deployment: either
+in-process (NOTIFY_DISPATCHER=true) or standalone:
+
+    python notifications.py
+"""
+import json
+import logging
+import datetime
+import threading
+
+logger = logging.getLogger("meditrust.notifications")
+
+
+# ---------- CHANNELS ----------
+class LogChannel:
+    """Writes each notification to the application log."""
+    def send(self, batch):
+        for n in batch:
+            logger.info("notify user=%s appointment=%s: %s", n["user_id"], n["appointment_id"], n["message"])
+
+
+class FileChannel:
+    """Appends notifications as JSON lines to a file (handy for tests and local dev)."""
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, batch):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for n in batch:
+                f.write(json.dumps(n, default=str) + "\n")
+
+
+def channel_from_config(spec):
+    """'log' or 'file:/path/to/outbox.jsonl'."""
+    if spec.startswith("file:"):
+        return FileChannel(spec[len("file:"):])
+    return LogChannel()
+
+
+# ---------- DISPATCHER ----------
+class NotificationDispatcher:
+    def __init__(self, app, db, model, channel, batch_size=100, interval=2.0, max_attempts=5):
+        self.app = app
+        self.db = db
+        self.model = model
+        self.channel = channel
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self._stop = threading.Event()
+        self._thread = None
+
+    def dispatch_once(self):
+        """Deliver one batch of pending notifications. Returns how many were sent."""
+        N = self.model
+        with self.app.app_context():
+            rows = (
+                N.query
+                .filter(N.status == "pending")
+                .order_by(N.notif_id.asc())
+                .limit(self.batch_size)
+                .all()
+            )
+            if not rows:
+                return 0
+
+            batch = [{
+                "notif_id": n.notif_id,
+                "user_id": n.user_id,
+                "appointment_id": n.appointment_id,
+                "message": n.message,
+                "created_at": n.created_at.isoformat() if n.created_at else None
+            } for n in rows]
+
+            try:
+                self.channel.send(batch)
+            except Exception:
+                logger.exception("Notification channel failed for a batch of %d", len(rows))
+                for n in rows:
+                    n.attempts = (n.attempts or 0) + 1
+                    if n.attempts >= self.max_attempts:
+                        n.status = "failed"
+                self.db.session.commit()
+                return 0
+
+            now = datetime.datetime.utcnow()
+            for n in rows:
+                n.status = "sent"
+                n.sent_at = now
+                n.attempts = (n.attempts or 0) + 1
+            self.db.session.commit()
+            return len(rows)
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            try:
+                # drain quickly while there is a backlog, then poll at the interval
+                if self.dispatch_once() == self.batch_size:
+                    continue
+            except Exception:
+                logger.exception("Notification dispatch failed")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run_forever, name="notification-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    from app import notification_dispatcher
+    print("Dispatching notifications (Ctrl+C to stop)...")
+    try:
+        notification_dispatcher.run_forever()
+    except KeyboardInterrupt:
+        pass
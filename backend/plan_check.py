@@ -0,0 +1,247 @@
+"""
+Query plan check over the SQL the app really sends.
+
+migrate.py --check runs this against a throwaway copy of the database
+(never the database itself): every route is called once through the test
+client, the background jobs run once, and a before_cursor_execute listener
+records each statement with its parameters. Every captured SELECT / UPDATE /
+DELETE is then EXPLAINed and any full table or index scan fails the check,
+unless (label, table) is listed in ALLOWED_SCANS with a reason.
+
+Labels are "METHOD /rule" for statements issued inside a request and the job
+name for background jobs; the check's own setup queries are not recorded.
+"""
+import io
+import os
+import sys
+import datetime
+import contextlib
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# (label, table) -> why the scan is acceptable
+ALLOWED_SCANS = {
+    ("GET /api/allergies", "allergies"): "the whole allergy catalogue is returned",
+    ("GET /api/recommend", "users"): "free-text city match is ILIKE '%city%'; served from recommend_cache",
+    ("GET /api/recommend", "doctors"): "free-text specialization fallback is ILIKE; served from recommend_cache",
+    ("POST /api/recommend/from-symptoms", "users"): "same city match as GET /recommend",
+    ("POST /api/recommend/from-symptoms", "doctors"): "same specialization fallback as GET /recommend",
+    ("GET /api/slots/search", "users"): "free-text city match is ILIKE '%city%'",
+    ("GET /api/slots/search", "doctors"): "free-text specialization fallback is ILIKE",
+}
+
+CHECKED = ("SELECT", "UPDATE", "DELETE", "WITH")
+IGNORED = ("sqlite_master", "sqlite_schema", "schema_migrations")
+
+
+class Capture:
+    def __init__(self):
+        self.statements = {}  # (label, sql) -> params of the first execution
+        self.label = None
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        from flask import request, has_request_context
+        sql = statement.strip()
+        if executemany or not sql.upper().startswith(CHECKED) or any(t in sql for t in IGNORED):
+            return
+        if has_request_context() and request.url_rule is not None:
+            label = f"{request.method} {request.url_rule.rule}"
+        else:
+            label = self.label
+        if label is None:
+            return  # the check's own setup queries
+        self.statements.setdefault((label, sql), parameters)
+
+    @contextlib.contextmanager
+    def job(self, label):
+        self.label = label
+        try:
+            yield
+        finally:
+            self.label = None
+
+
+def full_scans(conn, sql, params):
+    """Tables a statement reads by scanning, including full scans of an index."""
+    scans = []
+    for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql, params).fetchall():
+        detail = row[-1]
+        if not detail.startswith("SCAN "):
+            continue
+        table = detail.split()[1]
+        # subqueries / CTEs / VALUES are materialised, not stored tables
+        if table in ("CONSTANT", "SUBQUERY") or table.startswith("("):
+            continue
+        # FTS5 reports every access as a virtual table scan; the plan string after
+        # the colon is empty only for a full scan ("M" = MATCH, "=" = rowid lookup)
+        if "VIRTUAL TABLE INDEX" in detail and detail.rsplit(":", 1)[1].strip():
+            continue
+        scans.append(table)
+    return scans
+
+
+def exercise(app, capture):
+    """Call every route once and run the background jobs once."""
+    from app import db, User, Upload, notification_dispatcher, archiver, create_token
+
+    client = app.test_client()
+    image_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prescription.jpg")
+    with open(image_path, "rb") as f:
+        image = f.read()
+    tag = datetime.datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
+    problems = []
+
+    def call(method, url, headers=None, **kwargs):
+        r = client.open(url, method=method, headers=headers, **kwargs)
+        if r.status_code >= 400:
+            problems.append(f"{method} {url} -> {r.status_code}")
+        body = r.get_json(silent=True)
+        return body if body is not None else {}
+
+    def signup(name, role, city, **extra):
+        email = f"plancheck-{name}-{tag}@example.com"
+        call("POST", "/api/signup", json={"name": name, "email": email, "password": "pw",
+                                          "role": role, "city": city, "pincode": "411001", **extra})
+        call("POST", "/api/login", json={"email": email, "password": "pw"})
+        with app.app_context():
+            user = User.query.filter_by(email=email).first()
+            return user.user_id, {"Authorization": "Bearer " + create_token(user)}
+
+    city = f"Plancheck{tag}"
+    doctor_id, doctor = signup("doctor", "doctor", city, specialization="Cardiologist")
+    signup("doctor2", "doctor", city, specialization="Sports Medicine")
+    _, patient = signup("patient", "patient", city)
+    _, patient2 = signup("patient2", "patient", city)
+
+    # patient profile
+    catalogue = call("GET", "/api/allergies", patient)
+    allergy_ids = [a["allergy_id"] for a in catalogue[:1]] if isinstance(catalogue, list) else []
+    call("POST", "/api/me/allergies", patient, json={"allergy_ids": allergy_ids})
+    call("GET", "/api/me/allergies", patient)
+    call("POST", "/api/me/conditions", patient, json={"conditions": ["Asthma"]})
+    call("GET", "/api/me/conditions", patient)
+    call("POST", "/api/me/medical-profile", patient, json={"allergies": [], "conditions": ["Asthma"]})
+
+    # uploads, summaries, search
+    upload = call("POST", "/api/upload", patient, content_type="multipart/form-data", data={
+        "file": (io.BytesIO(image), "prescription.jpg"), "consent_cloud_ocr": "true"})
+    call("POST", "/api/upload-multiple", patient, content_type="multipart/form-data", data={
+        "files": [(io.BytesIO(image), "page1.jpg")], "consent_cloud_ocr": "true"})
+    upload_id = upload.get("uploadId", 0)
+    call("GET", f"/api/upload/{upload_id}/summary", patient)
+    call("POST", f"/api/prescription/{upload_id}/validate", patient)
+    call("GET", "/api/uploads/my", patient)
+    call("GET", "/api/search?q=amoxicillin", patient)
+    call("GET", "/api/search?q=amoxicillin", doctor)
+    call("GET", "/api/me/medications", patient)
+    call("POST", "/api/symptoms/analyze", patient, json={"symptoms": "fever and cough", "severity": "mild"})
+
+    # recommendations: latest summary, specialty id, text fallback, city only
+    call("GET", "/api/recommend", patient)
+    call("GET", "/api/recommend?specialist=Cardiologist", patient2)
+    call("GET", "/api/recommend?specialist=Sports%20Medicine", patient2)
+    call("GET", "/api/recommend", patient2)
+    call("GET", "/api/recommend?mode=nearest&specialist=Cardiologist", patient2)
+    call("POST", "/api/recommend/from-symptoms", patient2, json={"recommended_specialist": "Cardiologist"})
+    call("POST", "/api/recommend/from-symptoms", patient2, json={"recommended_specialist": "Sports Medicine"})
+
+    # slots and appointments
+    start = datetime.datetime.now().replace(microsecond=0) + datetime.timedelta(days=1)
+    slot_ids = []
+    for i in range(3):
+        s = start + datetime.timedelta(hours=i)
+        slot_ids.append(call("POST", "/api/doctor/add-slot", doctor, json={
+            "slot_start": s.isoformat(), "slot_end": (s + datetime.timedelta(minutes=30)).isoformat()
+        }).get("slot_id", 0))
+    ids = ",".join(map(str, slot_ids))
+    call("GET", f"/api/doctor/{doctor_id}", patient)
+    call("GET", f"/api/doctors?ids={doctor_id}", patient)
+    call("GET", f"/api/doctor/{doctor_id}/slots", patient)
+    call("GET", f"/api/doctor/{doctor_id}/slots/history", patient)
+    call("GET", f"/api/slots/{slot_ids[0]}", patient)
+    call("GET", f"/api/slots?ids={ids}", patient)
+    call("GET", "/api/slots/search?specialist=Cardiologist", patient)
+    call("GET", f"/api/slots/search?specialist=Sports%20Medicine&city={city}", patient)
+    call("GET", f"/api/slots/search?city={city}", patient)
+    appt = call("POST", "/api/appointments", dict(patient, **{"Idempotency-Key": tag}),
+                json={"slot_id": slot_ids[0]})
+    appointment_id = appt.get("appointment_id", 0)
+    call("GET", "/api/appointments/my", patient)
+    call("GET", "/api/doctor/appointments", doctor)
+    call("POST", f"/api/appointments/{appointment_id}/accept", doctor)
+    call("GET", "/api/doctor/dashboard", doctor)
+    call("POST", f"/api/appointments/{appointment_id}/cancel", patient)
+    call("GET", "/api/appointments/history", patient)
+    call("PUT", f"/api/doctor/slot/{slot_ids[1]}", doctor, json={"slot_start": start.isoformat()})
+    call("DELETE", f"/api/doctor/slot/{slot_ids[2]}", doctor)
+
+    # notifications
+    call("GET", "/api/notifications", doctor)
+    feed = call("GET", "/api/notifications?since_id=0", doctor)
+    notes = feed.get("notifications") or [{"notif_id": 0}]
+    call("GET", f"/api/notifications?before_id={notes[-1]['notif_id']}", doctor)
+    call("POST", "/api/notifications/read", doctor, json={"ids": [n["notif_id"] for n in notes]})
+    call("POST", "/api/notifications/read", doctor, json={"up_to_id": notes[-1]["notif_id"]})
+
+    # admin
+    admin = {"X-Admin-Token": os.environ.get("MEDITRUST_ADMIN_TOKEN", "")}
+    call("GET", "/api/admin/llm-usage", admin)
+    call("GET", "/api/admin/llm-usage?group=day", admin)
+    call("GET", "/api/admin/metrics", admin)
+
+    # background jobs
+    with capture.job("notification dispatcher"):
+        notification_dispatcher.dispatch_once()
+    with capture.job("archive job"):
+        archiver.archive_once(horizon_days=30)
+
+    with app.app_context():
+        paths = db.session.query(Upload.file_path).join(User, User.user_id == Upload.user_id) \
+            .filter(User.email.like(f"plancheck-%-{tag}@example.com")).all()
+    # the copied database is thrown away, the uploaded files are not
+    for (path,) in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return problems
+
+
+def run():
+    if os.environ.get("PLAN_CHECK_SCRATCH") != "1":
+        sys.exit("plan_check.py writes test data; run it through `python migrate.py --check`")
+    if "--fresh" in sys.argv:
+        with contextlib.redirect_stdout(io.StringIO()):
+            import init_db
+            init_db.init()
+
+    capture = Capture()
+    event.listen(Engine, "before_cursor_execute", capture)
+    from app import app, db
+    problems = exercise(app, capture)
+    event.remove(Engine, "before_cursor_execute", capture)
+
+    for problem in problems:
+        print(f"warn {problem}")
+
+    failures = []
+    by_label = {}
+    with app.app_context(), db.engine.connect() as conn:
+        for (label, sql), params in capture.statements.items():
+            by_label.setdefault(label, []).append((sql, full_scans(conn, sql, params)))
+    for label in sorted(by_label):
+        statements = by_label[label]
+        bad = [(sql, [t for t in scans if (label, t) not in ALLOWED_SCANS]) for sql, scans in statements]
+        bad = [(sql, scans) for sql, scans in bad if scans]
+        allowed = sorted({t for _, scans in statements for t in scans if (label, t) in ALLOWED_SCANS})
+        print(f"{'FAIL' if bad else 'ok  '} {label}  ({len(statements)} statements)"
+              + (f"  allowed scan: {', '.join(allowed)}" if allowed else ""))
+        for sql, scans in bad:
+            print(f"       full scan: {', '.join(scans)}  in  {' '.join(sql.split())[:160]}")
+            failures.extend((label, t) for t in scans)
+    return 1 if failures or problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
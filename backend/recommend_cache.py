@@ -0,0 +1,118 @@
+"""
+Cache of city-mode doctor recommendations, keyed by normalised
+(city, specialist), plus (with the same class) each patient's latest
+recommended specialist for GET /recommend.
+
+Every patient in the same city asking for the same specialist gets the same
+rating-ordered list, so the join + ilike scan + row-to-dict work is done once
+and the serialised JSON is kept in a bounded LRU. Any doctor write (signup,
+profile or rating change, delete) clears the whole cache once the
+transaction commits; max_age bounds staleness from writes made by other
+processes.
+
+RecommendationLog buffers the doctor_recommendations audit rows and writes
+them in one INSERT per interval from a background thread, so a cached
+recommendation does not wait on a write either.
+"""
+import time
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def normalise_city(city):
+    return " ".join((city or "").split()).lower()
+
+
+class RecommendationCache:
+    def __init__(self, load, max_entries=512, max_age=300):
+        """load(key) -> value to cache (typically pre-serialised JSON)."""
+        self.load = load
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (loaded_at, value)
+        self._generation = 0  # bumped on invalidate so a load racing a write is not cached
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[0] < self.max_age:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+
+        value = self.load(key)
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = (now, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, key=None):
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class RecommendationLog:
+    def __init__(self, app, engine, table, interval=2.0, max_buffer=10000):
+        self.app = app
+        self.engine = engine  # callable -> Engine (needs an app context)
+        self.table = table
+        self.interval = interval
+        self.max_buffer = max_buffer
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._rows = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, row):
+        with self._lock:
+            if len(self._rows) < self.max_buffer:
+                self._rows.append(row)
+            else:
+                self.dropped += 1
+
+    def flush(self):
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if rows:
+            with self.app.app_context(), self.engine().begin() as conn:
+                conn.execute(self.table.insert(), rows)
+        return len(rows)
+
+    def run_forever(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to write doctor_recommendations")
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run_forever, name="recommendation-log", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.flush()
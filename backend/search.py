@@ -0,0 +1,154 @@
+"""
+Full-text search over upload OCR text and summaries.
+
+One row per upload in `upload_search`, holding the OCR text and a flattened
+summary (condition, explanation, specialist, medicines):
+
+    SQLite  FTS5 virtual table, rowid = upload_id, ranked with bm25()
+    MySQL   InnoDB table with a FULLTEXT index, ranked with MATCH ... AGAINST
+
+The pipeline calls index_upload() in the same transaction that writes OCR or
+analysis results, so the index never lags the data it was built from.
+"""
+import re
+
+from sqlalchemy import text
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def summary_document(summary):
+    """Flatten a Summary (and its medicines) into searchable text."""
+    if summary is None:
+        return ""
+    parts = [summary.condition_text, summary.explanation, summary.recommended_specialist]
+    for m in summary.medicines:
+        parts.extend([m.name, m.dosage, m.frequency, m.instructions])
+    return "\n".join(p for p in parts if p)
+
+
+# ---------- SCHEMA ----------
+def create_index(conn):
+    if conn.dialect.name == "sqlite":
+        conn.execute(text("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS upload_search USING fts5(
+                user_id UNINDEXED, ocr_text, summary,
+                tokenize = 'porter unicode61 remove_diacritics 2'
+            )
+        """))
+    else:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS upload_search (
+                upload_id INT PRIMARY KEY,
+                user_id INT NOT NULL,
+                ocr_text MEDIUMTEXT,
+                summary TEXT,
+                INDEX ix_upload_search_user (user_id),
+                FULLTEXT INDEX ft_upload_search (ocr_text, summary)
+            ) ENGINE=InnoDB
+        """))
+
+
+def _upsert(conn, upload_id, user_id, ocr_text, summary):
+    params = {"id": upload_id, "uid": user_id, "ocr": ocr_text or "", "summary": summary or ""}
+    if conn.dialect.name == "sqlite":
+        # FTS5 has no UPSERT; delete + insert by rowid
+        conn.execute(text("DELETE FROM upload_search WHERE rowid = :id"), params)
+        conn.execute(text("""
+            INSERT INTO upload_search (rowid, user_id, ocr_text, summary)
+            VALUES (:id, :uid, :ocr, :summary)
+        """), params)
+    else:
+        conn.execute(text("""
+            REPLACE INTO upload_search (upload_id, user_id, ocr_text, summary)
+            VALUES (:id, :uid, :ocr, :summary)
+        """), params)
+
+
+def index_upload(session, upload, summary):
+    """(Re)index one upload inside the caller's transaction; flushes pending ORM state first."""
+    session.flush()
+    _upsert(session.connection(), upload.upload_id, upload.user_id,
+            upload.ocr_text, summary_document(summary))
+
+
+def rebuild(conn, Upload, Summary, batch_size=500):
+    """Index every existing upload (used by the migration that creates the table)."""
+    from sqlalchemy.orm import Session, selectinload
+
+    session = Session(bind=conn)
+    last_id, total = 0, 0
+    while True:
+        uploads = (
+            session.query(Upload)
+            .filter(Upload.upload_id > last_id)
+            .order_by(Upload.upload_id)
+            .limit(batch_size)
+            .all()
+        )
+        if not uploads:
+            break
+        ids = [u.upload_id for u in uploads]
+        summaries = {
+            s.upload_id: s
+            for s in session.query(Summary).options(selectinload(Summary.medicines))
+            .filter(Summary.upload_id.in_(ids))
+        }
+        for u in uploads:
+            _upsert(conn, u.upload_id, u.user_id, u.ocr_text, summary_document(summaries.get(u.upload_id)))
+        last_id, total = ids[-1], total + len(ids)
+        session.expunge_all()
+    return total
+
+
+# ---------- QUERY ----------
+def _terms(q):
+    return _TOKEN.findall(q or "")[:16]
+
+
+def search(session, q, user_id=None, page=1, per_page=20):
+    """
+    Returns (total, rows) for free-text query q; every term must match and the
+    last one is treated as a prefix. user_id restricts to one owner's uploads.
+    rows: upload_id, score, snippet (best matching fragment).
+    """
+    terms = _terms(q)
+    if not terms:
+        return 0, []
+
+    conn = session.connection()
+    offset = (page - 1) * per_page
+    owner = " AND user_id = :uid" if user_id is not None else ""
+
+    if conn.dialect.name == "sqlite":
+        match = " ".join(f'"{t}"' for t in terms[:-1]) + f' "{terms[-1]}"*'
+        params = {"match": match.strip(), "uid": user_id, "limit": per_page, "offset": offset}
+        total = conn.execute(text(
+            f"SELECT COUNT(*) FROM upload_search WHERE upload_search MATCH :match{owner}"
+        ), params).scalar()
+        rows = conn.execute(text(f"""
+            SELECT rowid AS upload_id, -bm25(upload_search, 0.0, 1.0, 2.0) AS score,
+                   snippet(upload_search, -1, '[', ']', '…', 12) AS snippet
+            FROM upload_search
+            WHERE upload_search MATCH :match{owner}
+            ORDER BY bm25(upload_search, 0.0, 1.0, 2.0)
+            LIMIT :limit OFFSET :offset
+        """), params).mappings().all()
+        return total, [dict(r) for r in rows]
+
+    boolean = " ".join(f"+{t}" for t in terms[:-1]) + f" +{terms[-1]}*"
+    params = {"bool": boolean.strip(), "nl": " ".join(terms), "uid": user_id,
+              "limit": per_page, "offset": offset}
+    total = conn.execute(text(f"""
+        SELECT COUNT(*) FROM upload_search
+        WHERE MATCH(ocr_text, summary) AGAINST (:bool IN BOOLEAN MODE){owner}
+    """), params).scalar()
+    rows = conn.execute(text(f"""
+        SELECT upload_id, MATCH(ocr_text, summary) AGAINST (:nl) AS score,
+               LEFT(COALESCE(NULLIF(summary, ''), ocr_text), 160) AS snippet
+        FROM upload_search
+        WHERE MATCH(ocr_text, summary) AGAINST (:bool IN BOOLEAN MODE){owner}
+        ORDER BY score DESC
+        LIMIT :limit OFFSET :offset
+    """), params).mappings().all()
+    return total, [dict(r) for r in rows]
@@ -0,0 +1,75 @@
+"""
+In-process index of each doctor's free (unbooked, upcoming) slots, used by
+/slots/search to find the earliest openings across many doctors.
+
+Each doctor maps to a start-ordered list of (slot_start, slot_id, slot_end).
+A search bisects every candidate doctor's list to the window start and
+k-way merges them with a heap, so it touches about limit + doctors entries
+instead of scanning doctor_slots. Lists are loaded lazily (one query for all
+cold doctors) and dropped when a slot of that doctor changes; max_age bounds
+staleness from writes made by other processes.
+"""
+import heapq
+import time
+import bisect
+import itertools
+import threading
+
+
+class FreeSlotIndex:
+    def __init__(self, load_free_slots, max_age=60):
+        """load_free_slots(doctor_ids) -> iterable of (doctor_id, slot_start, slot_id, slot_end)."""
+        self.load_free_slots = load_free_slots
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._slots = {}  # doctor_id -> (loaded_at, [(slot_start, slot_id, slot_end), ...])
+        self._generation = 0  # bumped on invalidate so a load racing a write is not cached
+
+    def invalidate(self, doctor_ids=None):
+        with self._lock:
+            self._generation += 1
+            if doctor_ids is None:
+                self._slots.clear()
+            else:
+                for doctor_id in doctor_ids:
+                    self._slots.pop(doctor_id, None)
+
+    def _lists(self, doctor_ids):
+        now = time.monotonic()
+        with self._lock:
+            lists, cold = {}, []
+            generation = self._generation
+            for doctor_id in doctor_ids:
+                entry = self._slots.get(doctor_id)
+                if entry and now - entry[0] < self.max_age:
+                    lists[doctor_id] = entry[1]
+                else:
+                    cold.append(doctor_id)
+
+        if cold:
+            loaded = {doctor_id: [] for doctor_id in cold}
+            for doctor_id, slot_start, slot_id, slot_end in self.load_free_slots(cold):
+                loaded[doctor_id].append((slot_start, slot_id, slot_end))
+            with self._lock:
+                cacheable = generation == self._generation
+                for doctor_id, slots in loaded.items():
+                    slots.sort()
+                    if cacheable:
+                        self._slots[doctor_id] = (now, slots)
+                    lists[doctor_id] = slots
+        return lists
+
+    def earliest(self, doctor_ids, start, end=None, limit=10):
+        """
+        Up to limit (slot_start, doctor_id, slot_id, slot_end) tuples, earliest
+        first, for free slots starting in [start, end).
+        """
+        def stream(doctor_id, slots):
+            for i in range(bisect.bisect_left(slots, (start,)), len(slots)):
+                slot_start, slot_id, slot_end = slots[i]
+                if end is not None and slot_start >= end:
+                    return
+                yield slot_start, doctor_id, slot_id, slot_end
+
+        streams = [stream(d, slots) for d, slots in self._lists(doctor_ids).items() if slots]
+        return list(itertools.islice(heapq.merge(*streams), limit))
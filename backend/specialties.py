@@ -0,0 +1,164 @@
+"""
+Specialty taxonomy: canonical ids for doctor specializations and a matcher
+that maps free text (Gemini's recommended_specialist, signup forms, search
+boxes) onto them.
+
+Matching order: exact alias -> any alias contained as whole words -> a
+typo match against a single alias (small edit distance, same first two
+letters). Anything else is unmapped (None) and callers fall back to a
+substring match. Results are memoised, so each distinct string is resolved
+once per process.
+
+Typo matching is deliberately strict: most specialties share the
+"-ologist" ending, so a loose similarity score maps e.g. "Rheumatologist"
+or "Hematologist" onto dermatology.
+"""
+import re
+from functools import lru_cache
+
+# canonical id -> (display name, aliases). Aliases are matched after normalise().
+SPECIALTIES = {
+    "general_physician": ("General Physician", [
+        "general physician", "physician", "general practitioner", "gp", "family doctor",
+        "family physician", "general medicine", "internal medicine", "internist", "general",
+        "primary care",
+    ]),
+    "cardiology": ("Cardiologist", [
+        "cardiologist", "cardiology", "heart specialist", "heart doctor", "cardiac", "heart",
+    ]),
+    "dermatology": ("Dermatologist", [
+        "dermatologist", "dermatology", "skin specialist", "skin doctor", "skin", "derma",
+        "trichologist", "cosmetologist",
+    ]),
+    "ent": ("ENT Specialist", [
+        "ent", "ent specialist", "otolaryngologist", "otorhinolaryngologist",
+        "ear nose throat", "ear nose and throat", "ear specialist",
+    ]),
+    "pediatrics": ("Pediatrician", [
+        "pediatrician", "paediatrician", "pediatrics", "paediatrics", "child specialist",
+        "child doctor", "neonatologist",
+    ]),
+    "orthopedics": ("Orthopedic", [
+        "orthopedic", "orthopaedic", "orthopedist", "orthopedics", "orthopaedics",
+        "bone specialist", "bone doctor", "joint specialist", "ortho",
+    ]),
+    "neurology": ("Neurologist", [
+        "neurologist", "neurology", "nerve specialist", "brain specialist", "neuro",
+    ]),
+    "gynecology": ("Gynecologist", [
+        "gynecologist", "gynaecologist", "gynecology", "obstetrician", "obgyn", "ob gyn",
+        "women s health", "womens health", "women health",
+    ]),
+    "dentistry": ("Dentist", [
+        "dentist", "dental", "dental surgeon", "orthodontist", "endodontist", "tooth", "teeth",
+    ]),
+    "psychiatry": ("Psychiatrist", [
+        "psychiatrist", "psychiatry", "mental health", "psychologist", "counsellor", "counselor",
+    ]),
+    "ophthalmology": ("Ophthalmologist", [
+        "ophthalmologist", "ophthalmology", "eye specialist", "eye doctor", "eye",
+    ]),
+    "gastroenterology": ("Gastroenterologist", [
+        "gastroenterologist", "gastroenterology", "stomach specialist", "gastro",
+    ]),
+    "pulmonology": ("Pulmonologist", [
+        "pulmonologist", "pulmonology", "chest specialist", "lung specialist", "chest physician",
+    ]),
+    "endocrinology": ("Endocrinologist", [
+        "endocrinologist", "endocrinology", "diabetologist", "diabetes specialist", "thyroid specialist",
+    ]),
+    "urology": ("Urologist", ["urologist", "urology"]),
+    "nephrology": ("Nephrologist", ["nephrologist", "nephrology", "kidney specialist"]),
+    "oncology": ("Oncologist", ["oncologist", "oncology", "cancer specialist"]),
+}
+
+TYPO_MIN_LENGTH = 5  # shorter aliases ("ent", "gp", "eye") only match exactly
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+# words that carry no signal on their own ("ENT Specialist" == "ENT")
+_FILLER = {"dr", "doctor", "specialist", "consultant", "consult", "a", "an", "the", "see", "visit"}
+# aliases too generic to match as a word inside longer text ("general surgeon")
+_EXACT_ONLY = {"general"}
+
+
+def normalise(text):
+    return _NON_WORD.sub(" ", (text or "").lower()).strip()
+
+
+def _max_edits(text):
+    return 1 if len(text) < 9 else 2
+
+
+def _edit_distance(a, b, limit):
+    """Optimal string alignment distance (adjacent swaps cost 1), or limit + 1 once it exceeds limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2, prev = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+# ---------- INDEX (built once at import) ----------
+_ALIASES = {}  # normalised alias -> specialty id
+for _sid, (_name, _aliases) in SPECIALTIES.items():
+    for _alias in [_name, _sid.replace("_", " ")] + _aliases:
+        _ALIASES.setdefault(normalise(_alias), _sid)
+
+_TYPO_ALIASES = {}  # first two letters -> [(alias, specialty id)]
+for _alias, _sid in _ALIASES.items():
+    if len(_alias) >= TYPO_MIN_LENGTH:
+        _TYPO_ALIASES.setdefault(_alias[:2], []).append((_alias, _sid))
+
+
+def _typo(text):
+    """The one specialty whose closest alias is within _max_edits(text) edits, else None."""
+    if len(text) < TYPO_MIN_LENGTH:
+        return None
+    limit = _max_edits(text)
+    best, best_distance = set(), limit + 1
+    for alias, sid in _TYPO_ALIASES.get(text[:2], ()):
+        d = _edit_distance(text, alias, limit)
+        if d < best_distance:
+            best, best_distance = {sid}, d
+        elif d == best_distance and d <= limit:
+            best.add(sid)
+    return best.pop() if len(best) == 1 else None
+
+
+@lru_cache(maxsize=4096)
+def specialty_id(text):
+    """Canonical specialty id for free text, or None if nothing is close enough."""
+    key = normalise(text)
+    if not key:
+        return None
+    if key in _ALIASES:
+        return _ALIASES[key]
+
+    words = [w for w in key.split() if w not in _FILLER]
+    stripped = " ".join(words)
+    if stripped in _ALIASES:
+        return _ALIASES[stripped]
+
+    # longest alias appearing as whole words ("see an ENT for ear pain")
+    padded = f" {key} "
+    for n in range(min(len(words), 4), 0, -1):
+        for i in range(len(words) - n + 1):
+            phrase = " ".join(words[i:i + n])
+            if phrase in _ALIASES and phrase not in _EXACT_ONLY and f" {phrase} " in padded:
+                return _ALIASES[phrase]
+
+    return _typo(stripped or key)
+
+
+def display_name(sid):
+    entry = SPECIALTIES.get(sid)
+    return entry[0] if entry else None
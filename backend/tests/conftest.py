@@ -0,0 +1,65 @@
+import io
+import os
+import sys
+import shutil
+import itertools
+import tempfile
+import contextlib
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# app.py reads its configuration at import time: point it at a scratch
+# database and the replay backend before any test imports it
+_tmp = tempfile.mkdtemp(prefix="meditrust-tests-")
+os.environ.update(
+    DATABASE_URL="sqlite:///" + os.path.join(_tmp, "test.db"),
+    LLM_BACKEND="replay",
+    LLM_REPLAY_LATENCY="none",
+    NOTIFY_DISPATCHER="false",
+    ARCHIVE_JOB="false",
+    MEDITRUST_ADMIN_TOKEN="test-admin-token",
+)
+
+_emails = itertools.count()
+
+
+@pytest.fixture(scope="session")
+def app():
+    with contextlib.redirect_stdout(io.StringIO()):
+        import init_db
+        init_db.init()
+    from app import app
+
+    # uploads are saved under backend/uploads, not in the scratch directory
+    folder = app.config["UPLOAD_FOLDER"]
+    before = set(os.listdir(folder))
+    yield app
+
+    for name in set(os.listdir(folder)) - before:
+        with contextlib.suppress(OSError):
+            os.remove(os.path.join(folder, name))
+    shutil.rmtree(_tmp, ignore_errors=True)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(app, client):
+    """make_user(role, **fields) -> (user_id, auth headers) for a freshly signed-up user."""
+    from app import User, create_token
+
+    def make(role="patient", **fields):
+        email = f"test-{role}-{next(_emails)}@example.com"
+        r = client.post("/api/signup", json={"name": f"Test {role}", "email": email, "password": "pw",
+                                             "role": role, **fields})
+        assert r.status_code == 201, r.get_json()
+        with app.app_context():
+            user = User.query.filter_by(email=email).first()
+            return user.user_id, {"Authorization": "Bearer " + create_token(user)}
+    return make
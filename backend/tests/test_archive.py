@@ -0,0 +1,128 @@
+import datetime
+
+import pytest
+
+
+@pytest.fixture
+def past_slots(app, make_user):
+    """
+    One doctor with slots that ended a week ago, each with one appointment of
+    the given status (None: no appointment). Unless newest=True, a booked
+    future slot is added after them so none of them holds the newest id.
+    """
+    from app import db, DoctorSlot, Appointment
+
+    doctor_id, _ = make_user("doctor", specialization="Cardiologist")
+    patient_id, patient = make_user("patient")
+    start = datetime.datetime.now().replace(microsecond=0) - datetime.timedelta(days=7)
+
+    def make(statuses, newest=False):
+        ids = {}
+        later = datetime.timedelta(days=14)
+        rows = [(s, start) for s in statuses] + ([] if newest else [("pending", start + later)])
+        with app.app_context():
+            for i, (status, ended) in enumerate(rows):
+                slot = DoctorSlot(doctor_id=doctor_id, slot_start=ended + datetime.timedelta(hours=i),
+                                  slot_end=ended + datetime.timedelta(hours=i, minutes=30),
+                                  is_booked=status is not None)
+                db.session.add(slot)
+                db.session.flush()
+                if status is not None:
+                    db.session.add(Appointment(patient_id=patient_id, doctor_id=doctor_id,
+                                               slot_id=slot.slot_id, status=status))
+                if ended == start:
+                    ids[status] = slot.slot_id
+            db.session.commit()
+        return ids
+    return make, patient
+
+
+def live_slot_ids(app):
+    from app import db, DoctorSlot
+    with app.app_context():
+        return set(db.session.scalars(db.select(DoctorSlot.slot_id)))
+
+
+def test_archives_settled_history_only(app, client, past_slots):
+    from app import db, archiver, AppointmentArchive, DoctorSlotArchive
+
+    make, patient = past_slots
+    ids = make(["confirmed", "cancelled", "pending", None])
+
+    archiver.archive_once(horizon_days=1)
+
+    live = live_slot_ids(app)
+    assert ids["pending"] in live
+    assert not {ids["confirmed"], ids["cancelled"], ids[None]} & live
+    with app.app_context():
+        archived = {a.slot_id: a.status for a in AppointmentArchive.query.filter(
+            AppointmentArchive.slot_id.in_(ids.values()))}
+        assert archived == {ids["confirmed"]: "confirmed", ids["cancelled"]: "cancelled"}
+        assert db.session.get(DoctorSlotArchive, ids[None]) is not None
+
+    # the unsettled past appointment is still listed, next to the future one
+    mine = client.get("/api/appointments/my", headers=patient).get_json()
+    assert sorted(a["status"] for a in mine) == ["pending", "pending"]
+    history = client.get("/api/appointments/history", headers=patient).get_json()
+    assert sorted(a["status"] for a in history) == ["cancelled", "confirmed"]
+
+
+def test_pending_slot_archived_once_settled(app, past_slots):
+    from app import db, archiver, Appointment
+
+    make, _ = past_slots
+    slot_id = make(["pending"])["pending"]
+    archiver.archive_once(horizon_days=1)
+    assert slot_id in live_slot_ids(app)
+
+    with app.app_context():
+        Appointment.query.filter_by(slot_id=slot_id).update({"status": "cancelled"})
+        db.session.commit()
+    archiver.archive_once(horizon_days=1)
+    assert slot_id not in live_slot_ids(app)
+
+
+def test_keeps_slots_inside_horizon(app, past_slots):
+    from app import archiver
+
+    make, _ = past_slots
+    ids = make(["confirmed", None])
+    archiver.archive_once(horizon_days=30)
+    assert set(ids.values()) <= live_slot_ids(app)
+
+
+def test_stuck_pending_slots_do_not_stall_batches(app, past_slots):
+    from app import archiver
+
+    make, _ = past_slots
+    pending = make(["pending"] * 3)
+    settled = make([None])
+    batch_size = archiver.batch_size
+    archiver.batch_size = 2
+    try:
+        totals = archiver.archive_once(horizon_days=1)
+    finally:
+        archiver.batch_size = batch_size
+    live = live_slot_ids(app)
+    assert settled[None] not in live
+    assert pending["pending"] in live
+    assert totals["slots"] >= 1
+
+
+def test_newest_rows_stay_live_so_ids_are_not_reused(app, past_slots):
+    from app import db, archiver, DoctorSlot
+
+    make, _ = past_slots
+    ids = make([None, "confirmed"], newest=True)
+    with app.app_context():
+        newest = db.session.query(db.func.max(DoctorSlot.slot_id)).scalar()
+    assert newest == ids["confirmed"]
+
+    archiver.archive_once(horizon_days=1)
+    live = live_slot_ids(app)
+    assert ids[None] not in live
+    assert newest in live
+
+    # the next slot gets a fresh id rather than an archived one
+    later = make([None], newest=True)[None]
+    assert later > newest
@@ -0,0 +1,121 @@
+import gzip
+import json
+import zlib
+
+import pytest
+from flask import Flask, Response, jsonify
+
+import compression
+from compression import Compressor
+
+BIG = {"items": ["x" * 40] * 100}
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.compressor = Compressor(app, min_size=256, exclude_endpoints=["raw"])
+
+    @app.route("/big")
+    def big():
+        return jsonify(BIG)
+
+    @app.route("/small")
+    def small():
+        return jsonify({"ok": True})
+
+    @app.route("/raw")
+    def raw():
+        return jsonify(BIG)
+
+    @app.route("/image")
+    def image():
+        return Response(b"\x89PNG" + b"\0" * 4096, mimetype="image/png")
+
+    @app.route("/tagged")
+    def tagged():
+        response = jsonify(BIG)
+        response.set_etag("v1")
+        return response
+
+    @app.route("/stream")
+    def stream():
+        return Response((f'{{"n": {i}}}\n' for i in range(200)), mimetype="application/x-ndjson")
+
+    @app.route("/events")
+    def events():
+        return Response(iter(["data: 1\n\n"] * 100), mimetype="text/event-stream")
+
+    return app
+
+
+def get(app, path, encoding="gzip", **kwargs):
+    return app.test_client().get(path, headers={"Accept-Encoding": encoding}, **kwargs)
+
+
+def test_gzips_large_json_and_records_savings(app):
+    r = get(app, "/big")
+    assert r.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in r.vary
+    body = gzip.decompress(r.data)
+    assert r.headers["Content-Length"] == str(len(r.data))
+    assert json.loads(body) == BIG
+    stats = app.compressor.stats()["/big"]
+    assert stats["responses"] == 1
+    assert stats["bytes_in"] == len(body) and stats["bytes_out"] == len(r.data)
+
+
+@pytest.mark.parametrize("path, encoding", [
+    ("/small", "gzip"),        # below min_size
+    ("/raw", "gzip"),          # excluded endpoint
+    ("/image", "gzip"),        # already-compressed type
+    ("/events", "gzip"),       # server-sent events are never buffered or wrapped
+    ("/big", "identity"),      # client did not ask
+    ("/big", ""),
+])
+def test_leaves_response_alone(app, path, encoding):
+    r = get(app, path, encoding)
+    assert "Content-Encoding" not in r.headers
+
+
+def test_head_is_not_compressed(app):
+    r = app.test_client().head("/big", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in r.headers
+
+
+def test_etag_becomes_weak(app):
+    r = get(app, "/tagged")
+    assert r.headers["Content-Encoding"] == "gzip"
+    assert r.headers["ETag"] == 'W/"v1"'
+
+
+def test_streamed_response_is_compressed_per_chunk(app):
+    r = app.test_client().get("/stream", headers={"Accept-Encoding": "gzip"}, buffered=False)
+    assert r.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in r.headers
+    chunks = list(r.response)
+    r.close()
+    # each chunk is sync-flushed, so the client can decode before the stream ends
+    d = zlib.decompressobj(31)
+    first = d.decompress(chunks[0])
+    assert first.startswith(b'{"n": 0}')
+    text = first + b"".join(d.decompress(c) for c in chunks[1:]) + d.flush()
+    assert text.decode().splitlines() == [f'{{"n": {i}}}' for i in range(200)]
+    assert app.compressor.stats()["/stream"]["bytes_in"] == len(text)
+
+
+def test_prefers_brotli_when_installed(app):
+    brotli = pytest.importorskip("brotli")
+    assert compression.BROTLI_AVAILABLE
+    r = get(app, "/big", "gzip, br")
+    assert r.headers["Content-Encoding"] == "br"
+    assert brotli.decompress(r.data)
+
+
+def test_falls_back_to_gzip_without_brotli(app):
+    if compression.BROTLI_AVAILABLE:
+        pytest.skip("brotli is installed")
+    r = get(app, "/big", "br, gzip")
+    assert r.headers["Content-Encoding"] == "gzip"
+    r = get(app, "/big", "br")
+    assert "Content-Encoding" not in r.headers
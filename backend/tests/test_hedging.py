@@ -0,0 +1,138 @@
+import time
+import threading
+import contextvars
+
+import pytest
+
+from llm import HedgedBackend, LatencyTracker, LLMResponse, DeadlineExceeded
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+class FakeBackend:
+    """Each call takes the next delay from delays (the last one repeats) and answers with its call number."""
+    name = "fake"
+    model = "fake-model"
+    available = True
+
+    def __init__(self, *delays, error=None):
+        self.delays = list(delays)
+        self.error = error
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def generate(self, contents, kind="generic", timeout=None):
+        with self._lock:
+            n = len(self.calls)
+            self.calls.append((kind, timeout, request_id.get()))
+        time.sleep(self.delays[min(n, len(self.delays) - 1)])
+        if self.error:
+            raise self.error
+        return LLMResponse(f"call {n}")
+
+
+def hedged(backend, policy, started_at=None):
+    return HedgedBackend(backend, lambda: policy, lambda: started_at, pool_size=4)
+
+
+def test_without_limits_calls_straight_through():
+    backend = FakeBackend(0)
+    h = hedged(backend, None)
+    assert h.generate("p", kind="ocr").text == "call 0"
+    assert backend.calls == [("ocr", None, None)]
+    assert h.stats() == {"calls": 1, "hedges_sent": 0, "hedges_won": 0, "deadlines_exceeded": 0}
+
+
+def test_spent_deadline_fails_without_calling():
+    backend = FakeBackend(0)
+    h = hedged(backend, {"deadline_ms": 1000}, started_at=time.monotonic() - 2)
+    with pytest.raises(DeadlineExceeded):
+        h.generate("p")
+    assert backend.calls == []
+    assert h.stats()["deadlines_exceeded"] == 1
+
+
+def test_slow_call_gives_up_at_the_deadline():
+    backend = FakeBackend(1.0)
+    h = hedged(backend, {"deadline_ms": 100}, started_at=time.monotonic())
+    t0 = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        h.generate("p")
+    assert time.monotonic() - t0 < 0.5
+    # the budget is handed to the backend as its own timeout
+    assert 0 < backend.calls[0][1] <= 0.1
+    assert h.stats()["deadlines_exceeded"] == 1
+
+
+def test_per_call_timeout_tightens_the_budget():
+    backend = FakeBackend(0)
+    h = hedged(backend, {"timeout_ms": 5000})
+    h.generate("p", timeout=0.2)
+    assert backend.calls[0][1] == pytest.approx(0.2)
+
+
+def test_hedge_wins_when_primary_stalls():
+    backend = FakeBackend(1.0, 0.0)
+    h = hedged(backend, {"hedge": True, "hedge_after_ms": 50})
+    t0 = time.monotonic()
+    assert h.generate("p").text == "call 1"
+    assert time.monotonic() - t0 < 0.5
+    stats = h.stats()
+    assert stats["hedges_sent"] == 1 and stats["hedges_won"] == 1
+
+
+def test_no_hedge_when_primary_is_fast():
+    backend = FakeBackend(0.0)
+    h = hedged(backend, {"hedge": True, "hedge_after_ms": 200})
+    assert h.generate("p").text == "call 0"
+    assert len(backend.calls) == 1
+    assert h.stats()["hedges_sent"] == 0
+
+
+def test_hedge_delay_follows_recent_latency():
+    tracker = LatencyTracker(min_samples=3)
+    assert tracker.percentile("ocr", 0.95) is None
+    for seconds in (0.01, 0.02, 0.03):
+        tracker.add("ocr", seconds)
+    assert tracker.percentile("ocr", 0.95) == 0.03
+
+    # primary takes 0.2s, well past the 0.03s p95 but far under hedge_after_ms
+    backend = FakeBackend(0.2, 0.0)
+    h = HedgedBackend(backend, lambda: {"hedge": True, "hedge_after_ms": 5000}, lambda: None,
+                      pool_size=4, tracker=tracker)
+    assert h.generate("p", kind="ocr").text == "call 1"
+
+
+def test_error_is_raised_when_every_call_fails():
+    backend = FakeBackend(0.0, error=ValueError("bad response"))
+    h = hedged(backend, {"timeout_ms": 1000})
+    with pytest.raises(ValueError, match="bad response"):
+        h.generate("p")
+    assert h.stats()["deadlines_exceeded"] == 0
+
+
+def test_calls_see_the_callers_context():
+    backend = FakeBackend(0.0)
+    h = hedged(backend, {"timeout_ms": 1000})
+    token = request_id.set("req-1")
+    try:
+        h.generate("p")
+    finally:
+        request_id.reset(token)
+    assert backend.calls[0][2] == "req-1"
+
+
+def test_symptoms_route_falls_back_past_its_deadline(client, make_user, monkeypatch):
+    import app as app_module
+
+    _, patient = make_user("patient")
+    monkeypatch.setitem(app_module.LLM_POLICIES, "/api/symptoms/analyze", {"deadline_ms": 100, "hedge": False})
+    monkeypatch.setattr(app_module.llm_backend, "backend", FakeBackend(1.0))
+    before = app_module.llm_backend.stats()["deadlines_exceeded"]
+
+    t0 = time.monotonic()
+    r = client.post("/api/symptoms/analyze", headers=patient, json={"symptoms": "cough", "severity": "mild"})
+    assert time.monotonic() - t0 < 0.8
+    assert r.status_code == 200
+    assert r.get_json()["recommended_specialist"] == "General Physician"
+    assert app_module.llm_backend.stats()["deadlines_exceeded"] == before + 1
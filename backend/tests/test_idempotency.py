@@ -0,0 +1,202 @@
+import io
+import os
+import time
+import datetime
+import itertools
+import threading
+
+import pytest
+
+from idempotency import IdempotencyStore, Conflict, DONE
+
+_users = itertools.count(10_000_000)  # store tests need no real user rows
+
+
+@pytest.fixture
+def store(app):
+    from app import db, IdempotencyKey
+    with app.app_context():
+        engine = db.engine
+    return IdempotencyStore(lambda: engine, IdempotencyKey.__table__, wait_seconds=0.3, poll_seconds=0.02)
+
+
+@pytest.fixture
+def user_id():
+    return next(_users)
+
+
+def test_first_claim_owns_the_key(store, user_id):
+    assert store.claim(user_id, "k", "api.book", "fp") is None
+
+
+def test_finished_request_is_replayed(store, user_id):
+    store.claim(user_id, "k", "api.book", "fp")
+    store.complete(user_id, "k", 201, b'{"appointment_id": 7}', "application/json")
+    row = store.claim(user_id, "k", "api.book", "fp")
+    assert row["state"] == DONE
+    assert (row["response_status"], row["response_body"]) == (201, b'{"appointment_id": 7}')
+
+
+def test_key_is_per_user(store, user_id):
+    store.claim(user_id, "k", "api.book", "fp")
+    assert store.claim(next(_users), "k", "api.book", "fp") is None
+
+
+@pytest.mark.parametrize("endpoint, fingerprint", [("api.book", "other"), ("api.upload", "fp")])
+def test_different_request_with_same_key_is_rejected(store, user_id, endpoint, fingerprint):
+    store.claim(user_id, "k", "api.book", "fp")
+    store.complete(user_id, "k", 201, b"{}", "application/json")
+    with pytest.raises(Conflict) as e:
+        store.claim(user_id, "k", endpoint, fingerprint)
+    assert e.value.status == 422
+
+
+def test_in_flight_retry_gets_409_after_waiting(store, user_id):
+    store.claim(user_id, "k", "api.book", "fp")
+    t0 = time.monotonic()
+    with pytest.raises(Conflict) as e:
+        store.claim(user_id, "k", "api.book", "fp")
+    assert e.value.status == 409 and e.value.retry_after
+    assert time.monotonic() - t0 >= store.wait_seconds
+
+
+def test_in_flight_retry_waits_for_the_original(store, user_id):
+    store.claim(user_id, "k", "api.book", "fp")
+    finisher = threading.Timer(0.1, store.complete, (user_id, "k", 201, b"done", "text/plain"))
+    finisher.start()
+    try:
+        row = store.claim(user_id, "k", "api.book", "fp")
+    finally:
+        finisher.join()
+    assert row["response_body"] == b"done"
+
+
+def test_concurrent_claims_have_one_owner(store, user_id):
+    barrier = threading.Barrier(8)
+    results = []
+
+    def claim():
+        barrier.wait()
+        try:
+            results.append(store.claim(user_id, "k", "api.book", "fp"))
+        except Conflict as e:
+            results.append(e.status)
+
+    threads = [threading.Thread(target=claim) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results.count(None) == 1
+    assert sorted(r for r in results if r is not None) == [409] * 7
+
+
+def test_released_key_can_be_claimed_again(store, user_id):
+    store.claim(user_id, "k", "api.book", "fp")
+    store.release(user_id, "k")
+    assert store.claim(user_id, "k", "api.book", "fp") is None
+
+
+def test_release_keeps_a_finished_response(store, user_id):
+    store.claim(user_id, "k", "api.book", "fp")
+    store.complete(user_id, "k", 201, b"done", "text/plain")
+    store.release(user_id, "k")
+    assert store.claim(user_id, "k", "api.book", "fp")["response_body"] == b"done"
+
+
+def test_abandoned_claim_is_taken_over(store, user_id):
+    store.claim(user_id, "k", "api.book", "fp")
+    store.lock_seconds = -1
+    assert store.claim(user_id, "k", "api.book", "fp") is None
+
+
+def test_expired_key_is_reusable_for_another_request(store, user_id):
+    store.ttl_seconds = -1
+    store.claim(user_id, "k", "api.book", "fp")
+    store.complete(user_id, "k", 201, b"{}", "application/json")
+    assert store.claim(user_id, "k", "api.book", "other") is None
+
+
+# ---------- routes ----------
+@pytest.fixture
+def booking(client, make_user):
+    _, doctor = make_user("doctor", specialization="Cardiologist")
+    patient_id, patient = make_user("patient")
+    start = datetime.datetime.now().replace(microsecond=0) + datetime.timedelta(days=5)
+    slot_ids = []
+    for i in range(2):
+        s = start + datetime.timedelta(hours=i)
+        slot_ids.append(client.post("/api/doctor/add-slot", headers=doctor, json={
+            "slot_start": s.isoformat(), "slot_end": (s + datetime.timedelta(minutes=30)).isoformat()
+        }).get_json()["slot_id"])
+    return patient_id, patient, slot_ids
+
+
+def test_booking_retry_replays_the_first_response(app, client, booking):
+    from app import Appointment
+
+    patient_id, patient, (slot_id, _) = booking
+    headers = {**patient, "Idempotency-Key": "book-1"}
+    first = client.post("/api/appointments", headers=headers, json={"slot_id": slot_id})
+    retry = client.post("/api/appointments", headers=headers, json={"slot_id": slot_id})
+    assert first.status_code == retry.status_code == 201
+    assert retry.get_json() == first.get_json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    with app.app_context():
+        assert Appointment.query.filter_by(patient_id=patient_id).count() == 1
+
+    # without the key the same body is a new request (and the slot is taken)
+    assert client.post("/api/appointments", headers=patient, json={"slot_id": slot_id}).status_code == 400
+
+
+def test_booking_key_reused_for_another_slot(client, booking):
+    _, patient, (first_slot, second_slot) = booking
+    headers = {**patient, "Idempotency-Key": "book-2"}
+    assert client.post("/api/appointments", headers=headers, json={"slot_id": first_slot}).status_code == 201
+    r = client.post("/api/appointments", headers=headers, json={"slot_id": second_slot})
+    assert r.status_code == 422
+
+
+def test_client_errors_are_replayed_server_errors_are_not(client, booking, monkeypatch):
+    import app as app_module
+
+    _, patient, (slot_id, _) = booking
+    headers = {**patient, "Idempotency-Key": "book-3"}
+    assert client.post("/api/appointments", headers=headers, json={}).status_code == 400
+    replay = client.post("/api/appointments", headers=headers, json={})
+    assert replay.status_code == 400 and replay.headers["Idempotent-Replayed"] == "true"
+
+    headers = {**patient, "Idempotency-Key": "book-4"}
+    monkeypatch.setattr(app_module, "enqueue_notification", lambda *a: 1 / 0)
+    assert client.post("/api/appointments", headers=headers, json={"slot_id": slot_id}).status_code == 500
+    monkeypatch.undo()
+    r = client.post("/api/appointments", headers=headers, json={"slot_id": slot_id})
+    assert r.status_code == 201 and "Idempotent-Replayed" not in r.headers
+
+
+def test_key_longer_than_255_characters(client, booking):
+    _, patient, (slot_id, _) = booking
+    r = client.post("/api/appointments", headers={**patient, "Idempotency-Key": "k" * 256}, json={"slot_id": slot_id})
+    assert r.status_code == 400
+
+
+def test_streamed_upload_is_replayed_whole(app, client, make_user):
+    from app import Upload
+
+    patient_id, patient = make_user("patient")
+    with open(os.path.join(app.root_path, "prescription.jpg"), "rb") as f:
+        image = f.read()
+
+    def post():
+        return client.post("/api/upload-multiple?stream=1", headers={**patient, "Idempotency-Key": "up-1"},
+                           content_type="multipart/form-data", data={
+                               "files": [(io.BytesIO(image), f"page{i}.jpg") for i in range(2)],
+                               "consent_cloud_ocr": "true"})
+    first = post()
+    first_body = first.data  # the key is completed once the stream has been read
+    retry = post()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.data == first_body
+    assert retry.mimetype == "application/x-ndjson"
+    with app.app_context():
+        assert Upload.query.filter_by(user_id=patient_id).count() == 2
@@ -0,0 +1,89 @@
+import json
+import datetime
+
+import pytest
+
+T0 = datetime.datetime(2030, 5, 1, 10, 0)
+
+
+@pytest.fixture
+def patient_id(make_user):
+    return make_user("patient")[0]
+
+
+def timeline(app, user_id):
+    from app import MedicationTimeline
+    with app.app_context():
+        return {row.drug_key: row.to_dict() for row in MedicationTimeline.query.filter_by(user_id=user_id)}
+
+
+def record(app, user_id, upload_id, seen_at, medicines):
+    from app import db, MedicationTimeline
+    with app.app_context():
+        MedicationTimeline.record(db.session, user_id, upload_id, seen_at, medicines)
+        db.session.commit()
+
+
+def test_folds_uploads_into_one_row_per_drug(app, patient_id):
+    record(app, patient_id, 1, T0, [{"name": "Itaspor", "dosage": "200 mg", "frequency": "once daily"},
+                                    {"name": "  LAMIFEN  cream", "dosage": None}])
+    record(app, patient_id, 2, T0 + datetime.timedelta(days=10), [{"name": "itaspor", "dosage": "100 mg"}])
+    # an upload dated earlier only moves first_seen
+    record(app, patient_id, 3, T0 - datetime.timedelta(days=5), [{"name": "Itaspor", "dosage": "200 mg"}])
+
+    rows = timeline(app, patient_id)
+    assert set(rows) == {"itaspor", "lamifen cream"}
+    itaspor = rows["itaspor"]
+    assert itaspor["upload_ids"] == [1, 2, 3]
+    assert itaspor["first_seen"] == T0 - datetime.timedelta(days=5)
+    assert itaspor["last_seen"] == T0 + datetime.timedelta(days=10)
+    assert (itaspor["drug"], itaspor["dosage"]) == ("itaspor", "100 mg")
+    assert [h["dosage"] for h in itaspor["dosage_history"]] == ["200 mg", "100 mg", "200 mg"]
+
+
+def test_same_upload_is_not_counted_twice(app, patient_id):
+    meds = [{"name": "Lejet", "dosage": "5 mg"}]
+    record(app, patient_id, 1, T0, meds)
+    record(app, patient_id, 1, T0, meds)
+    row = timeline(app, patient_id)["lejet"]
+    assert row["upload_ids"] == [1]
+    assert len(row["dosage_history"]) == 1
+
+
+def test_losing_the_insert_race_merges_into_the_winner(app, patient_id):
+    """
+    Another upload commits the drug's row after this one looked for it: the
+    savepoint undoes only the insert, and the upload's other writes survive.
+    """
+    from app import db, MedicationTimeline, MedicalEntity, Upload
+
+    record(app, patient_id, 1, T0, [{"name": "Nizoclin", "dosage": "soap"}])
+    with app.app_context():
+        upload = Upload(user_id=patient_id, file_path="/nonexistent", upload_type="prescription")
+        db.session.add(upload)
+        db.session.flush()
+        db.session.add(MedicalEntity(upload_id=upload.upload_id, type="DRUG", text="Nizoclin",
+                                     normalized_value="Nizoclin", confidence=1.0, source="test"))
+        row = MedicationTimeline._insert_or_lock(db.session, patient_id, "nizoclin", "Nizoclin", T0)
+        assert json.loads(row.upload_ids) == [1]
+        db.session.commit()
+        assert MedicalEntity.query.filter_by(upload_id=upload.upload_id).count() == 1
+        assert MedicationTimeline.query.filter_by(user_id=patient_id, drug_key="nizoclin").count() == 1
+
+    record(app, patient_id, 2, T0, [{"name": "Nizoclin", "dosage": "soap"}])
+    assert timeline(app, patient_id)["nizoclin"]["upload_ids"] == [1, 2]
+
+
+def test_upload_route_fills_the_timeline(app, client, make_user):
+    import io
+    import os
+
+    patient_id, patient = make_user("patient")
+    with open(os.path.join(app.root_path, "prescription.jpg"), "rb") as f:
+        image = f.read()
+    for _ in range(2):
+        r = client.post("/api/upload", headers=patient, content_type="multipart/form-data", data={
+            "file": (io.BytesIO(image), "prescription.jpg"), "consent_cloud_ocr": "true"})
+        assert r.status_code == 201
+    rows = client.get("/api/me/medications", headers=patient).get_json()
+    assert rows and all(len(m["upload_ids"]) == 2 for m in rows)
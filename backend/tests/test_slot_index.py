@@ -0,0 +1,108 @@
+import datetime
+
+from slot_index import FreeSlotIndex
+
+T0 = datetime.datetime(2031, 1, 1, 9, 0)
+
+
+def at(minutes):
+    return T0 + datetime.timedelta(minutes=minutes)
+
+
+class Loader:
+    """load_free_slots stand-in: doctor_id -> [(start_minutes, slot_id)], recording each call."""
+    def __init__(self, slots):
+        self.slots = slots
+        self.calls = []
+        self.during_load = None
+
+    def __call__(self, doctor_ids):
+        self.calls.append(sorted(doctor_ids))
+        if self.during_load:
+            self.during_load()
+        return [(d, at(m), slot_id, at(m + 30)) for d in doctor_ids for m, slot_id in self.slots.get(d, [])]
+
+
+def ids(hits):
+    return [slot_id for _, _, slot_id, _ in hits]
+
+
+def test_merges_doctors_earliest_first():
+    # per-doctor lists are given out of order; the index sorts them
+    index = FreeSlotIndex(Loader({1: [(60, 11), (0, 10)], 2: [(30, 20), (90, 21)], 3: [(15, 30)]}))
+    hits = index.earliest([1, 2, 3], at(0), limit=10)
+    assert ids(hits) == [10, 30, 20, 11, 21]
+    assert [doctor_id for _, doctor_id, _, _ in hits] == [1, 3, 2, 1, 2]
+
+
+def test_window_and_limit():
+    index = FreeSlotIndex(Loader({1: [(0, 10), (60, 11), (120, 12)], 2: [(30, 20), (90, 21)]}))
+    assert ids(index.earliest([1, 2], at(30), at(120), limit=10)) == [20, 11, 21]
+    assert ids(index.earliest([1, 2], at(0), limit=2)) == [10, 20]
+    # a start between slots bisects to the next one
+    assert ids(index.earliest([1, 2], at(31), limit=1)) == [11]
+    assert index.earliest([1, 2], at(500)) == []
+
+
+def test_loads_cold_doctors_in_one_call_and_caches():
+    loader = Loader({1: [(0, 10)], 2: [], 3: [(30, 30)]})
+    index = FreeSlotIndex(loader)
+    index.earliest([1, 2], at(0))
+    index.earliest([1, 2, 3], at(0))
+    index.earliest([3, 2, 1], at(0))
+    # doctor 2 has no free slots; its empty list is cached too
+    assert loader.calls == [[1, 2], [3]]
+
+
+def test_invalidate_reloads_only_those_doctors():
+    loader = Loader({1: [(0, 10)], 2: [(30, 20)]})
+    index = FreeSlotIndex(loader)
+    index.earliest([1, 2], at(0))
+    loader.slots[2] = [(15, 22)]
+    index.invalidate([2])
+    assert ids(index.earliest([1, 2], at(0))) == [10, 22]
+    index.invalidate()
+    index.earliest([1, 2], at(0))
+    assert loader.calls == [[1, 2], [2], [1, 2]]
+
+
+def test_load_racing_a_write_is_not_cached():
+    loader = Loader({1: [(0, 10)]})
+    index = FreeSlotIndex(loader)
+    loader.during_load = lambda: index.invalidate([1])
+    assert ids(index.earliest([1], at(0))) == [10]
+    loader.during_load = None
+    index.earliest([1], at(0))
+    assert loader.calls == [[1], [1]]
+
+
+def test_max_age_expires_entries():
+    loader = Loader({1: [(0, 10)]})
+    index = FreeSlotIndex(loader, max_age=0)
+    index.earliest([1], at(0))
+    index.earliest([1], at(0))
+    assert loader.calls == [[1], [1]]
+
+
+def test_search_route_drops_a_slot_once_booked(client, make_user):
+    city = "Slotindextown"
+    doctor_id, doctor = make_user("doctor", specialization="Cardiologist", city=city)
+    _, patient = make_user("patient", city=city)
+    start = datetime.datetime.now().replace(microsecond=0) + datetime.timedelta(days=3)
+    slot_ids = []
+    for hours in (2, 0, 1):
+        s = start + datetime.timedelta(hours=hours)
+        r = client.post("/api/doctor/add-slot", headers=doctor, json={
+            "slot_start": s.isoformat(), "slot_end": (s + datetime.timedelta(minutes=30)).isoformat()})
+        assert r.status_code == 201
+        slot_ids.append(r.get_json()["slot_id"])
+    later, earliest, middle = slot_ids
+
+    def search():
+        r = client.get(f"/api/slots/search?city={city}&specialist=Cardiologist", headers=patient)
+        assert r.status_code == 200
+        return [hit["slot_id"] for hit in r.get_json()]
+
+    assert search() == [earliest, middle, later]
+    assert client.post("/api/appointments", headers=patient, json={"slot_id": earliest}).status_code == 201
+    assert search() == [middle, later]
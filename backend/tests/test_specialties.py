@@ -0,0 +1,44 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from specialties import specialty_id
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Cardiologist", "cardiology"),
+    ("ENT Specialist", "ent"),
+    ("see an ENT for ear pain", "ent"),
+    ("Orthopedic surgeon", "orthopedics"),
+    ("General", "general_physician"),
+    # typos
+    ("cardiolgist", "cardiology"),
+    ("dermatolgist", "dermatology"),
+    ("opthalmologist", "ophthalmology"),
+    ("gynacologist", "gynecology"),
+    ("pediatrican", "pediatrics"),
+    ("Gastroentrologist", "gastroenterology"),
+])
+def test_maps_aliases_and_typos(text, expected):
+    assert specialty_id(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    # unrelated specialties sharing the "-ologist" ending
+    "Rheumatologist",
+    "Hematologist",
+    "Radiologist",
+    "Pathologist",
+    "Immunologist",
+    "Anesthesiologist",
+    # "general" only counts on its own
+    "General Surgeon",
+    "Plastic Surgeon",
+    "",
+    None,
+])
+def test_leaves_unrelated_text_unmapped(text):
+    assert specialty_id(text) is None
@@ -0,0 +1,115 @@
+import io
+import os
+import json
+import gzip
+
+import pytest
+
+IMAGE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "prescription.jpg")
+
+
+@pytest.fixture(scope="module")
+def image():
+    with open(IMAGE_PATH, "rb") as f:
+        return f.read()
+
+
+@pytest.fixture
+def patient(make_user):
+    return make_user("patient")[1]
+
+
+def upload(client, headers, image, n, url="/api/upload-multiple", **kwargs):
+    return client.post(url, headers=headers, content_type="multipart/form-data", data={
+        "files": [(io.BytesIO(image), f"page{i}.jpg") for i in range(n)],
+        "consent_cloud_ocr": "true",
+    }, **kwargs)
+
+
+def lines(data):
+    return [json.loads(line) for line in data.decode().splitlines()]
+
+
+def test_buffered_response_lists_upload_ids(client, patient, image):
+    r = upload(client, patient, image, 2)
+    assert r.status_code == 201
+    assert r.mimetype == "application/json"
+    assert len(r.get_json()["uploads"]) == 2
+
+
+@pytest.mark.parametrize("url, headers", [
+    ("/api/upload-multiple?stream=1", {}),
+    ("/api/upload-multiple", {"Accept": "application/x-ndjson"}),
+])
+def test_streams_one_line_per_file_then_done(client, patient, image, url, headers):
+    r = upload(client, {**patient, **headers}, image, 3, url=url)
+    assert r.status_code == 201
+    assert r.mimetype == "application/x-ndjson"
+    assert r.headers["X-Accel-Buffering"] == "no"
+    *results, done = lines(r.data)
+    assert [x["filename"] for x in results] == ["page0.jpg", "page1.jpg", "page2.jpg"]
+    assert {x["status"] for x in results} == {"processed"}
+    assert all(x["summary"]["medicines"] for x in results)
+    assert done == {"done": True, "uploads": [x["upload_id"] for x in results]}
+
+
+def test_each_result_is_committed_before_it_is_sent(app, client, patient, image):
+    from app import db, Upload
+
+    r = upload(client, patient, image, 2, url="/api/upload-multiple?stream=1", buffered=False)
+    chunks = iter(r.response)
+    first = json.loads(next(chunks))
+    with app.app_context():
+        assert db.session.get(Upload, first["upload_id"]) is not None
+    rest = b"".join(c if isinstance(c, bytes) else c.encode() for c in chunks)
+    r.close()
+    assert lines(rest)[-1]["uploads"][0] == first["upload_id"]
+
+
+def test_failed_analysis_is_reported_and_the_file_kept(client, patient, image, monkeypatch):
+    import app as app_module
+
+    real = app_module.run_gemini_pipeline
+    calls = []
+
+    def flaky(path):
+        calls.append(path)
+        if len(calls) == 2:
+            raise RuntimeError("model said no")
+        return real(path)
+    monkeypatch.setattr(app_module, "run_gemini_pipeline", flaky)
+
+    *results, done = lines(upload(client, patient, image, 3, url="/api/upload-multiple?stream=1").data)
+    assert [x["status"] for x in results] == ["processed", "failed", "processed"]
+    assert "summary" not in results[1]
+    assert len(done["uploads"]) == 3
+
+
+def test_error_mid_stream_ends_with_what_was_saved(client, patient, image, monkeypatch):
+    import app as app_module
+
+    real = app_module.record_upload
+    calls = []
+
+    def broken(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 2:
+            raise RuntimeError("disk full")
+        return real(*args, **kwargs)
+    monkeypatch.setattr(app_module, "record_upload", broken)
+
+    first, error, done = lines(upload(client, patient, image, 3, url="/api/upload-multiple?stream=1").data)
+    assert first["status"] == "processed"
+    assert error == {"status": "error", "error": "disk full"}
+    assert done == {"done": True, "uploads": [first["upload_id"]]}
+
+
+def test_stream_is_compressed_when_asked(client, patient, image):
+    r = upload(client, {**patient, "Accept-Encoding": "gzip"}, image, 2, url="/api/upload-multiple?stream=1")
+    assert r.headers["Content-Encoding"] == "gzip"
+    assert lines(gzip.decompress(r.data))[-1]["done"] is True
+
+
+def test_no_files(client, patient):
+    r = client.post("/api/upload-multiple", headers=patient, content_type="multipart/form-data", data={})
+    assert r.status_code == 400